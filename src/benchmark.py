@@ -0,0 +1,131 @@
+"""
+排课性能基准脚本
+
+用法:
+    python benchmark.py memory [版本数]
+    python benchmark.py rules [检查次数]
+"""
+import sys
+import random
+import time
+import tracemalloc
+import logging
+from typing import Callable, List, Tuple
+
+from models import ScheduleEntry, CompactEntryStore
+from rules import (
+    RuleManager, Rule, RuleResult, RuleType, RulePriority, Schedule as RuleSchedule
+)
+from scheduler import SmartScheduler
+from sample_data import create_test_data
+
+logging.disable(logging.INFO)
+
+
+def _measure(build: Callable[[], object]) -> Tuple[object, int]:
+    """返回构建结果及其净分配字节数"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def bench_entry_memory(versions: int = 200) -> None:
+    """对比 dataclass 条目列表与紧凑列式存储保存多个课表版本的内存占用"""
+    classes, teachers, config = create_test_data()
+    random.seed(0)
+    schedule, _ = SmartScheduler(config, RuleManager()).generate_schedule(classes, teachers)
+    grid = config.slot_grid
+    lessons = len(schedule.entries) * versions
+
+    def build_dataclass_versions() -> List[List[ScheduleEntry]]:
+        return [
+            [ScheduleEntry(class_info=e.class_info, subject=e.subject,
+                           teacher=e.teacher, time_slot=e.time_slot)
+             for e in schedule.entries]
+            for _ in range(versions)
+        ]
+
+    def build_compact_versions() -> List[CompactEntryStore]:
+        first = CompactEntryStore.from_schedule(schedule, grid)
+        return [first] + [
+            CompactEntryStore.from_schedule(schedule, grid, shared_with=first)
+            for _ in range(versions - 1)
+        ]
+
+    _, dataclass_bytes = _measure(build_dataclass_versions)
+    stores, compact_bytes = _measure(build_compact_versions)
+    assert [(v.class_info.id, v.time_slot) for v in stores[-1]] == \
+           [(e.class_info.id, e.time_slot) for e in schedule.entries]
+
+    print(f"课表版本数: {versions}，总课时条目: {lessons}")
+    print(f"dataclass 列表: {dataclass_bytes / 1024:.1f} KiB "
+          f"({dataclass_bytes / lessons:.1f} 字节/节)")
+    print(f"紧凑列式存储:   {compact_bytes / 1024:.1f} KiB "
+          f"({compact_bytes / lessons:.1f} 字节/节)")
+    print(f"节省: {dataclass_bytes / max(compact_bytes, 1):.1f} 倍")
+
+
+class _PassRule(Rule):
+    """总是通过的规则，用于测量规则流水线本身的固定开销"""
+    def __init__(self, index: int, rule_type: RuleType, priority: RulePriority):
+        super().__init__(f"空规则{index}", rule_type, priority)
+
+    def check(self, schedule, entry) -> RuleResult:
+        return RuleResult(True)
+
+
+def _legacy_check_all_rules(manager: RuleManager, schedule, entry):
+    """编译流水线之前的实现：每次调用都重新排序并跳过禁用规则"""
+    errors = []
+    for rule_type in RuleType:
+        for rule in sorted(manager.rules[rule_type], key=lambda r: r.priority.value):
+            if not rule.enabled:
+                continue
+            result = rule.check(schedule, entry)
+            if not result.passed:
+                errors.append(f"[{rule.name}] {result.message}")
+                if rule.priority == RulePriority.MANDATORY:
+                    return False, errors
+    return len(errors) == 0, errors
+
+
+def bench_rule_overhead(checks: int = 200000) -> None:
+    """测量每次 check_all_rules 的固定开销（不含缓存、不含实际规则计算）"""
+    classes, teachers, config = create_test_data(selected_classes=[1])
+    manager = RuleManager(cache_size=0)
+    for i, (rule_type, priority) in enumerate(
+            (t, p) for t in RuleType for p in RulePriority):
+        rule = _PassRule(i, rule_type, priority)
+        manager.add_rule(rule)
+        rule.enabled = i % 4 != 3  # 部分规则禁用
+    schedule = RuleSchedule()
+    entry = ScheduleEntry(class_info=classes[0], subject=classes[0].subjects[0],
+                          teacher=teachers[0], time_slot=config.slot_grid.slots[0])
+
+    def timed(check) -> float:
+        start = time.perf_counter()
+        for _ in range(checks):
+            check(manager, schedule, entry)
+        return (time.perf_counter() - start) / checks * 1e9
+
+    legacy_ns = timed(_legacy_check_all_rules)
+    compiled_ns = timed(RuleManager.check_all_rules)
+    print(f"规则数: {len(manager.get_active_rules())} 启用 / "
+          f"{sum(len(r) for r in manager.rules.values())} 总计，检查次数: {checks}")
+    print(f"逐次排序: {legacy_ns:.0f} ns/次")
+    print(f"编译流水线: {compiled_ns:.0f} ns/次")
+    print(f"提升: {legacy_ns / compiled_ns:.1f} 倍")
+
+
+BENCHMARKS = {
+    "memory": bench_entry_memory,
+    "rules": bench_rule_overhead,
+}
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else "memory"
+    args = [int(arg) for arg in sys.argv[2:]]
+    BENCHMARKS[name](*args)
@@ -0,0 +1,357 @@
+from typing import List, Dict, Set, Optional, Tuple
+import random
+import threading
+import time
+import logging
+from models import (
+    Subject, Teacher, Class, Schedule, ScheduleEntry, ScheduleConfig
+)
+from rules import RuleManager
+
+logger = logging.getLogger(__name__)
+
+class _LessonGroup:
+    """
+    同一班级同一科目的一组同质变量。
+    普通科目每个变量是一节课；连堂科目每个变量是一个连堂块（相邻两节、同一教师），
+    课时为奇数时多出的一节另成一组，两组共用每天的课时计数。
+    """
+    __slots__ = ('class_index', 'class_', 'subject', 'size', 'cap', 'remaining', 'last_slot',
+                 'domain', 'slot_count', 'day_slot_count', 'day_used')
+
+    def __init__(self, class_index: int, class_: Class, subject: Subject, size: int, count: int,
+                 cap: int, day_used: List[int], slots: int):
+        self.class_index = class_index
+        self.class_ = class_
+        self.subject = subject
+        self.size = size  # 每个变量占用的节数：1 为单节，2 为连堂块
+        self.cap = cap  # 该科目每天最多几节
+        self.remaining = count  # 尚未赋值的变量个数
+        self.last_slot = -1  # 同组变量按时间段递增赋值，消除组内对称性
+        self.domain: Set[int] = set()  # 取值编码为 首节 slot_id * 教师数 + 教师下标
+        self.slot_count = [0] * slots  # 每个时间段剩余的取值个数
+        self.day_slot_count = [0] * len(day_used)  # 每天仍有取值的时间段个数
+        self.day_used = day_used  # 每天已安排的课时（同一科目的各组共用）
+
+class CSPScheduler:
+    """
+    回溯搜索排课引擎。
+    每个 (班级, 科目) 的课时是一组变量，取值域为 时间段 × 教师；
+    连堂科目的变量是连堂块，取值域为 slot_grid.consecutive_pairs 的首节 × 教师，两节由同一教师上。
+    按最少剩余取值（MRV）选择变量，赋值后做前向检查，
+    并在节点数或时间预算用尽时返回已找到的最好部分课表。
+    """
+    def __init__(self, config: ScheduleConfig, rule_manager: RuleManager,
+                 node_limit: int = 200000, time_limit: float = 10.0,
+                 seed: Optional[int] = None, cancel: Optional[threading.Event] = None):
+        """
+        :param node_limit: 最多尝试的赋值次数
+        :param time_limit: 最长搜索时间（秒）
+        :param seed: 取值顺序的随机种子
+        :param cancel: 被 set 后视为预算用尽，返回已找到的最好部分课表
+        """
+        self.config = config
+        self.rule_manager = rule_manager
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.cancel = cancel
+        self.random = random.Random(seed)
+        self.schedule = Schedule()
+        self.nodes = 0
+        self.truncated = False  # 最近一次搜索是否因预算用尽只返回了部分课表
+
+    def generate_schedule(self, grade_classes: List[Class],
+                          teachers: List[Teacher]) -> Tuple[Schedule, List[str]]:
+        """搜索完整课表；预算用尽时返回赋值最多的部分课表"""
+        self._init_search(grade_classes, teachers)
+        solved = self._search()
+        self.truncated = not solved and self.budget_exhausted
+        if not solved:
+            self.schedule = Schedule()
+            for entry in self.best_entries:
+                self.schedule.add_entry(entry)
+
+        errors = []
+        if self.truncated:
+            errors.append(f"搜索在 {self.nodes} 个节点后达到预算上限，返回部分课表")
+        placed: Dict[Tuple[str, str], int] = {}
+        for entry in self.schedule.entries:
+            key = (entry.class_info.id, entry.subject.name)
+            placed[key] = placed.get(key, 0) + 1
+        for group in self.groups:
+            if group.size == 1 and group.subject.requires_consecutive_periods and group.subject.weekly_hours > 1:
+                continue  # 连堂科目的奇数余课与连堂块一起统计
+            missing = group.subject.weekly_hours - placed.get((group.class_.id, group.subject.name), 0)
+            if missing > 0:
+                errors.append(f"无法为 {group.class_.name} 安排 {group.subject.name} 的 {missing} 节课")
+        return self.schedule, errors
+
+    # ========== 初始化 ==========
+    def _init_search(self, classes: List[Class], teachers: List[Teacher]):
+        grid = self.config.slot_grid
+        self.grid = grid
+        self.teachers = list(teachers)
+        self.n_teachers = len(self.teachers)
+        self.teacher_positions = {id(t): i for i, t in enumerate(self.teachers)}
+        self.n_days = len(grid.weekdays)
+        self.periods = grid.periods_per_day
+        self.pair_prev = {second: first for first, second in grid.consecutive_pairs}
+        self.schedule = Schedule()
+        self.nodes = 0
+        self.budget_exhausted = False
+        self.deadline = time.monotonic() + self.time_limit
+
+        self.teacher_day_load = [[0] * self.n_days for _ in self.teachers]
+        self.teacher_week_load = [0] * self.n_teachers
+        self.teachers_for_subject: Dict[str, List[int]] = {}
+        for ti, teacher in enumerate(self.teachers):
+            for subject_name in teacher.subjects:
+                self.teachers_for_subject.setdefault(subject_name, []).append(ti)
+
+        self.groups: List[_LessonGroup] = []
+        self.groups_by_class: List[List[_LessonGroup]] = []
+        self.groups_by_teacher: List[List[_LessonGroup]] = [[] for _ in self.teachers]
+        for ci, class_ in enumerate(classes):
+            class_groups = []
+            for subject in class_.subjects:
+                if subject.weekly_hours <= 0:
+                    continue
+                if subject.requires_consecutive_periods and subject.weekly_hours >= 2:
+                    units = [(2, subject.weekly_hours // 2)] + ([(1, 1)] if subject.weekly_hours % 2 else [])
+                    cap = subject.block_day_limit()
+                else:
+                    units = [(1, subject.weekly_hours)]
+                    cap = subject.max_periods_per_day
+                day_used = [0] * self.n_days
+                for size, count in units:
+                    group = _LessonGroup(ci, class_, subject, size, count, cap, day_used, len(grid))
+                    starts = grid.pair_next if size == 2 else range(len(grid))
+                    for ti in self.teachers_for_subject.get(subject.name, []):
+                        available = self.teachers[ti].availability_mask(grid)
+                        for slot_id in starts:
+                            if all(available >> s & 1 for s in self._unit_slots(group, slot_id)):
+                                self._restore(group, slot_id * self.n_teachers + ti)
+                        self.groups_by_teacher[ti].append(group)
+                    class_groups.append(group)
+                    self.groups.append(group)
+            self.groups_by_class.append(class_groups)
+
+        # 最好的部分课表只在从最深处回溯或返回时复制，下降过程中只记录深度
+        self.best_entries: List[ScheduleEntry] = []
+        self.best_size = 0
+        self.best_pending = False
+
+    def _unit_slots(self, group: _LessonGroup, start: int) -> Tuple[int, ...]:
+        """以 start 为首节的一个变量占用的时间段"""
+        if group.size == 1:
+            return (start,)
+        return (start, self.grid.pair_next[start])
+
+    def _starts_covering(self, group: _LessonGroup, slot_id: int) -> Tuple[int, ...]:
+        """该组中会占用 slot_id 的取值首节"""
+        if group.size == 1:
+            return (slot_id,)
+        pair_next = self.grid.pair_next
+        previous = self.pair_prev.get(slot_id)
+        return tuple(s for s in (slot_id, previous) if s is not None and s in pair_next)
+
+    # ========== 取值域维护 ==========
+    def _remove(self, group: _LessonGroup, value: int, trail: List):
+        group.domain.discard(value)
+        slot_id = value // self.n_teachers
+        group.slot_count[slot_id] -= 1
+        if group.slot_count[slot_id] == 0:
+            group.day_slot_count[slot_id // self.periods] -= 1
+        trail.append((group, value))
+
+    def _restore(self, group: _LessonGroup, value: int):
+        group.domain.add(value)
+        slot_id = value // self.n_teachers
+        if group.slot_count[slot_id] == 0:
+            group.day_slot_count[slot_id // self.periods] += 1
+        group.slot_count[slot_id] += 1
+
+    def _capacity(self, group: _LessonGroup) -> int:
+        """该组在剩余取值域内最多还能安排的变量个数（考虑每日上限）"""
+        return sum(
+            min(group.day_slot_count[day], (group.cap - group.day_used[day]) // group.size)
+            for day in range(self.n_days)
+        )
+
+    # ========== 搜索 ==========
+    def _select_group(self) -> Optional[_LessonGroup]:
+        """MRV：选择剩余可用时间段相对所需课时最紧的一组"""
+        best, best_key = None, None
+        for group in self.groups:
+            if group.remaining <= 0:
+                continue
+            key = (self._capacity(group) - group.remaining, -group.remaining)
+            if best_key is None or key < best_key:
+                best, best_key = group, key
+        return best
+
+    def _order_values(self, group: _LessonGroup) -> List[int]:
+        """取值排序：当天该科目少的优先，其次教师周课时少的优先"""
+        values = list(group.domain)
+        self.random.shuffle(values)
+        n_teachers = self.n_teachers
+        values.sort(key=lambda v: (
+            group.day_used[v // n_teachers // self.periods],
+            self.teacher_week_load[v % n_teachers],
+            v // n_teachers
+        ))
+        return values
+
+    def _assign(self, group: _LessonGroup, value: int, trail: List) -> Optional[List[ScheduleEntry]]:
+        """赋值并前向检查，返回加入课表的条目（连堂块为两条）；失败时撤销并返回 None"""
+        start, ti = divmod(value, self.n_teachers)
+        teacher = self.teachers[ti]
+        slot_ids = self._unit_slots(group, start)
+        day = start // self.periods
+        size = group.size
+        if (self.teacher_day_load[ti][day] + size > teacher.max_hours_per_day or
+                self.teacher_week_load[ti] + size > teacher.max_hours_per_week):
+            return None
+        entries: List[ScheduleEntry] = []
+        for slot_id in slot_ids:
+            entry = ScheduleEntry(class_info=group.class_, subject=group.subject,
+                                  teacher=teacher, time_slot=self.grid.slots[slot_id])
+            if not (self.rule_manager.check_all_rules(self.schedule, entry)[0] and
+                    self.schedule.add_entry(entry)):
+                self._remove_entries(entries)
+                return None
+            self.rule_manager.notify_entry_added(self.schedule, entry)
+            entries.append(entry)
+
+        mark = len(trail)
+        trail.append((group, group.last_slot))  # 记录组状态以便撤销
+        group.remaining -= 1
+        group.day_used[day] += size
+        group.last_slot = start
+        self.teacher_day_load[ti][day] += size
+        self.teacher_week_load[ti] += size
+
+        touched = {group}
+        n_teachers = self.n_teachers
+        # 同班级其他变量不能再用这些时间段；同科目的各组共用每日上限
+        for other in self.groups_by_class[group.class_index]:
+            if other.remaining <= 0:
+                continue
+            for slot_id in slot_ids:
+                for s in self._starts_covering(other, slot_id):
+                    if other.slot_count[s]:
+                        for tj in self.teachers_for_subject.get(other.subject.name, ()):
+                            if s * n_teachers + tj in other.domain:
+                                self._remove(other, s * n_teachers + tj, trail)
+                        touched.add(other)
+            if other.subject is group.subject:
+                if other.day_used[day] + other.size > other.cap:
+                    for v in [v for v in other.domain if v // n_teachers // self.periods == day]:
+                        self._remove(other, v, trail)
+                touched.add(other)
+        # 该教师在这些时间段不能再上其他课
+        for other in self.groups_by_teacher[ti]:
+            if other.remaining <= 0:
+                continue
+            for slot_id in slot_ids:
+                for s in self._starts_covering(other, slot_id):
+                    if s * n_teachers + ti in other.domain:
+                        self._remove(other, s * n_teachers + ti, trail)
+                        touched.add(other)
+        # 组内按时间段递增赋值
+        for v in [v for v in group.domain if v // n_teachers <= start]:
+            self._remove(group, v, trail)
+        # 教师剩余的每日/每周课时放不下一个变量时，删除相应取值
+        day_left = teacher.max_hours_per_day - self.teacher_day_load[ti][day]
+        week_left = teacher.max_hours_per_week - self.teacher_week_load[ti]
+        for other in self.groups_by_teacher[ti]:
+            if other.remaining <= 0 or (other.size <= day_left and other.size <= week_left):
+                continue
+            week_cap = other.size > week_left
+            for v in [v for v in other.domain if v % n_teachers == ti and
+                      (week_cap or v // n_teachers // self.periods == day)]:
+                self._remove(other, v, trail)
+            touched.add(other)
+
+        if all(other.remaining <= 0 or self._capacity(other) >= other.remaining for other in touched):
+            return entries
+        self._unassign(group, entries, trail, mark)
+        return None
+
+    def _unassign(self, group: _LessonGroup, entries: List[ScheduleEntry], trail: List, mark: int):
+        """撤销一次赋值及其前向检查删除的取值"""
+        while len(trail) > mark + 1:
+            other, value = trail.pop()
+            self._restore(other, value)
+        _, last_slot = trail.pop()
+        ti = self.teacher_positions[id(entries[0].teacher)]
+        day = entries[0].time_slot.slot_id // self.periods
+        group.remaining += 1
+        group.day_used[day] -= group.size
+        group.last_slot = last_slot
+        self.teacher_day_load[ti][day] -= group.size
+        self.teacher_week_load[ti] -= group.size
+        self._remove_entries(entries)
+
+    def _remove_entries(self, entries: List[ScheduleEntry]):
+        for entry in reversed(entries):
+            self.schedule.remove_entry(entry)
+            self.rule_manager.notify_entry_removed(self.schedule, entry)
+
+    def _save_best(self):
+        """当前课表是目前最深的部分解时复制一份"""
+        if self.best_pending:
+            self.best_entries = list(self.schedule.entries)
+            self.best_pending = False
+
+    def _search(self) -> bool:
+        """迭代式深度优先回溯，返回是否找到完整课表"""
+        trail: List = []
+        # 栈帧: [组, 候选取值, 下一个取值下标, 当前赋值的条目, 赋值前的 trail 长度]
+        stack: List[list] = []
+        group = self._select_group()
+        if group is None:
+            return True
+        stack.append([group, self._order_values(group), 0, None, 0])
+        while stack:
+            frame = stack[-1]
+            group, values, position, entry, mark = frame
+            if entry is not None:
+                self._save_best()
+                self._unassign(group, entry, trail, mark)
+                frame[3] = None
+            if self._out_of_budget():
+                self._save_best()
+                return False
+            placed = None
+            while position < len(values):
+                value = values[position]
+                position += 1
+                if value not in group.domain:
+                    continue
+                self.nodes += 1
+                mark = len(trail)
+                placed = self._assign(group, value, trail)
+                if placed is not None:
+                    break
+            frame[2] = position
+            if placed is None:
+                stack.pop()
+                continue
+            frame[3], frame[4] = placed, mark
+            if len(self.schedule.entries) > self.best_size:
+                self.best_size = len(self.schedule.entries)
+                self.best_pending = True
+            next_group = self._select_group()
+            if next_group is None:
+                return True
+            stack.append([next_group, self._order_values(next_group), 0, None, 0])
+        return False
+
+    def _out_of_budget(self) -> bool:
+        if self.nodes >= self.node_limit or time.monotonic() >= self.deadline:
+            self.budget_exhausted = True
+        elif self.cancel is not None and self.nodes & 0xFF == 0 and self.cancel.is_set():
+            # 取消标志可能是跨进程的代理对象，每 256 个节点查询一次
+            self.budget_exhausted = True
+        return self.budget_exhausted
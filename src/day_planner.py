@@ -0,0 +1,125 @@
+from typing import List, Dict, Optional, Tuple
+from collections import deque
+import time
+from models import Subject, Class, ScheduleConfig
+
+DayQuotas = Dict[Tuple[str, str], List[int]]  # (class_id, subject_name) -> 每天的课时配额
+
+def _day_cap(subject: Subject) -> int:
+    if subject.requires_consecutive_periods:
+        return subject.block_day_limit()
+    return subject.max_periods_per_day
+
+def _units(subject: Subject) -> List[int]:
+    """科目课时拆成的排课单位：连堂科目两节一组，剩余奇数课时为单节"""
+    if subject.requires_consecutive_periods:
+        blocks = subject.weekly_hours // 2
+        return [2] * blocks + [1] * (subject.weekly_hours - 2 * blocks)
+    return [1] * subject.weekly_hours
+
+class _ClassPlan:
+    """一个班级的 科目 × 天 配额表"""
+    def __init__(self, class_: Class, n_days: int, periods_per_day: int):
+        self.class_ = class_
+        self.n_days = n_days
+        self.periods = periods_per_day
+        self.load = [0] * n_days
+        self.quota: Dict[str, List[int]] = {s.name: [0] * n_days for s in class_.subjects}
+        self.caps = {s.name: _day_cap(s) for s in class_.subjects}
+
+    def fits(self, name: str, day: int, size: int) -> bool:
+        return self.quota[name][day] + size <= self.caps[name]
+
+    def add(self, name: str, day: int, size: int):
+        self.quota[name][day] += size
+        self.load[day] += size
+
+    def place(self, subject: Subject, size: int) -> bool:
+        """均匀填充：优先该科目课时少的天，其次总课时少的天"""
+        days = sorted(
+            (d for d in range(self.n_days) if self.fits(subject.name, d, size)),
+            key=lambda d: (self.quota[subject.name][d], self.load[d], d))
+        for day in days:
+            if self.load[day] + size <= self.periods:
+                self.add(subject.name, day, size)
+                return True
+        # 可放的天都已排满：把其他科目的单节课挪走腾出空位
+        day = self._make_room(days, size)
+        if day is None:
+            return False
+        self.add(subject.name, day, size)
+        return True
+
+    def _make_room(self, start: List[int], size: int) -> Optional[int]:
+        """
+        在 start 中依次尝试，直到某天能再放下 size 节：每次沿增广路从该天挪走一节。
+        返回腾出空位的天；都做不到时返回 None（已做的挪动仍满足每日上限，无需撤销）。
+        """
+        for day in start:
+            while self.load[day] + size > self.periods:
+                if not self._augment(day):
+                    break
+            else:
+                return day
+        return None
+
+    def _augment(self, start: int) -> bool:
+        """
+        沿增广路从 start 腾出一节：把一节单节课挪到另一天，依次类推，
+        直到到达有空余的天（即配额流网络上的增广路）。找不到时返回 False。
+        """
+        previous: Dict[int, Optional[Tuple[int, str]]] = {start: None}
+        queue = deque([start])
+        while queue:
+            day = queue.popleft()
+            if day != start and self.load[day] < self.periods:
+                # 沿路径回溯：每一步把科目 moved 从 from_day 挪到 day
+                while previous[day] is not None:
+                    from_day, moved = previous[day]
+                    self.quota[moved][from_day] -= 1
+                    self.quota[moved][day] += 1
+                    self.load[from_day] -= 1
+                    self.load[day] += 1
+                    day = from_day
+                return True
+            for other in self.class_.subjects:
+                if other.requires_consecutive_periods or not self.quota[other.name][day]:
+                    continue
+                for target in range(self.n_days):
+                    if target not in previous and self.fits(other.name, target, 1):
+                        previous[target] = (day, other.name)
+                        queue.append(target)
+        return False
+
+def plan_day_quotas(config: ScheduleConfig, grade_classes: List[Class],
+                    deadline: Optional[float] = None) -> Tuple[DayQuotas, List[str]]:
+    """
+    排课第一阶段：把每个班级各科目的周课时分配到各天，
+    满足科目每日上限和每天节数，并尽量均匀。
+    返回配额表以及无法分配的课时说明。
+    :param deadline: time.monotonic() 截止时间；到达时停止规划，之后的班级没有配额
+    """
+    grid = config.slot_grid
+    quotas: DayQuotas = {}
+    errors = []
+    for class_ in grade_classes:
+        plan = _ClassPlan(class_, len(grid.weekdays), grid.periods_per_day)
+        # 约束最紧的科目先分配：连堂块、再按 周课时 / (每日上限 × 天数) 从大到小
+        subjects = sorted(class_.subjects, key=lambda s: (
+            not s.requires_consecutive_periods,
+            -s.weekly_hours / max(_day_cap(s) * plan.n_days, 1),
+            s.name
+        ))
+        for subject in subjects:
+            if deadline is not None and time.monotonic() >= deadline:
+                errors.append(f"配额规划达到时间预算，在 {class_.name} 处停止")
+                return quotas, errors
+            missing = 0
+            for size in _units(subject):
+                if not plan.place(subject, size):
+                    missing += size
+            if missing:
+                errors.append(f"{class_.name} 的 {subject.name} 有 {missing} 节课无法分配到各天")
+        for subject in class_.subjects:
+            quotas[(class_.id, subject.name)] = plan.quota[subject.name]
+    return quotas, errors
@@ -0,0 +1,57 @@
+from typing import List, Dict
+from dataclasses import dataclass, field
+from models import Teacher, Class
+
+@dataclass
+class Component:
+    """互不共享教师的一组班级及能为它们授课的教师，可独立求解"""
+    classes: List[Class] = field(default_factory=list)
+    teachers: List[Teacher] = field(default_factory=list)
+
+class _DisjointSet:
+    """并查集（按大小合并 + 路径减半）"""
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+def split_components(grade_classes: List[Class], teachers: List[Teacher]) -> List[Component]:
+    """
+    按 班级-教师 共享关系把排课问题拆成连通分量。
+    教师能教某班级的任一科目即与该班级相连；不同分量之间没有共同教师，
+    分别排课后直接合并不会产生教师冲突。没有班级的分量（闲置教师）被丢弃。
+    """
+    n_classes = len(grade_classes)
+    sets = _DisjointSet(n_classes + len(teachers))
+    classes_by_subject: Dict[str, List[int]] = {}
+    for ci, class_ in enumerate(grade_classes):
+        for subject in class_.subjects:
+            classes_by_subject.setdefault(subject.name, []).append(ci)
+    for ti, teacher in enumerate(teachers):
+        for subject_name in teacher.subjects:
+            for ci in classes_by_subject.get(subject_name, ()):
+                sets.union(ci, n_classes + ti)
+
+    components: Dict[int, Component] = {}
+    for ci, class_ in enumerate(grade_classes):
+        components.setdefault(sets.find(ci), Component()).classes.append(class_)
+    for ti, teacher in enumerate(teachers):
+        component = components.get(sets.find(n_classes + ti))
+        if component is not None:
+            component.teachers.append(teacher)
+    return list(components.values())
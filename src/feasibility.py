@@ -0,0 +1,195 @@
+from typing import List, Dict
+from dataclasses import dataclass, field, asdict
+from collections import deque
+from models import Teacher, Class, ScheduleConfig
+
+@dataclass
+class FeasibilityIssue:
+    """一条必然导致排课失败的原因"""
+    code: str  # 原因类别，见 check_feasibility
+    message: str
+    details: Dict = field(default_factory=dict)
+
+@dataclass
+class FeasibilityReport:
+    issues: List[FeasibilityIssue] = field(default_factory=list)
+
+    @property
+    def feasible(self) -> bool:
+        return not self.issues
+
+    def messages(self) -> List[str]:
+        return [issue.message for issue in self.issues]
+
+    def to_dict(self) -> List[Dict]:
+        return [asdict(issue) for issue in self.issues]
+
+def _popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+def _teacher_capacity(teacher: Teacher, mask: int, day_masks: List[int]) -> int:
+    """教师一周最多能上的课时：受可用时间、每日上限和每周上限共同限制"""
+    by_day = sum(min(teacher.max_hours_per_day, _popcount(mask & day)) for day in day_masks)
+    return min(teacher.max_hours_per_week, by_day)
+
+def _max_flow(capacity: Dict[int, Dict[int, int]], source: int, sink: int) -> int:
+    """Edmonds–Karp 最大流（图规模为 科目数 + 教师数，足够小）"""
+    flow = 0
+    while True:
+        parent = {source: None}
+        queue = deque([source])
+        while queue and sink not in parent:
+            u = queue.popleft()
+            for v, c in capacity[u].items():
+                if c > 0 and v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        if sink not in parent:
+            return flow
+        bottleneck, v = None, sink
+        while parent[v] is not None:
+            c = capacity[parent[v]][v]
+            bottleneck = c if bottleneck is None else min(bottleneck, c)
+            v = parent[v]
+        v = sink
+        while parent[v] is not None:
+            u = parent[v]
+            capacity[u][v] -= bottleneck
+            capacity[v][u] = capacity[v].get(u, 0) + bottleneck
+            v = u
+        flow += bottleneck
+
+def check_feasibility(config: ScheduleConfig, grade_classes: List[Class],
+                      teachers: List[Teacher]) -> FeasibilityReport:
+    """
+    求解前的容量与计数检查，只报告必然无解的情况（必要条件，不保证有解）：
+    class_overloaded       班级周课时之和超过每周时间段数
+    subject_day_cap        科目周课时超过 每日上限 × 天数
+    no_teacher             没有教师能教该科目
+    teacher_capacity       科目需求超过能教该科目的教师总容量
+    teacher_pool           多个科目共享教师时的 Hall 条件（科目→教师 最大流小于总需求）
+    class_slot_window      班级有可用教师的时间段少于其周课时
+    subject_slot_window    逐时间段计数：科目需求超过各时间段可同时开课的班级数之和
+    """
+    report = FeasibilityReport()
+    grid = config.slot_grid
+    n_slots = len(grid)
+    n_days = len(grid.weekdays)
+    periods = grid.periods_per_day
+    day_masks = [((1 << periods) - 1) << (day * periods) for day in range(n_days)]
+    masks = {t.id: t.availability_mask(grid) for t in teachers}
+    teachers_by_subject: Dict[str, List[Teacher]] = {}
+    for teacher in teachers:
+        for subject_name in teacher.subjects:
+            teachers_by_subject.setdefault(subject_name, []).append(teacher)
+    subject_masks = {
+        name: _mask_union(masks[t.id] for t in pool) for name, pool in teachers_by_subject.items()
+    }
+
+    demand: Dict[str, int] = {}
+    classes_by_subject: Dict[str, List[Class]] = {}
+    for class_ in grade_classes:
+        total = sum(s.weekly_hours for s in class_.subjects)
+        if total > n_slots:
+            report.issues.append(FeasibilityIssue(
+                "class_overloaded",
+                f"{class_.name} 每周需要 {total} 节课，但每周只有 {n_slots} 个时间段",
+                {"class_id": class_.id, "required": total, "available": n_slots}))
+        usable = 0
+        for subject in class_.subjects:
+            if subject.weekly_hours <= 0:
+                continue
+            demand[subject.name] = demand.get(subject.name, 0) + subject.weekly_hours
+            classes_by_subject.setdefault(subject.name, []).append(class_)
+            usable |= subject_masks.get(subject.name, 0)
+            # 连堂科目每天至少允许一个两节的连堂块
+            day_limit = (subject.block_day_limit() if subject.requires_consecutive_periods
+                         else subject.max_periods_per_day)
+            limit = day_limit * n_days
+            if subject.weekly_hours > limit:
+                report.issues.append(FeasibilityIssue(
+                    "subject_day_cap",
+                    f"{class_.name} 的 {subject.name} 每周 {subject.weekly_hours} 节，"
+                    f"超过每日上限 {day_limit} × {n_days} 天",
+                    {"class_id": class_.id, "subject": subject.name,
+                     "required": subject.weekly_hours, "available": limit}))
+        if total <= n_slots and _popcount(usable) < total:
+            report.issues.append(FeasibilityIssue(
+                "class_slot_window",
+                f"{class_.name} 只有 {_popcount(usable)} 个时间段有可用教师，少于每周 {total} 节",
+                {"class_id": class_.id, "required": total, "available": _popcount(usable)}))
+
+    capacity = {t.id: _teacher_capacity(t, masks[t.id], day_masks) for t in teachers}
+    for subject_name, required in demand.items():
+        pool = teachers_by_subject.get(subject_name, [])
+        if not pool:
+            report.issues.append(FeasibilityIssue(
+                "no_teacher", f"没有教师能教 {subject_name}",
+                {"subject": subject_name, "required": required}))
+            continue
+        available = sum(capacity[t.id] for t in pool)
+        if required > available:
+            report.issues.append(FeasibilityIssue(
+                "teacher_capacity",
+                f"{subject_name} 每周共需 {required} 节，能教该科目的教师最多只能上 {available} 节",
+                {"subject": subject_name, "required": required, "available": available}))
+            continue
+        # 每个时间段最多同时开 min(需要该科目的班级数, 该时段空闲的该科目教师数) 节
+        n_classes = len(classes_by_subject[subject_name])
+        window = sum(
+            min(n_classes, sum(1 for t in pool if masks[t.id] >> slot_id & 1))
+            for slot_id in range(n_slots)
+        )
+        if required > window:
+            report.issues.append(FeasibilityIssue(
+                "subject_slot_window",
+                f"{subject_name} 每周共需 {required} 节，按时间段计最多只能开 {window} 节",
+                {"subject": subject_name, "required": required, "available": window}))
+
+    if not report.issues:
+        shortfall = _teacher_pool_shortfall(demand, teachers_by_subject, capacity)
+        if shortfall:
+            required, available, subjects = shortfall
+            report.issues.append(FeasibilityIssue(
+                "teacher_pool",
+                f"科目 {'、'.join(subjects)} 共享教师，总需求 {required} 节，教师最多只能承担 {available} 节",
+                {"subjects": subjects, "required": required, "available": available}))
+    return report
+
+def _mask_union(masks) -> int:
+    result = 0
+    for mask in masks:
+        result |= mask
+    return result
+
+def _teacher_pool_shortfall(demand: Dict[str, int], teachers_by_subject: Dict[str, List[Teacher]],
+                            capacity: Dict[str, int]):
+    """
+    源点→科目（需求）→教师→汇点（容量）的最大流。
+    流量不足时，残量图中从源点可达的科目集合 S 即违反 Hall 条件的科目组：
+    返回 (S 的总需求, S 的所有教师的总容量, S)
+    """
+    subjects = list(demand)
+    teacher_ids = list(dict.fromkeys(t.id for name in subjects for t in teachers_by_subject.get(name, ())))
+    source, sink = 0, 1 + len(subjects) + len(teacher_ids)
+    teacher_nodes = {tid: 1 + len(subjects) + i for i, tid in enumerate(teacher_ids)}
+    graph: Dict[int, Dict[int, int]] = {node: {} for node in range(sink + 1)}
+    for si, name in enumerate(subjects):
+        graph[source][1 + si] = demand[name]
+        for teacher in teachers_by_subject.get(name, ()):
+            graph[1 + si][teacher_nodes[teacher.id]] = demand[name]
+    for tid, node in teacher_nodes.items():
+        graph[node][sink] = capacity[tid]
+    if _max_flow(graph, source, sink) >= sum(demand.values()):
+        return None
+    reachable = {source}
+    queue = deque([source])
+    while queue:
+        u = queue.popleft()
+        for v, c in graph[u].items():
+            if c > 0 and v not in reachable:
+                reachable.add(v)
+                queue.append(v)
+    group = [name for si, name in enumerate(subjects) if 1 + si in reachable]
+    group_capacity = sum(capacity[tid] for tid, node in teacher_nodes.items() if node in reachable)
+    return sum(demand[name] for name in group), group_capacity, group
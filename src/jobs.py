@@ -0,0 +1,207 @@
+from typing import Any, Callable, Dict, Optional
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from enum import Enum
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JobStatus(Enum):
+    PENDING = "pending"      # 排队等待空闲进程
+    RUNNING = "running"      # 已交给进程池
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+FINISHED = (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+class QueueFullError(Exception):
+    """排队的任务数已达上限"""
+    pass
+
+@dataclass
+class Job:
+    id: str
+    fn: Callable
+    args: tuple
+    status: JobStatus = JobStatus.PENDING
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    future: Optional[Future] = None
+    on_done: Optional[Callable[[Any], None]] = None  # 成功完成后在父进程中以结果调用
+    cancellable: bool = False  # 运行时以 cancel=共享事件 调用 fn，取消时 set 该事件
+    cancel_event: Any = None
+
+    def to_dict(self) -> Dict:
+        """状态查询接口的输出（不含结果本身）"""
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+class JobQueue:
+    """
+    后台排课任务队列：请求线程只登记任务并立即返回，求解在进程池中执行，
+    不与请求处理共享 GIL。
+    同时运行的任务数不超过 max_workers，其余任务留在本队列中排队
+    （而不是进程池的内部队列），因此排队中的任务可以随时取消。
+    运行中的任务无法强行中断子进程：cancellable 的任务会收到跨进程的取消事件并自行提前结束，
+    其他任务继续运行到结束；两者的结果都会被丢弃。
+    子进程异常退出导致进程池损坏时，受影响的任务记为失败，下一个任务使用新的进程池。
+    """
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 100,
+                 retention: float = 3600.0):
+        """
+        :param max_workers: 同时求解的进程数，默认等于 CPU 核数
+        :param max_pending: 排队任务数上限，超过时 submit 抛出 QueueFullError
+        :param retention: 已结束任务保留的秒数，过期后查询不到
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.retention = retention
+        self.jobs: Dict[str, Job] = {}
+        self._pending: deque = deque()
+        self._running = 0
+        self._lock = threading.RLock()  # 任务已结束时 add_done_callback 会在提交线程内立即回调
+        self._executor: Optional[ProcessPoolExecutor] = None  # 首次提交时才创建进程
+        self._manager = None  # 提供跨进程的取消事件，首次运行 cancellable 任务时才启动
+
+    def submit(self, fn: Callable, *args, on_done: Optional[Callable[[Any], None]] = None,
+               cancellable: bool = False) -> Job:
+        """
+        登记任务并返回；fn 及参数需可 pickle（模块级函数）。
+        :param cancellable: fn 接受 cancel 关键字参数（threading.Event 接口），运行中取消时该事件被 set
+        """
+        with self._lock:
+            self._purge()
+            if len(self._pending) >= self.max_pending:
+                raise QueueFullError(f"排队任务已达上限 {self.max_pending}")
+            job = Job(id=uuid.uuid4().hex, fn=fn, args=args, on_done=on_done, cancellable=cancellable)
+            self.jobs[job.id] = job
+            self._pending.append(job)
+            self._dispatch()
+        return job
+
+    def add_finished(self, result: Any) -> Job:
+        """登记一个已有结果的任务（如缓存命中），客户端仍按任务接口查询"""
+        with self._lock:
+            self._purge()
+            now = time.time()
+            job = Job(id=uuid.uuid4().hex, fn=None, args=(), status=JobStatus.DONE,
+                      submitted_at=now, started_at=now, finished_at=now, result=result)
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务；已结束或不存在的任务返回 False"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            if job.status == JobStatus.PENDING:
+                self._pending.remove(job)
+            elif job.cancel_event is not None:
+                job.cancel_event.set()
+            job.status = JobStatus.CANCELLED
+            job.finished_at = time.time()
+            return True
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            for job in self._pending:
+                job.status = JobStatus.CANCELLED
+                job.finished_at = time.time()
+            self._pending.clear()
+            executor, self._executor = self._executor, None
+            manager, self._manager = self._manager, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+    def _dispatch(self):
+        """有空闲进程时把排队任务交给进程池（调用方持有锁）"""
+        while self._pending and self._running < self.max_workers:
+            job = self._pending.popleft()
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            executor = self._executor
+            kwargs = {}
+            if job.cancellable:
+                if self._manager is None:
+                    self._manager = multiprocessing.Manager()
+                job.cancel_event = kwargs["cancel"] = self._manager.Event()
+            job.status = JobStatus.RUNNING
+            job.started_at = time.time()
+            try:
+                job.future = executor.submit(job.fn, *job.args, **kwargs)
+            except BrokenProcessPool as e:
+                # 进程池已损坏（子进程异常退出）：本任务记为失败，后续任务使用新的进程池
+                self._fail(job, e)
+                self._discard_executor(executor)
+                continue
+            self._running += 1
+            job.future.add_done_callback(
+                lambda future, job=job, executor=executor: self._finished(job, future, executor))
+
+    def _finished(self, job: Job, future: Future, executor: ProcessPoolExecutor):
+        with self._lock:
+            self._running -= 1
+            job.cancel_event = None
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self._discard_executor(executor)
+            if job.status == JobStatus.RUNNING:
+                job.finished_at = time.time()
+                if future.cancelled():
+                    job.status = JobStatus.CANCELLED
+                elif future.exception() is not None:
+                    self._fail(job, future.exception())
+                else:
+                    job.status = JobStatus.DONE
+                    job.result = future.result()
+                    if job.on_done is not None:
+                        try:
+                            job.on_done(job.result)
+                        except Exception as e:
+                            logger.error(f"排课任务 {job.id} 完成回调失败: {str(e)}")
+            job.future = None
+            self._dispatch()
+
+    def _fail(self, job: Job, error: BaseException):
+        """任务记为失败（调用方持有锁）"""
+        job.status = JobStatus.FAILED
+        job.finished_at = time.time()
+        job.error = str(error) or type(error).__name__
+        logger.error(f"排课任务 {job.id} 失败: {job.error}")
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """丢弃已损坏的进程池，下次分派时重新创建（调用方持有锁）"""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _purge(self):
+        """删除过期的已结束任务（调用方持有锁）"""
+        deadline = time.time() - self.retention
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.status in FINISHED and job.finished_at < deadline]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -0,0 +1,410 @@
+from typing import List, Dict, Optional, Tuple
+import math
+import random
+import threading
+import time
+import logging
+from models import (
+    Teacher, Class, Schedule, ScheduleEntry, ScheduleConfig
+)
+from rules import RuleManager
+
+logger = logging.getLogger(__name__)
+
+# 排课引擎说明某个时间段或某科目未能排入的错误前缀；修复阶段会重新统计未排课时
+PLACEMENT_ERROR_PREFIX = "无法为 "
+
+def merge_errors(engine_errors: List[str], improve_errors: List[str]) -> List[str]:
+    """
+    合并引擎与修复阶段的错误：引擎的未排入说明已被修复阶段重新统计的未排课时代替，
+    其他说明（时间预算用尽、配额规划失败等）保留在前。
+    """
+    kept = [e for e in engine_errors if not e.startswith(PLACEMENT_ERROR_PREFIX)]
+    return kept + [e for e in improve_errors if e not in kept]
+
+def max_consecutive_periods(config: ScheduleConfig) -> int:
+    """同一科目允许的最长连堂节数"""
+    if config.allow_consecutive_same_subject:
+        return config.max_consecutive_same_subject
+    return 1
+
+def consecutive_penalty(schedule: Schedule, config: ScheduleConfig) -> int:
+    """整张课表中同一科目连堂超过上限的节数（与局部搜索的软约束代价一致）"""
+    limit = max_consecutive_periods(config)
+    days: Dict[Tuple[str, object], Dict[int, str]] = {}
+    for entry in schedule.entries:
+        key = (entry.class_info.id, entry.time_slot.weekday)
+        days.setdefault(key, {})[entry.time_slot.period] = entry.subject.name
+    penalty = 0
+    for periods in days.values():
+        run, previous = 0, None
+        for period in range(1, max(periods) + 1):
+            subject_name = periods.get(period)
+            run = run + 1 if subject_name is not None and subject_name == previous else 1
+            if subject_name is not None and run > limit:
+                penalty += 1
+            previous = subject_name
+    return penalty
+
+class LocalSearchImprover:
+    """
+    贪心构造之后的局部搜索修复阶段（模拟退火）。
+    邻域包括：插入未排课时（必要时挤出原有课程）、同班级内移动课程、同班级内交换两节课。
+    目标为 未排课时数 × 权重 + 软约束违反数（同一科目连堂超过上限），
+    每一步只重新计算受影响的 (班级, 天) 的代价，不重新检查整张课表。
+    候选位置除内置的硬约束外还要通过 rule_manager 的全部规则和引擎的每日配额；
+    连堂科目的课时不参与移动和交换，未排的连堂课时成对插入相邻时间段。
+    """
+    UNSCHEDULED_WEIGHT = 10.0
+
+    def __init__(self, config: ScheduleConfig, rule_manager: Optional[RuleManager] = None,
+                 seed: Optional[int] = None, initial_temperature: float = 2.0,
+                 final_temperature: float = 0.05, patience: int = 20000):
+        """
+        :param rule_manager: 候选移动需通过其全部规则，None 表示只检查内置硬约束
+        :param patience: 连续这么多步没有找到更好的课表时提前结束
+        """
+        self.config = config
+        self.rule_manager = rule_manager
+        self.patience = patience
+        self.random = random.Random(seed)
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+        self.max_consecutive = max_consecutive_periods(config)
+        self.iterations = 0
+
+    def improve(self, schedule: Schedule, grade_classes: List[Class],
+                teachers: List[Teacher], time_limit: float,
+                day_quotas: Optional[Dict[Tuple[str, str], List[int]]] = None,
+                cancel: Optional[threading.Event] = None) -> Tuple[Schedule, List[str]]:
+        """
+        在 time_limit 秒内改进课表，返回找到的最好课表及未排课时说明。
+        :param schedule: 初始（可能不完整的）课表，不会被修改
+        :param day_quotas: 引擎的每日配额（见 day_planner），给出时每天的科目课时不超过配额
+        :param cancel: 被 set 后提前结束，返回目前最好的课表
+        """
+        self._load(schedule, grade_classes, teachers, day_quotas)
+        cost = self._total_cost()
+        best_cost, best_cells = cost, self._snapshot()
+        start = time.monotonic()
+        deadline = start + time_limit
+        temperature = self.initial_temperature
+        cooling = math.log(self.final_temperature / self.initial_temperature)
+        self.iterations = 0
+        last_improvement = 0
+
+        while self.unscheduled or best_cost > 0:
+            self.iterations += 1
+            if self.iterations - last_improvement > self.patience:
+                break
+            if self.iterations & 0x7F == 0:
+                now = time.monotonic()
+                if now >= deadline or (cancel is not None and cancel.is_set()):
+                    break
+                temperature = self.initial_temperature * math.exp(
+                    cooling * (now - start) / max(time_limit, 1e-9))
+            delta = self._random_move(temperature)
+            if delta is None:
+                continue
+            cost += delta
+            if cost < best_cost - 1e-9:
+                best_cost, best_cells = cost, self._snapshot()
+                last_improvement = self.iterations
+
+        result = self._build_schedule(best_cells)
+        logger.info(f"局部搜索完成: {self.iterations} 次迭代，代价 {best_cost:.1f}")
+        return result, self._unscheduled_errors(result)
+
+    # ========== 状态 ==========
+    def _load(self, schedule: Schedule, classes: List[Class], teachers: List[Teacher],
+              day_quotas: Optional[Dict[Tuple[str, str], List[int]]] = None):
+        grid = self.config.slot_grid
+        self.grid = grid
+        self.n_slots = len(grid)
+        self.periods = grid.periods_per_day
+        self.n_days = len(grid.weekdays)
+        self.classes = list(classes)
+        self.teachers = list(teachers)
+        class_positions = {c.id: i for i, c in enumerate(self.classes)}
+        teacher_positions = {t.id: i for i, t in enumerate(self.teachers)}
+        self.subjects = [{s.name: s for s in c.subjects} for c in self.classes]
+        self.day_limits = [{s.name: s.block_day_limit() if s.requires_consecutive_periods else s.max_periods_per_day
+                            for s in c.subjects} for c in self.classes]
+        self.quotas = None
+        if day_quotas is not None:
+            self.quotas = [{s.name: day_quotas.get((c.id, s.name)) for s in c.subjects} for c in self.classes]
+        self.teachers_for_subject: Dict[str, List[int]] = {}
+        for ti, teacher in enumerate(self.teachers):
+            for name in teacher.subjects:
+                self.teachers_for_subject.setdefault(name, []).append(ti)
+        self.available = []
+        for teacher in self.teachers:
+            mask = teacher.availability_mask(grid)
+            self.available.append([bool(mask >> i & 1) for i in range(self.n_slots)])
+
+        # cells[班级][时间段] = (科目名, 教师下标) 或 None；entries 为对应的课表条目，供规则检查
+        self.cells: List[List[Optional[Tuple[str, int]]]] = [[None] * self.n_slots for _ in self.classes]
+        self.entries: List[List[Optional[ScheduleEntry]]] = [[None] * self.n_slots for _ in self.classes]
+        self.schedule = Schedule()
+        self.teacher_busy = [bytearray(self.n_slots) for _ in self.teachers]
+        self.teacher_day = [[0] * self.n_days for _ in self.teachers]
+        self.teacher_week = [0] * len(self.teachers)
+        self.subject_day: List[Dict[Tuple[str, int], int]] = [{} for _ in self.classes]
+        placed: Dict[Tuple[int, str], int] = {}
+        for entry in schedule.entries:
+            ci = class_positions.get(entry.class_info.id)
+            ti = teacher_positions.get(entry.teacher.id)
+            slot_id = grid.id_of(entry.time_slot)
+            if ci is None or ti is None or slot_id < 0:
+                continue
+            self._place(ci, slot_id, entry.subject.name, ti)
+            key = (ci, entry.subject.name)
+            placed[key] = placed.get(key, 0) + 1
+
+        self.unscheduled: List[Tuple[int, str]] = []
+        for ci, class_ in enumerate(self.classes):
+            for subject in class_.subjects:
+                missing = subject.weekly_hours - placed.get((ci, subject.name), 0)
+                self.unscheduled.extend([(ci, subject.name)] * max(missing, 0))
+
+    def _place(self, ci: int, slot_id: int, subject_name: str, ti: int):
+        day = slot_id // self.periods
+        self.cells[ci][slot_id] = (subject_name, ti)
+        entry = self.entries[ci][slot_id] = self._entry(ci, slot_id, subject_name, ti)
+        self.schedule.add_entry(entry)
+        if self.rule_manager is not None:
+            self.rule_manager.notify_entry_added(self.schedule, entry)
+        self.teacher_busy[ti][slot_id] = 1
+        self.teacher_day[ti][day] += 1
+        self.teacher_week[ti] += 1
+        key = (subject_name, day)
+        self.subject_day[ci][key] = self.subject_day[ci].get(key, 0) + 1
+
+    def _unplace(self, ci: int, slot_id: int) -> Tuple[str, int]:
+        subject_name, ti = self.cells[ci][slot_id]
+        day = slot_id // self.periods
+        self.cells[ci][slot_id] = None
+        entry, self.entries[ci][slot_id] = self.entries[ci][slot_id], None
+        self.schedule.remove_entry(entry)
+        if self.rule_manager is not None:
+            self.rule_manager.notify_entry_removed(self.schedule, entry)
+        self.teacher_busy[ti][slot_id] = 0
+        self.teacher_day[ti][day] -= 1
+        self.teacher_week[ti] -= 1
+        self.subject_day[ci][(subject_name, day)] -= 1
+        return subject_name, ti
+
+    def _entry(self, ci: int, slot_id: int, subject_name: str, ti: int) -> ScheduleEntry:
+        return ScheduleEntry(class_info=self.classes[ci], subject=self.subjects[ci][subject_name],
+                             teacher=self.teachers[ti], time_slot=self.grid.slots[slot_id])
+
+    def _can_place(self, ci: int, slot_id: int, subject_name: str, ti: int) -> bool:
+        """
+        硬约束：教师空闲且可用、教师每日/每周上限、科目每日上限（连堂科目为连堂块上限）、
+        当天配额，最后检查规则管理器中的全部规则
+        """
+        teacher = self.teachers[ti]
+        day = slot_id // self.periods
+        day_count = self.subject_day[ci].get((subject_name, day), 0)
+        if (self.teacher_busy[ti][slot_id] or not self.available[ti][slot_id] or
+                self.teacher_day[ti][day] >= teacher.max_hours_per_day or
+                self.teacher_week[ti] >= teacher.max_hours_per_week or
+                day_count >= self.day_limits[ci][subject_name]):
+            return False
+        if self.quotas is not None:
+            quota = self.quotas[ci][subject_name]
+            if quota is not None and day_count >= quota[day]:
+                return False
+        if self.rule_manager is None:
+            return True
+        return self.rule_manager.check_all_rules(self.schedule, self._entry(ci, slot_id, subject_name, ti))[0]
+
+    def _pick_teacher(self, ci: int, slot_id: int, subject_name: str) -> Optional[int]:
+        """随机选一位可在该时间段上课的教师（先随机排序，规则检查只做到第一位合格的教师）"""
+        candidates = list(self.teachers_for_subject.get(subject_name, ()))
+        self.random.shuffle(candidates)
+        return next((ti for ti in candidates if self._can_place(ci, slot_id, subject_name, ti)), None)
+
+    def _place_block(self, ci: int, first: int, second: int, subject_name: str) -> Optional[int]:
+        """在两个相邻的空时间段放入一个连堂块（同一位随机选出的教师），返回教师下标；放不下时不做改动"""
+        candidates = list(self.teachers_for_subject.get(subject_name, ()))
+        self.random.shuffle(candidates)
+        for ti in candidates:
+            if not self._can_place(ci, first, subject_name, ti):
+                continue
+            self._place(ci, first, subject_name, ti)
+            if self._can_place(ci, second, subject_name, ti):
+                self._place(ci, second, subject_name, ti)
+                return ti
+            self._unplace(ci, first)
+        return None
+
+    def _is_block_lesson(self, ci: int, subject_name: str) -> bool:
+        """连堂科目的课时：已排的不移动，未排的成对插入"""
+        return self.subjects[ci][subject_name].requires_consecutive_periods
+
+    # ========== 代价 ==========
+    def _day_penalty(self, ci: int, day: int) -> int:
+        """某班级某天同一科目连堂超过上限的节数"""
+        penalty, run, previous = 0, 0, None
+        row = self.cells[ci]
+        for slot_id in range(day * self.periods, (day + 1) * self.periods):
+            cell = row[slot_id]
+            subject_name = cell[0] if cell else None
+            run = run + 1 if subject_name is not None and subject_name == previous else 1
+            if subject_name is not None and run > self.max_consecutive:
+                penalty += 1
+            previous = subject_name
+        return penalty
+
+    def _total_cost(self) -> float:
+        soft = sum(self._day_penalty(ci, day)
+                   for ci in range(len(self.classes)) for day in range(self.n_days))
+        return soft + self.UNSCHEDULED_WEIGHT * len(self.unscheduled)
+
+    def _accept(self, delta: float, temperature: float) -> bool:
+        return delta <= 0 or self.random.random() < math.exp(-delta / temperature)
+
+    # ========== 邻域 ==========
+    def _random_move(self, temperature: float) -> Optional[float]:
+        """随机执行一步邻域移动，接受时返回代价变化，拒绝或无效时返回 None"""
+        roll = self.random.random()
+        if self.unscheduled and roll < 0.5:
+            return self._insert_move(temperature)
+        if roll < 0.8:
+            return self._relocate_move(temperature)
+        return self._swap_move(temperature)
+
+    def _insert_move(self, temperature: float) -> Optional[float]:
+        """把一节未排课时放进某个时间段；时间段已有课时挤出原课程"""
+        index = self.random.randrange(len(self.unscheduled))
+        ci, subject_name = self.unscheduled[index]
+        if self._is_block_lesson(ci, subject_name) and self.unscheduled.count((ci, subject_name)) >= 2:
+            return self._insert_block_move(ci, subject_name, temperature)
+        slot_id = self.random.randrange(self.n_slots)
+        day = slot_id // self.periods
+        before = self._day_penalty(ci, day)
+        evicted = None
+        if self.cells[ci][slot_id] is not None:
+            occupant = self.cells[ci][slot_id][0]
+            if occupant == subject_name or self._is_block_lesson(ci, occupant):
+                return None
+            evicted = self._unplace(ci, slot_id)
+        ti = self._pick_teacher(ci, slot_id, subject_name)
+        if ti is None:
+            if evicted:
+                self._place(ci, slot_id, *evicted)
+            return None
+        self._place(ci, slot_id, subject_name, ti)
+        delta = self._day_penalty(ci, day) - before
+        if evicted is None:
+            delta -= self.UNSCHEDULED_WEIGHT
+        if not self._accept(delta, temperature):
+            self._unplace(ci, slot_id)
+            if evicted:
+                self._place(ci, slot_id, *evicted)
+            return None
+        self.unscheduled[index] = self.unscheduled[-1]
+        self.unscheduled.pop()
+        if evicted:
+            self.unscheduled.append((ci, evicted[0]))
+        return delta
+
+    def _insert_block_move(self, ci: int, subject_name: str, temperature: float) -> Optional[float]:
+        """把两节未排的连堂课时作为连堂块放进该班级空着的相邻时间段，两节同一位教师"""
+        first, second = self.random.choice(self.grid.consecutive_pairs)
+        row = self.cells[ci]
+        if row[first] is not None or row[second] is not None:
+            return None
+        day = first // self.periods
+        before = self._day_penalty(ci, day)
+        if self._place_block(ci, first, second, subject_name) is None:
+            return None
+        delta = self._day_penalty(ci, day) - before - 2 * self.UNSCHEDULED_WEIGHT
+        if not self._accept(delta, temperature):
+            self._unplace(ci, second)
+            self._unplace(ci, first)
+            return None
+        for _ in range(2):
+            self.unscheduled.remove((ci, subject_name))
+        return delta
+
+    def _relocate_move(self, temperature: float) -> Optional[float]:
+        """把某班级的一节课移到该班级的空时间段（可更换同科目教师）"""
+        ci = self.random.randrange(len(self.classes))
+        source = self.random.randrange(self.n_slots)
+        target = self.random.randrange(self.n_slots)
+        row = self.cells[ci]
+        if row[source] is None or row[target] is not None or self._is_block_lesson(ci, row[source][0]):
+            return None
+        days = {source // self.periods, target // self.periods}
+        before = sum(self._day_penalty(ci, day) for day in days)
+        subject_name, old_ti = self._unplace(ci, source)
+        ti = self._pick_teacher(ci, target, subject_name)
+        if ti is None:
+            self._place(ci, source, subject_name, old_ti)
+            return None
+        self._place(ci, target, subject_name, ti)
+        delta = sum(self._day_penalty(ci, day) for day in days) - before
+        if not self._accept(delta, temperature):
+            self._unplace(ci, target)
+            self._place(ci, source, subject_name, old_ti)
+            return None
+        return delta
+
+    def _swap_move(self, temperature: float) -> Optional[float]:
+        """交换某班级两节课的时间段，教师不变"""
+        ci = self.random.randrange(len(self.classes))
+        first = self.random.randrange(self.n_slots)
+        second = self.random.randrange(self.n_slots)
+        row = self.cells[ci]
+        if first == second or row[first] is None or row[second] is None or row[first][0] == row[second][0]:
+            return None
+        if self._is_block_lesson(ci, row[first][0]) or self._is_block_lesson(ci, row[second][0]):
+            return None
+        days = {first // self.periods, second // self.periods}
+        before = sum(self._day_penalty(ci, day) for day in days)
+        lesson_a = self._unplace(ci, first)
+        lesson_b = self._unplace(ci, second)
+        if self._can_place(ci, second, *lesson_a):
+            self._place(ci, second, *lesson_a)
+            if self._can_place(ci, first, *lesson_b):
+                self._place(ci, first, *lesson_b)
+                delta = sum(self._day_penalty(ci, day) for day in days) - before
+                if self._accept(delta, temperature):
+                    return delta
+                self._unplace(ci, first)
+            self._unplace(ci, second)
+        self._place(ci, first, *lesson_a)
+        self._place(ci, second, *lesson_b)
+        return None
+
+    # ========== 输出 ==========
+    def _snapshot(self) -> List[Tuple[int, int, str, int]]:
+        return [(ci, slot_id, cell[0], cell[1])
+                for ci, row in enumerate(self.cells)
+                for slot_id, cell in enumerate(row) if cell is not None]
+
+    def _build_schedule(self, cells: List[Tuple[int, int, str, int]]) -> Schedule:
+        schedule = Schedule()
+        for ci, slot_id, subject_name, ti in cells:
+            schedule.add_entry(ScheduleEntry(
+                class_info=self.classes[ci],
+                subject=self.subjects[ci][subject_name],
+                teacher=self.teachers[ti],
+                time_slot=self.grid.slots[slot_id]
+            ))
+        return schedule
+
+    def _unscheduled_errors(self, schedule: Schedule) -> List[str]:
+        placed: Dict[Tuple[str, str], int] = {}
+        for entry in schedule.entries:
+            key = (entry.class_info.id, entry.subject.name)
+            placed[key] = placed.get(key, 0) + 1
+        errors = []
+        for class_ in self.classes:
+            for subject in class_.subjects:
+                missing = subject.weekly_hours - placed.get((class_.id, subject.name), 0)
+                if missing > 0:
+                    errors.append(f"无法为 {class_.name} 安排 {subject.name} 的 {missing} 节课")
+        return errors
@@ -1,12 +1,14 @@
 import os
-from flask import Flask, jsonify, request, render_template  # 添加 render_template 用于渲染 HTML 页面
+from flask import Flask, jsonify, request, render_template, Response  # 添加 render_template 用于渲染 HTML 页面
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import inspect
 from datetime import time, timedelta
 from typing import List, Dict, Optional, Tuple, Set
 from collections import defaultdict
+import queue
 import random
+import threading
 from flask_cors import CORS  # Import CORS
 
 # ========= 从你的模块中导入必要的类 =========
@@ -18,6 +20,13 @@ from models import (
     Priority as ModelPriority
 )
 from rules import RuleManager, Rule, RuleType, RulePriority
+from jobs import JobQueue, JobStatus, QueueFullError
+from result_cache import ResultCache
+from schedule_format import dumps
+# 排课请求的解析和求解不依赖 Flask，后台任务的子进程只导入 schedule_api
+from schedule_api import (
+    schedule_cache_key, run_schedule_job, run_reschedule_job, store_schedule_result
+)
 
 # 指向模板文件夹下的 index.html 和 register.html
 template_path_index = os.path.join('templates', 'index.html')
@@ -44,6 +53,13 @@ app.secret_key = 'your-very-secret-key-here'  # secret_key is still useful for s
 # 初始化数据库
 db = SQLAlchemy(app)
 
+# 后台排课任务队列（进程池在第一次提交任务时才启动）
+schedule_jobs = JobQueue(max_workers=2)
+# 相同请求（内容、随机种子、规则集）直接返回已有结果；结果同时保存到磁盘，重启后仍可命中
+schedule_cache = ResultCache(max_entries=256, directory=os.path.join('cache', 'schedules'))
+# 流式排课接口在没有事件时发送心跳的间隔（秒）
+STREAM_KEEPALIVE = 5.0
+
 # ========= 数据库模型定义 (保持不变) =========
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -64,113 +80,6 @@ def initialize_database():
             print("数据库表已存在")
 initialize_database()
 
-# ========= SmartScheduler 类定义 (保持不变) =========
-class SmartScheduler:
-    """
-    智能排课调度器类。
-    负责根据输入的班级、教师、教室信息和排课规则生成课表。
-    """
-    def __init__(self, config: ModelScheduleConfig, rule_manager: RuleManager):
-        if not isinstance(config, ModelScheduleConfig):
-            raise TypeError("config 必须是 ScheduleConfig 类型")
-        if not isinstance(rule_manager, RuleManager):
-            raise TypeError("rule_manager 必须是 RuleManager 类型")
-
-        self.config = config
-        self.rule_manager = rule_manager
-        self.schedule = ModelSchedule(config=self.config)
-        self.errors = []
-        self.available_time_slots = self._generate_available_time_slots()
-
-    def _generate_available_time_slots(self) -> List[ModelTimeSlot]:
-        slots = []
-        timetable = self.config.timetable
-        total_periods = (timetable.periods_per_morning +
-                         timetable.periods_per_afternoon +
-                         timetable.periods_per_evening)
-
-        for weekday in self.config.weekdays:
-            for period in range(1, total_periods + 1):
-                try:
-                    start_str, end_str = timetable.get_period_time(period)
-                    start_time = time.fromisoformat(start_str)
-                    end_time = time.fromisoformat(end_str)
-                    day_part = timetable.get_day_part(period)
-                    slots.append(ModelTimeSlot(
-                        weekday=weekday,
-                        start_time=start_time,
-                        end_time=end_time,
-                        period_number=period,
-                        day_part=day_part
-                    ))
-                except ValueError as e:
-                    self.errors.append(f"生成时间段错误 (星期 {weekday.value}, 第 {period} 节): {e}")
-        return slots
-
-    def generate_schedule(self,
-                          grade_classes: List[ModelClass],
-                          teachers: List[ModelTeacher]) -> Tuple[Optional[ModelSchedule], List[str]]:
-        self.schedule = ModelSchedule(config=self.config)
-        self.errors = []
-
-        if not grade_classes: self.errors.append("没有提供班级信息。"); return None, self.errors
-        if not teachers: self.errors.append("没有提供教师信息。"); return None, self.errors
-
-        teachers_dict = {t.id: t for t in teachers}
-
-        tasks = []
-        for cls in grade_classes:
-            if not hasattr(cls, 'subjects') or not cls.subjects:
-                self.errors.append(f"班级 '{cls.name}' 没有设置科目，已跳过。")
-                continue
-            for subject in cls.subjects:
-                for _ in range(subject.weekly_hours):
-                    tasks.append({'class': cls, 'subject': subject})
-
-        random.shuffle(tasks)
-        scheduled_count = 0
-        for task in tasks:
-            current_class = task['class']
-            current_subject = task['subject']
-            scheduled_this_task = False
-
-            potential_teachers = [t for t in teachers if current_subject.name in t.subjects]
-            if not potential_teachers:
-                self.errors.append(f"科目 '{current_subject.name}' (班级: {current_class.name}) 没有找到合适的教师。")
-                continue
-            random.shuffle(potential_teachers)
-
-            random.shuffle(self.available_time_slots)
-            for time_slot in self.available_time_slots:
-                if not current_subject.can_be_scheduled_at(time_slot): continue
-                for teacher in potential_teachers:
-                    if not teacher.is_available_at(time_slot): continue
-
-                    potential_entry = ModelScheduleEntry(
-                        class_info=current_class,
-                        subject=current_subject,
-                        teacher=teacher,
-                        time_slot=time_slot
-                    )
-                    violations = self.rule_manager.check_all_rules(self.schedule, potential_entry)
-                    if not violations:
-                        if self.schedule.add_entry(potential_entry):
-                            scheduled_this_task = True
-                            scheduled_count += 1
-                            break
-                    if scheduled_this_task: break
-                if scheduled_this_task: break
-
-            if not scheduled_this_task:
-                self.errors.append(f"无法为班级 '{current_class.name}' 的科目 '{current_subject.name}' 找到合适的时间/教师安排。")
-
-        print(f"排课完成。总任务数: {len(tasks)}, 成功安排: {scheduled_count}")
-        if scheduled_count < len(tasks):
-            self.errors.append(f"警告：有 {len(tasks) - scheduled_count} 节课未能成功安排。")
-
-        return self.schedule, self.errors
-
-
 # ========= API 路由定义 =========
 @app.route('/')
 def home():
@@ -252,124 +161,141 @@ def register():
         return jsonify({"success": False, "message": "注册失败"}), 500
 
 # --- 排课 API ---
+def json_response(payload: Dict, status: int = 200) -> Response:
+    """用 schedule_format.dumps 序列化（有 orjson 时更快），代替 jsonify"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
 @app.route('/create_schedule', methods=['POST'])
 def create_schedule():
     data = request.json
     if not data:
         return jsonify({"success": False, "errors": ["无效的请求数据"]}), 400
+    key = schedule_cache_key(data)
+    cached = schedule_cache.get(key) if key else None
+    if cached is not None:
+        return json_response({**cached, "cached": True})
+    payload, status = run_schedule_job(data)
+    store_schedule_result(schedule_cache, key, payload, status)
+    return json_response(payload, status)
+
+@app.route('/create_schedule/stream', methods=['POST'])
+def create_schedule_stream():
+    """
+    排课的流式版本（Server-Sent Events），请求体与 /create_schedule 相同。事件：
+        progress    {"placed", "remaining", "weekday", "period", "elapsed"}  已排/待排课时数、当前时间段和耗时
+        class_done  {"class_id", "class_name", "schedule"}                   某班级课时全部排完（或排课结束）时该班课表
+        result      与 /create_schedule 的响应相同，另含 "status"（HTTP 状态码），之后连接关闭
+        error       {"errors", "status"}  排课过程中出现异常，之后连接关闭
+    排课期间每隔 STREAM_KEEPALIVE 秒没有事件时发送一行 SSE 注释，以便及时发现客户端断开并停止排课。
+    """
+    data = request.json
+    if not data:
+        return jsonify({"success": False, "errors": ["无效的请求数据"]}), 400
+    key = schedule_cache_key(data)
+    events = queue.Queue()
+    cancel = threading.Event()
 
-    try:
-        # 1. 解析时间函数保持不变
-        def parse_time(time_str):
-            if isinstance(time_str, str):
-                time_part = time_str.split('T')[-1].split('+')[0].split('Z')[0]
-                try: return time.fromisoformat(time_part)
-                except ValueError: raise ValueError(f"无法解析的时间格式: '{time_str}' -> '{time_part}'")
-            elif isinstance(time_str, time): return time_str
-            raise TypeError(f"预期时间为字符串或 time 对象，收到: {type(time_str)}")
-
-        # 2. 解析班级和科目数据
-        classes = []
-        for c_data in data.get('classes', []):
-            subjects_in_class = []
-            for s_data in c_data.get('subjects', []):
-                allowed_parts = [ModelDayPart(dp) for dp in s_data.get('allowed_day_parts', ['morning', 'afternoon'])]
-                s_data['allowed_day_parts'] = allowed_parts
-                s_data['priority'] = ModelPriority[s_data.get('priority', 'MEDIUM').upper()]
-                subjects_in_class.append(ModelSubject(**s_data))
-            c_data['subjects'] = subjects_in_class
-            classes.append(ModelClass(**c_data))
-
-        # 3. 解析教师数据
-        teachers = []
-        for t_data in data.get('teachers', []):
-            available_times = []
-            for ts in t_data.get('available_times', []):
-                try:
-                    available_times.append(ModelTimeSlot(
-                        weekday=ModelWeekDay(ts['weekday']),
-                        start_time=parse_time(ts['start_time']),
-                        end_time=parse_time(ts['end_time']),
-                        period=ts['period'],
-                        day_part=ModelDayPart(ts['day_part'])
-                    ))
-                except (KeyError, ValueError) as e:
-                    raise ValueError(f"解析教师 {t_data.get('name', '未知')} 可用时间错误: {e}")
-            t_data['available_times'] = available_times
-            teachers.append(ModelTeacher(**t_data))
-
-        # 4. 创建时间表配置
-        timetable_data = data.get('timetable', {
-            "class_duration": 40,  # 小学一般是40分钟
-            "break_duration": 10,
-            "morning_start": "08:00:00",
-            "afternoon_start": "13:30:00",
-            "periods_per_morning": 4,
-            "periods_per_afternoon": 4,
-            "periods_per_evening": 0
-        })
-        
+    def emit(event: str, payload: Dict):
+        events.put((event, payload))
+
+    def solve():
+        # 无论成功与否都放入一个结束事件，否则 stream 会一直等待
         try:
-            timetable_data['morning_start'] = parse_time(timetable_data['morning_start'])
-            timetable_data['afternoon_start'] = parse_time(timetable_data['afternoon_start'])
-            timetable = ModelTimeTable(**timetable_data)
-        except (ValueError, TypeError) as e:
-            raise ValueError(f"解析时间表配置错误: {e}")
-
-        # 5. 创建排课配置
-        schedule_config_data = data.get('schedule_config', {
-            "name": "小学课表",
-            "weekdays": ["monday", "tuesday", "wednesday", "thursday", "friday"],
-            "allow_consecutive_same_subject": True,
-            "max_consecutive_same_subject": 2,
-            "min_subject_interval": 1
-        })
-        
+            cached = schedule_cache.get(key) if key else None
+            if cached is not None:
+                events.put(("result", {**cached, "cached": True, "status": 200}))
+                return
+            payload, status = run_schedule_job(data, progress=emit, cancel=cancel)
+            store_schedule_result(schedule_cache, key, payload, status)
+            events.put(("result", {**payload, "status": status}))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            events.put(("error", {"success": False, "errors": [f"服务器错误: {str(e)}"], "status": 500}))
+
+    def stream():
+        threading.Thread(target=solve, daemon=True).start()
         try:
-            schedule_config_data['weekdays'] = [ModelWeekDay(wd) for wd in schedule_config_data['weekdays']]
-            schedule_config_data['timetable'] = timetable
-            schedule_config = ModelScheduleConfig(**schedule_config_data)
-        except (ValueError, TypeError) as e:
-            raise ValueError(f"解析排课配置错误: {e}")
-
-        # 6. 创建规则管理器
-        rule_manager = RuleManager()
-        rule_manager.create_default_rules()
-
-        # 7. 创建排课器并生成课表
-        scheduler = SmartScheduler(config=schedule_config, rule_manager=rule_manager)
-        schedule_result, errors = scheduler.generate_schedule(
-            grade_classes=classes,
-            teachers=teachers
-        )
-
-        # 8. 格式化结果
-        formatted_schedule = []
-        final_errors = list(errors)
-
-        if schedule_result and schedule_result.entries:
-            for entry in schedule_result.entries:
-                formatted_entry = {
-                    "class_id": entry.class_info.id,
-                    "class_name": entry.class_info.name,
-                    "subject": entry.subject.name,
-                    "teacher_id": entry.teacher.id,
-                    "teacher_name": entry.teacher.name,
-                    "weekday": entry.time_slot.weekday.value,
-                    "period": entry.time_slot.period,
-                    "time": f"{entry.time_slot.start_time.strftime('%H:%M')}-{entry.time_slot.end_time.strftime('%H:%M')}"
-                }
-                formatted_schedule.append(formatted_entry)
-
-            # 按班级和时间排序
-            formatted_schedule.sort(key=lambda x: (x["class_id"], x["weekday"], x["period"]))
+            while True:
+                try:
+                    event, payload = events.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    # 写入失败时服务器关闭生成器，finally 中通知排课器停止
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {dumps(payload).decode('utf-8')}\n\n"
+                if event in ("result", "error"):
+                    break
+        finally:
+            # 正常结束时排课已完成；客户端中途断开时通知排课器停止
+            cancel.set()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- 排课任务 API：提交后立即返回任务 id，客户端轮询状态并获取结果 ---
+@app.route('/schedule_jobs', methods=['POST'])
+def submit_schedule_job():
+    data = request.json
+    if not data:
+        return jsonify({"success": False, "errors": ["无效的请求数据"]}), 400
+    key = schedule_cache_key(data)
+    cached = schedule_cache.get(key) if key else None
+    if cached is not None:
+        job = schedule_jobs.add_finished(({**cached, "cached": True}, 200))
+        return jsonify({"success": True, **job.to_dict()}), 200
 
-        return jsonify({
-            "success": len(final_errors) == 0,
-            "schedule": formatted_schedule,
-            "errors": final_errors if final_errors else None
-        })
+    def remember(result):
+        payload, status = result
+        store_schedule_result(schedule_cache, key, payload, status)
+
+    try:
+        # 任务运行中被 DELETE 时，cancel 事件通知子进程中的排课器提前停止
+        job = schedule_jobs.submit(run_schedule_job, data, on_done=remember, cancellable=True)
+    except QueueFullError as e:
+        return jsonify({"success": False, "errors": [str(e)]}), 503
+    return jsonify({"success": True, **job.to_dict()}), 202
+
+@app.route('/schedule_jobs/<job_id>', methods=['GET'])
+def get_schedule_job(job_id):
+    """任务状态；任务完成时附带排课结果（与 /create_schedule 的响应相同）"""
+    job = schedule_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "errors": ["任务不存在或已过期"]}), 404
+    response = job.to_dict()
+    if job.status == JobStatus.DONE:
+        payload, status = job.result
+        response["result"] = payload
+        response["result_status"] = status
+    return json_response(response)
+
+@app.route('/schedule_jobs/<job_id>', methods=['DELETE'])
+def cancel_schedule_job(job_id):
+    if schedule_jobs.get(job_id) is None:
+        return jsonify({"success": False, "errors": ["任务不存在或已过期"]}), 404
+    cancelled = schedule_jobs.cancel(job_id)
+    return jsonify({"success": cancelled, **schedule_jobs.get(job_id).to_dict()}), 200 if cancelled else 409
+
+@app.route('/schedule_cache/stats', methods=['GET'])
+def schedule_cache_stats():
+    return jsonify(schedule_cache.stats())
+
+@app.route('/reschedule', methods=['POST'])
+def reschedule():
+    """
+    增量调整已有课表：请求体与 /create_schedule 相同，另含
+    "schedule"（现有课表条目）和 "changes"：
+        {"blocked": {教师id: [{"weekday", "period"}, ...]},  # 临时不可上课（如请假）
+         "changed_teachers": [教师id, ...]}                    # available_times 已修改的教师
+    只重排受影响的课程，返回新课表及改动的条目。
+    """
+    data = request.json
+    if not data:
+        return jsonify({"success": False, "errors": ["无效的请求数据"]}), 400
 
+    try:
+        payload, status = run_reschedule_job(data)
+        return jsonify(payload), status
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,74 @@
+from typing import List
+from collections import deque
+
+UNMATCHED = -1
+
+def hopcroft_karp(adjacency: List[List[int]], n_right: int) -> List[int]:
+    """
+    Hopcroft–Karp 二分图最大匹配，时间复杂度 O(E·√V)。
+    :param adjacency: adjacency[u] 为左侧顶点 u 可连接的右侧顶点下标，按偏好顺序排列
+    :param n_right: 右侧顶点个数
+    :return: 每个左侧顶点匹配到的右侧顶点下标，未匹配为 UNMATCHED
+    """
+    n_left = len(adjacency)
+    match_left = [UNMATCHED] * n_left
+    match_right = [UNMATCHED] * n_right
+
+    # 先按偏好顺序贪心匹配，增广阶段只调整必要的部分
+    for u, neighbours in enumerate(adjacency):
+        for v in neighbours:
+            if match_right[v] == UNMATCHED:
+                match_left[u], match_right[v] = v, u
+                break
+
+    infinity = n_left + 1
+    while True:
+        # BFS：从所有未匹配左侧顶点出发分层
+        layer = [infinity] * n_left
+        queue = deque()
+        for u in range(n_left):
+            if match_left[u] == UNMATCHED:
+                layer[u] = 0
+                queue.append(u)
+        # shortest 为最短增广路终点所在的层：到达该层后不再向下扩展
+        shortest = infinity
+        while queue:
+            u = queue.popleft()
+            if layer[u] > shortest:
+                break
+            for v in adjacency[u]:
+                w = match_right[v]
+                if w == UNMATCHED:
+                    shortest = min(shortest, layer[u])
+                elif layer[w] == infinity and layer[u] < shortest:
+                    layer[w] = layer[u] + 1
+                    queue.append(w)
+        if shortest == infinity:
+            return match_left
+
+        # DFS：沿分层图寻找互不相交的最短增广路（迭代实现，避免递归深度限制）
+        next_edge = [0] * n_left
+        for root in range(n_left):
+            if match_left[root] != UNMATCHED:
+                continue
+            path = [root]
+            while path:
+                u = path[-1]
+                if next_edge[u] == len(adjacency[u]):
+                    layer[u] = infinity  # 死路，本轮不再访问
+                    path.pop()
+                    continue
+                v = adjacency[u][next_edge[u]]
+                next_edge[u] += 1
+                w = match_right[v]
+                if w == UNMATCHED:
+                    if layer[u] != shortest:
+                        continue  # 只接受最短长度的增广路
+                    # 找到增广路，沿路径翻转匹配
+                    for x in reversed(path):
+                        previous = match_left[x]
+                        match_left[x], match_right[v] = v, x
+                        v = previous
+                    break
+                if layer[u] < shortest and layer[w] == layer[u] + 1:
+                    path.append(w)
@@ -1,8 +1,15 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Optional
 from enum import Enum
 from typing import Tuple
-from datetime import time
+from datetime import time, date, datetime, timedelta
+from array import array
+import itertools
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，只有稠密数组后端需要
+    np = None
 
 # 星期枚举
 class WeekDay(Enum):
@@ -46,12 +53,83 @@ class Priority(Enum):
     MEDIUM = 2
     LOW = 1
 
-# 时间槽
-@dataclass
+# 时间槽（不可变、可哈希；相等性只看星期和节次）
+@dataclass(frozen=True)
 class TimeSlot:
     weekday: WeekDay
     period: int  # 第几节课（1开始）
-    day_part: DayPart
+    day_part: DayPart = field(compare=False)
+    slot_id: int = field(default=-1, compare=False, repr=False)  # 在 SlotGrid 中的编号，-1 表示未驻留
+
+# 时间槽网格
+class SlotGrid:
+    """
+    预先生成的一周时间槽网格。
+    每个 (星期, 节次) 只对应一个 TimeSlot 实例和一个稠密整数编号：
+    slot_id = 星期下标 * 每天节数 + (节次 - 1)
+    """
+    def __init__(self, weekdays: List[WeekDay], timetable: 'TimeTable'):
+        self.weekdays: Tuple[WeekDay, ...] = tuple(weekdays)
+        self.timetable = timetable
+        self.periods_per_day = timetable.get_total_periods()
+        self.day_index: Dict[WeekDay, int] = {wd: i for i, wd in enumerate(self.weekdays)}
+        slots = []
+        for weekday in self.weekdays:
+            for period in range(1, self.periods_per_day + 1):
+                slots.append(TimeSlot(
+                    weekday=weekday,
+                    period=period,
+                    day_part=timetable.get_day_part(period),
+                    slot_id=len(slots)
+                ))
+        self.slots: Tuple[TimeSlot, ...] = tuple(slots)
+        # 可作为连堂的相邻时间段对：同一天、同一时段（不跨越上午/下午/晚上）
+        self.consecutive_pairs: Tuple[Tuple[int, int], ...] = tuple(
+            (a.slot_id, b.slot_id) for a, b in zip(slots, slots[1:])
+            if a.weekday == b.weekday and a.day_part == b.day_part
+        )
+        self.pair_next: Dict[int, int] = dict(self.consecutive_pairs)  # 连堂首节 -> 第二节
+        # 每节课的上课时间文本，如 "08:00-08:40"（下标为 节次 - 1）
+        self.period_times: Tuple[str, ...] = tuple(
+            "{:%H:%M}-{:%H:%M}".format(*timetable.get_period_time(period))
+            for period in range(1, self.periods_per_day + 1)
+        )
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def slot_id(self, weekday: WeekDay, period: int) -> int:
+        """获取 (星期, 节次) 的编号，不在网格内时返回 -1"""
+        day = self.day_index.get(weekday)
+        if day is None or not 1 <= period <= self.periods_per_day:
+            return -1
+        return day * self.periods_per_day + period - 1
+
+    def get(self, weekday: WeekDay, period: int) -> TimeSlot:
+        """获取网格中唯一的时间槽实例"""
+        slot_id = self.slot_id(weekday, period)
+        if slot_id < 0:
+            raise KeyError(f"时间槽不在网格内: {weekday.value} 第{period}节")
+        return self.slots[slot_id]
+
+    def id_of(self, time_slot: TimeSlot) -> int:
+        """获取任意时间槽对象在本网格中的编号"""
+        slot_id = time_slot.slot_id
+        if 0 <= slot_id < len(self.slots) and self.slots[slot_id] is time_slot:
+            return slot_id
+        return self.slot_id(time_slot.weekday, time_slot.period)
+
+    def intern(self, time_slot: TimeSlot) -> TimeSlot:
+        """将外部构造的时间槽替换为网格中的实例"""
+        return self.get(time_slot.weekday, time_slot.period)
+
+    def day_slots(self, weekday: WeekDay) -> Tuple[TimeSlot, ...]:
+        """获取某一天的所有时间槽（按节次排序）"""
+        start = self.day_index[weekday] * self.periods_per_day
+        return self.slots[start:start + self.periods_per_day]
 
 # 科目信息
 @dataclass
@@ -62,6 +140,10 @@ class Subject:
     requires_consecutive_periods: bool = False  # 是否需要连堂
     max_periods_per_day: int = 2  # 每天最多几节
 
+    def block_day_limit(self) -> int:
+        """连堂科目每天最多几节：一个连堂块至少需要两节，即使每日上限为 1"""
+        return max(self.max_periods_per_day, 2)
+
 # 班级信息
 @dataclass
 class Class:
@@ -93,6 +175,9 @@ class Teacher:
     max_hours_per_day: int = 6  # 每天最多上课时数
     max_hours_per_week: int = 25  # 每周最多上课时数
     available_times: List[TimeSlot] = field(default_factory=list)
+    # 按网格编译后的可用时间位图缓存
+    _availability_mask: int = field(default=0, init=False, repr=False, compare=False)
+    _mask_grid: Optional[SlotGrid] = field(default=None, init=False, repr=False, compare=False)
 
     def can_teach(self, subject: str) -> bool:
         return subject in self.subjects
@@ -100,12 +185,43 @@ class Teacher:
     def is_available_at(self, time_slot: TimeSlot) -> bool:
         if not self.available_times:  # 如果没有指定可用时间，则默认都可用
             return True
+        if self._mask_grid is not None:
+            slot_id = self._mask_grid.id_of(time_slot)
+            if slot_id >= 0:
+                return bool(self._availability_mask >> slot_id & 1)
         return any(
             at.weekday == time_slot.weekday and 
             at.period == time_slot.period 
             for at in self.available_times
         )
 
+    def availability_mask(self, grid: SlotGrid) -> int:
+        """
+        可用时间位图：第 slot_id 位为 1 表示该时间段可用。
+        每个网格只编译一次；修改 available_times 后需调用 invalidate_availability()。
+        """
+        if self._mask_grid is not grid:
+            if not self.available_times:
+                mask = (1 << len(grid)) - 1
+            else:
+                mask = 0
+                for at in self.available_times:
+                    slot_id = grid.slot_id(at.weekday, at.period)
+                    if slot_id >= 0:
+                        mask |= 1 << slot_id
+            self._availability_mask = mask
+            self._mask_grid = grid
+        return self._availability_mask
+
+    def free_slots_mask(self, grid: SlotGrid, busy_mask: int) -> int:
+        """可用且尚未排课的时间段位图"""
+        return self.availability_mask(grid) & ~busy_mask
+
+    def invalidate_availability(self) -> None:
+        """清除已编译的可用时间位图"""
+        self._mask_grid = None
+        self._availability_mask = 0
+
 # 排课条目
 @dataclass
 class ScheduleEntry:
@@ -114,34 +230,321 @@ class ScheduleEntry:
     teacher: Teacher
     time_slot: TimeSlot
 
+def _remove_identical(items: List, item: object) -> bool:
+    """从列表中移除同一个对象（而非相等的对象），从末尾开始查找"""
+    for i in range(len(items) - 1, -1, -1):
+        if items[i] is item:
+            del items[i]
+            return True
+    return False
+
+# 全局递增的课表版本号：课表每次修改都取一个新值，不同课表之间也不会重复
+_schedule_versions = itertools.count(1)
+
 # 课表集合
 @dataclass
 class Schedule:
     entries: List[ScheduleEntry] = field(default_factory=list)
+    version: int = field(default=0, init=False, compare=False)
+    # 占用索引：随条目增删同步维护，冲突检查为 O(1)，按班级/教师查询为 O(k)
+    _teacher_slots: Dict[Tuple[str, TimeSlot], ScheduleEntry] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    _class_slots: Dict[Tuple[str, TimeSlot], ScheduleEntry] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    _class_entries: Dict[str, List[ScheduleEntry]] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    _teacher_entries: Dict[str, List[ScheduleEntry]] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    # 教师已占用时间段位图（按 slot_id 置位，仅统计网格中的时间槽）
+    _teacher_busy: Dict[str, int] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        """为初始化时传入的条目建立索引"""
+        for entry in self.entries:
+            self._index_entry(entry)
+        self.version = next(_schedule_versions)
 
     def add_entry(self, entry: ScheduleEntry) -> bool:
         if self.has_conflicts(entry):
             return False
         self.entries.append(entry)
+        self._index_entry(entry)
+        self.version = next(_schedule_versions)
+        return True
+
+    def remove_entry(self, entry: ScheduleEntry) -> bool:
+        """移除条目并同步更新索引（按对象身份匹配，从最近加入的条目开始查找）"""
+        if not _remove_identical(self.entries, entry):
+            return False
+        self._unindex_entry(entry)
+        self.version = next(_schedule_versions)
         return True
 
     def has_conflicts(self, new_entry: ScheduleEntry) -> bool:
-        for entry in self.entries:
-            if entry.time_slot.weekday == new_entry.time_slot.weekday and \
-               entry.time_slot.period == new_entry.time_slot.period:
-                # 检查教师冲突
-                if entry.teacher.id == new_entry.teacher.id:
-                    return True
-                # 检查班级冲突
-                if entry.class_info.id == new_entry.class_info.id:
-                    return True
-        return False
+        # 检查教师冲突
+        if (new_entry.teacher.id, new_entry.time_slot) in self._teacher_slots:
+            return True
+        # 检查班级冲突
+        return (new_entry.class_info.id, new_entry.time_slot) in self._class_slots
+
+    def is_teacher_busy(self, teacher_id: str, time_slot: TimeSlot) -> bool:
+        """教师在指定时间段是否已有课程"""
+        return (teacher_id, time_slot) in self._teacher_slots
+
+    def is_class_busy(self, class_id: str, time_slot: TimeSlot) -> bool:
+        """班级在指定时间段是否已有课程"""
+        return (class_id, time_slot) in self._class_slots
+
+    def teacher_busy_mask(self, teacher_id: str) -> int:
+        """教师已占用时间段位图"""
+        return self._teacher_busy.get(teacher_id, 0)
 
     def get_class_schedule(self, class_id: str) -> List[ScheduleEntry]:
-        return [e for e in self.entries if e.class_info.id == class_id]
+        return list(self._class_entries.get(class_id, ()))
 
     def get_teacher_schedule(self, teacher_id: str) -> List[ScheduleEntry]:
-        return [e for e in self.entries if e.teacher.id == teacher_id]
+        return list(self._teacher_entries.get(teacher_id, ()))
+
+    def _index_entry(self, entry: ScheduleEntry) -> None:
+        self._teacher_slots[(entry.teacher.id, entry.time_slot)] = entry
+        self._class_slots[(entry.class_info.id, entry.time_slot)] = entry
+        self._class_entries.setdefault(entry.class_info.id, []).append(entry)
+        self._teacher_entries.setdefault(entry.teacher.id, []).append(entry)
+        if entry.time_slot.slot_id >= 0:
+            self._teacher_busy[entry.teacher.id] = (
+                self._teacher_busy.get(entry.teacher.id, 0) | 1 << entry.time_slot.slot_id)
+
+    def _unindex_entry(self, entry: ScheduleEntry) -> None:
+        self._teacher_slots.pop((entry.teacher.id, entry.time_slot), None)
+        self._class_slots.pop((entry.class_info.id, entry.time_slot), None)
+        _remove_identical(self._class_entries[entry.class_info.id], entry)
+        _remove_identical(self._teacher_entries[entry.teacher.id], entry)
+        if entry.time_slot.slot_id >= 0:
+            self._teacher_busy[entry.teacher.id] &= ~(1 << entry.time_slot.slot_id)
+
+# 稠密数组课表
+@dataclass
+class DenseSchedule(Schedule):
+    """
+    基于 NumPy 稠密数组的课表后端，接口与 Schedule 相同。
+    额外维护 班级×天×节次、教师×天×节次 的占用数组和 班级×科目×天 的课时计数，
+    排课器可据此对一个时间段的全部科目/教师做向量化筛选。
+    未登记的班级、教师、科目在首次出现时自动扩容。
+    """
+    grid: Optional[SlotGrid] = None
+    class_ids: List[str] = field(default_factory=list)
+    teacher_ids: List[str] = field(default_factory=list)
+    subject_names: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if np is None:
+            raise ImportError("DenseSchedule 需要安装 numpy")
+        if self.grid is None:
+            raise ValueError("DenseSchedule 需要提供时间槽网格")
+        self.class_index = {cid: i for i, cid in enumerate(self.class_ids)}
+        self.teacher_index = {tid: i for i, tid in enumerate(self.teacher_ids)}
+        self.subject_index = {name: i for i, name in enumerate(self.subject_names)}
+        days, periods = len(self.grid.weekdays), self.grid.periods_per_day
+        # 底层数组按容量分配，扩容时容量翻倍，逐个登记新 id 的总代价为线性
+        self._class_rows = np.zeros((len(self.class_ids), days, periods), dtype=bool)
+        self._teacher_rows = np.zeros((len(self.teacher_ids), days, periods), dtype=bool)
+        self._subject_counts = np.zeros(
+            (len(self.class_ids), len(self.subject_names), days), dtype=np.int8)
+        super().__post_init__()
+
+    @property
+    def class_busy(self):
+        """班级×天×节次 占用数组（class_ids 顺序）"""
+        return self._class_rows[:len(self.class_ids)]
+
+    @property
+    def teacher_busy(self):
+        """教师×天×节次 占用数组（teacher_ids 顺序）"""
+        return self._teacher_rows[:len(self.teacher_ids)]
+
+    @property
+    def subject_day_counts(self):
+        """班级×科目×天 课时计数（class_ids、subject_names 顺序）"""
+        return self._subject_counts[:len(self.class_ids), :len(self.subject_names)]
+
+    def teacher_busy_at(self, slot_id: int):
+        """所有教师在某时间段的占用向量（teacher_ids 顺序）"""
+        return self.teacher_busy.reshape(len(self.teacher_ids), -1)[:, slot_id]
+
+    def class_busy_at(self, slot_id: int):
+        """所有班级在某时间段的占用向量（class_ids 顺序）"""
+        return self.class_busy.reshape(len(self.class_ids), -1)[:, slot_id]
+
+    def _index_entry(self, entry: ScheduleEntry) -> None:
+        super()._index_entry(entry)
+        self._update_arrays(entry, 1)
+
+    def _unindex_entry(self, entry: ScheduleEntry) -> None:
+        super()._unindex_entry(entry)
+        self._update_arrays(entry, -1)
+
+    def _update_arrays(self, entry: ScheduleEntry, delta: int) -> None:
+        slot_id = self.grid.id_of(entry.time_slot)
+        if slot_id < 0:
+            return
+        day, period = divmod(slot_id, self.grid.periods_per_day)
+        ci = self._ensure_class(entry.class_info.id)
+        ti = self._ensure_teacher(entry.teacher.id)
+        si = self._ensure_subject(entry.subject.name)
+        self._class_rows[ci, day, period] = delta > 0
+        self._teacher_rows[ti, day, period] = delta > 0
+        self._subject_counts[ci, si, day] += delta
+
+    @staticmethod
+    def _grow(array, axis: int, size: int):
+        """保证数组在 axis 方向至少有 size 个位置，不够时容量翻倍"""
+        capacity = array.shape[axis]
+        if size <= capacity:
+            return array
+        shape = list(array.shape)
+        shape[axis] = max(size, 2 * capacity, 4)
+        grown = np.zeros(shape, dtype=array.dtype)
+        grown[tuple(slice(0, n) for n in array.shape)] = array
+        return grown
+
+    def _ensure_class(self, class_id: str) -> int:
+        index = self.class_index.get(class_id)
+        if index is None:
+            index = self.class_index[class_id] = len(self.class_ids)
+            self.class_ids.append(class_id)
+            self._class_rows = self._grow(self._class_rows, 0, index + 1)
+            self._subject_counts = self._grow(self._subject_counts, 0, index + 1)
+        return index
+
+    def _ensure_teacher(self, teacher_id: str) -> int:
+        index = self.teacher_index.get(teacher_id)
+        if index is None:
+            index = self.teacher_index[teacher_id] = len(self.teacher_ids)
+            self.teacher_ids.append(teacher_id)
+            self._teacher_rows = self._grow(self._teacher_rows, 0, index + 1)
+        return index
+
+    def _ensure_subject(self, subject_name: str) -> int:
+        index = self.subject_index.get(subject_name)
+        if index is None:
+            index = self.subject_index[subject_name] = len(self.subject_names)
+            self.subject_names.append(subject_name)
+            self._subject_counts = self._grow(self._subject_counts, 1, index + 1)
+        return index
+
+# 紧凑条目存储
+class _LookupTable:
+    """对象查找表：按对象身份分配稠密编号，对象本身只保存一份"""
+    __slots__ = ('items', '_index')
+
+    def __init__(self):
+        self.items: List[object] = []
+        self._index: Dict[int, int] = {}
+
+    def index(self, obj: object) -> int:
+        key = id(obj)
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.items)
+            self.items.append(obj)
+        return index
+
+class CompactEntryView:
+    """CompactEntryStore 中单个条目的轻量视图，属性与 ScheduleEntry 相同"""
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: 'CompactEntryStore', index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def class_info(self) -> Class:
+        return self._store.classes.items[self._store.class_col[self._index]]
+
+    @property
+    def subject(self) -> Subject:
+        return self._store.subjects.items[self._store.subject_col[self._index]]
+
+    @property
+    def teacher(self) -> Teacher:
+        return self._store.teachers.items[self._store.teacher_col[self._index]]
+
+    @property
+    def time_slot(self) -> TimeSlot:
+        return self._store.grid.slots[self._store.slot_col[self._index]]
+
+    def to_entry(self) -> ScheduleEntry:
+        return ScheduleEntry(class_info=self.class_info, subject=self.subject,
+                             teacher=self.teacher, time_slot=self.time_slot)
+
+class CompactEntryStore:
+    """
+    按列存储的课表条目：班级/科目/教师/时间段只保存整数编号（array('i')），
+    对象本身放在查找表中。多个课表版本可共享同一组查找表，
+    每节课只占 4 个整数，适合在内存中保留大量历史版本做对比。
+    """
+    __slots__ = ('grid', 'classes', 'subjects', 'teachers',
+                 'class_col', 'subject_col', 'teacher_col', 'slot_col')
+
+    def __init__(self, grid: SlotGrid, shared_with: Optional['CompactEntryStore'] = None):
+        """
+        :param grid: 时间槽网格，时间段以 slot_id 保存
+        :param shared_with: 与另一个存储共享班级/科目/教师查找表
+        """
+        self.grid = grid
+        if shared_with is not None:
+            self.classes = shared_with.classes
+            self.subjects = shared_with.subjects
+            self.teachers = shared_with.teachers
+        else:
+            self.classes = _LookupTable()
+            self.subjects = _LookupTable()
+            self.teachers = _LookupTable()
+        self.class_col = array('i')
+        self.subject_col = array('i')
+        self.teacher_col = array('i')
+        self.slot_col = array('i')
+
+    @classmethod
+    def from_schedule(cls, schedule: Schedule, grid: SlotGrid,
+                      shared_with: Optional['CompactEntryStore'] = None) -> 'CompactEntryStore':
+        store = cls(grid, shared_with)
+        for entry in schedule.entries:
+            store.append(entry)
+        return store
+
+    def append(self, entry: ScheduleEntry) -> None:
+        slot_id = self.grid.id_of(entry.time_slot)
+        if slot_id < 0:
+            raise ValueError(f"时间槽不在网格内: {entry.time_slot.weekday.value} 第{entry.time_slot.period}节")
+        self.class_col.append(self.classes.index(entry.class_info))
+        self.subject_col.append(self.subjects.index(entry.subject))
+        self.teacher_col.append(self.teachers.index(entry.teacher))
+        self.slot_col.append(slot_id)
+
+    def __len__(self) -> int:
+        return len(self.slot_col)
+
+    def __getitem__(self, index: int) -> CompactEntryView:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("条目下标越界")
+        return CompactEntryView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CompactEntryView(self, index)
+
+    def to_schedule(self) -> Schedule:
+        """还原为普通课表对象"""
+        return Schedule(entries=[view.to_entry() for view in self])
+
+    def nbytes(self) -> int:
+        """四个编号列占用的字节数"""
+        return sum(col.itemsize * len(col) for col in
+                   (self.class_col, self.subject_col, self.teacher_col, self.slot_col))
 
 # 时间表配置
 @dataclass
@@ -149,6 +552,11 @@ class TimeTable:
     periods_per_morning: int = 4  # 上午课节数
     periods_per_afternoon: int = 4  # 下午课节数
     periods_per_evening: int = 0  # 晚上课节数
+    class_duration: int = 40  # 每节课分钟数
+    break_duration: int = 10  # 课间分钟数
+    morning_start: time = time(8, 0)
+    afternoon_start: time = time(13, 30)
+    evening_start: time = time(18, 30)
 
     def __post_init__(self):
         """初始化后的验证"""
@@ -165,6 +573,24 @@ class TimeTable:
         else:
             return DayPart.EVENING
 
+    def get_period_time(self, period: int) -> Tuple[time, time]:
+        """指定节次的上下课时间：所在时段的开始时间加上之前各节的课时和课间"""
+        day_part = self.get_day_part(period)
+        first, _ = self.get_period_range(day_part)
+        start = {DayPart.MORNING: self.morning_start,
+                 DayPart.AFTERNOON: self.afternoon_start,
+                 DayPart.EVENING: self.evening_start}[day_part]
+        begin = datetime.combine(date.min, start) + timedelta(
+            minutes=(period - first) * (self.class_duration + self.break_duration))
+        return begin.time(), (begin + timedelta(minutes=self.class_duration)).time()
+
+    def period_at(self, start: time) -> Optional[int]:
+        """按上课时间查找节次，没有在该时间开始的课时返回 None"""
+        for period in range(1, self.get_total_periods() + 1):
+            if self.get_period_time(period)[0] == start:
+                return period
+        return None
+
     def get_total_periods(self) -> int:
         """获取每天的总课节数"""
         return self.periods_per_morning + self.periods_per_afternoon + self.periods_per_evening
@@ -173,6 +599,10 @@ class TimeTable:
         """检查课节数是否有效"""
         return 1 <= period <= self.get_total_periods()
 
+    def build_slot_grid(self, weekdays: List[WeekDay]) -> SlotGrid:
+        """为给定工作日生成时间槽网格"""
+        return SlotGrid(weekdays, self)
+
     def get_period_range(self, day_part: DayPart) -> Tuple[int, int]:
         """获取指定时间段的课节范围"""
         if day_part == DayPart.MORNING:
@@ -197,6 +627,14 @@ class ScheduleConfig:
     allow_consecutive_same_subject: bool = True
     max_consecutive_same_subject: int = 2
     min_subject_interval: int = 1
+    _slot_grid: Optional[SlotGrid] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def slot_grid(self) -> SlotGrid:
+        """本配置的时间槽网格（首次访问时生成，之后复用同一批 TimeSlot 实例）"""
+        if self._slot_grid is None:
+            self._slot_grid = self.timetable.build_slot_grid(self.weekdays)
+        return self._slot_grid
 
     @classmethod
     def create_config(cls, 
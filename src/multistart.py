@@ -0,0 +1,186 @@
+from typing import Callable, List, Dict, Optional, Tuple
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+import os
+import random
+import threading
+import logging
+from models import Teacher, Class, Schedule, ScheduleEntry, ScheduleConfig
+from local_search import LocalSearchImprover, merge_errors, consecutive_penalty
+from decomposition import Component, split_components
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StartResult:
+    """单个起点的求解结果，课表压缩为下标元组以便跨进程传输"""
+    seed: int
+    lessons: List[Tuple[int, str, int, int]]  # (班级下标, 科目名, 教师下标, slot_id)
+    errors: List[str]
+    unscheduled: int
+    penalty: int
+    truncated: bool = False  # 引擎因时间预算用尽提前结束
+
+    @property
+    def quality(self) -> Tuple[int, int]:
+        """越小越好：先比较未排课时数，再比较软约束代价"""
+        return (self.unscheduled, self.penalty)
+
+def solve_single_start(engine_factory: Callable, config: ScheduleConfig,
+                       grade_classes: List[Class], teachers: List[Teacher],
+                       seed: int, improve_time: float = 0.0,
+                       cancel: Optional[threading.Event] = None) -> StartResult:
+    """
+    用给定种子运行一次排课引擎（可在子进程中执行）。
+    :param engine_factory: 接受 seed 关键字参数、返回排课引擎的可序列化工厂；
+                           给出 cancel 时还需接受 cancel 关键字参数
+    :param cancel: 取消标志（子进程中为 Manager 的 Event 代理），被 set 后引擎和局部搜索尽快返回
+    """
+    engine = engine_factory(seed=seed) if cancel is None else engine_factory(seed=seed, cancel=cancel)
+    schedule, errors = engine.generate_schedule(grade_classes=grade_classes, teachers=teachers)
+    if improve_time > 0 and not (cancel is not None and cancel.is_set()):
+        schedule, improve_errors = LocalSearchImprover(config, engine.rule_manager, seed=seed).improve(
+            schedule, grade_classes, teachers, improve_time,
+            day_quotas=getattr(engine, "day_quotas", None), cancel=cancel)
+        errors = merge_errors(errors, improve_errors)
+
+    grid = config.slot_grid
+    class_positions = {c.id: i for i, c in enumerate(grade_classes)}
+    teacher_positions = {t.id: i for i, t in enumerate(teachers)}
+    lessons = [
+        (class_positions[e.class_info.id], e.subject.name,
+         teacher_positions[e.teacher.id], grid.id_of(e.time_slot))
+        for e in schedule.entries
+    ]
+    required = sum(s.weekly_hours for c in grade_classes for s in c.subjects)
+    return StartResult(
+        seed=seed,
+        lessons=lessons,
+        errors=errors,
+        unscheduled=max(required - len(lessons), 0),
+        penalty=consecutive_penalty(schedule, config),
+        truncated=getattr(engine, "truncated", False)
+    )
+
+class MultiStartScheduler:
+    """
+    多起点排课：在进程池中用不同种子运行同一引擎的多个副本，
+    保留未排课时最少、其次软约束代价最低的结果；任一副本排满全部课时即提前返回。
+    开启 decompose 时先按共享教师拆成连通分量，每个分量独立做多起点求解后合并。
+    提前返回或调用方取消时，通过共享的取消标志让仍在运行的副本停止，并等待进程池退出。
+    """
+    def __init__(self, engine_factory: Callable, config: ScheduleConfig,
+                 starts: Optional[int] = None, max_workers: Optional[int] = None,
+                 seed: Optional[int] = None, improve_time: float = 0.0,
+                 decompose: bool = False, cancel: Optional[threading.Event] = None):
+        """
+        :param engine_factory: 接受 seed 关键字参数的引擎工厂（需可 pickle，如 functools.partial）
+        :param starts: 每个分量的起点个数，默认等于 CPU 核数
+        :param max_workers: 进程数，默认等于 CPU 核数；为 1 时在当前进程内顺序执行
+        :param seed: 起点种子的基数，第 i 个起点使用 seed + i
+        :param improve_time: 每个起点在引擎结束后局部搜索的时间预算（秒）
+        :param decompose: 是否先拆分为互不共享教师的连通分量
+        :param cancel: 调用方的取消标志，被 set 后各副本停止并返回已有的最好结果
+        """
+        self.engine_factory = engine_factory
+        self.config = config
+        self.starts = starts or os.cpu_count() or 1
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.seed = seed
+        self.improve_time = improve_time
+        self.decompose = decompose
+        self.cancel = cancel
+        self.results: List[StartResult] = []
+        self.truncated = False
+
+    def generate_schedule(self, grade_classes: List[Class],
+                          teachers: List[Teacher]) -> Tuple[Schedule, List[str]]:
+        if self.decompose:
+            components = split_components(grade_classes, teachers)
+        else:
+            components = [Component(list(grade_classes), list(teachers))]
+        base = self.seed if self.seed is not None else random.randrange(2 ** 31)
+        # 种子优先排列，使每个分量尽早得到第一个结果
+        tasks = [(index, base + i) for i in range(self.starts) for index in range(len(components))]
+        self.results = []
+        best: List[Optional[StartResult]] = [None] * len(components)
+
+        def complete(index: int) -> bool:
+            return best[index] is not None and best[index].unscheduled == 0
+
+        if self.max_workers == 1 or len(tasks) == 1:
+            for index, seed in tasks:
+                if not complete(index) and not (best[index] is not None and self._cancelled()):
+                    component = components[index]
+                    best[index] = self._keep_best(best[index], solve_single_start(
+                        self.engine_factory, self.config, component.classes,
+                        component.teachers, seed, self.improve_time, self.cancel))
+        else:
+            # 线程的 Event 不能传给子进程，用 Manager 的 Event 代理作为各副本共享的取消标志
+            manager = multiprocessing.Manager()
+            stop = manager.Event()
+            executor = ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks)))
+            failure = None
+            try:
+                pending = {
+                    executor.submit(solve_single_start, self.engine_factory, self.config,
+                                    components[index].classes, components[index].teachers,
+                                    seed, self.improve_time, stop): index
+                    for index, seed in tasks
+                }
+                while pending and not all(complete(i) for i in range(len(components))):
+                    if self._cancelled():
+                        stop.set()
+                    done, _ = wait(pending, timeout=None if self.cancel is None else 0.1,
+                                   return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = pending.pop(future)
+                        try:
+                            best[index] = self._keep_best(best[index], future.result())
+                        except Exception as e:
+                            logger.error(f"多起点求解副本失败: {str(e)}")
+                            failure = failure or e
+                    # 已排满的分量不再等待其余副本
+                    for future in [f for f, i in pending.items() if complete(i) and f.cancel()]:
+                        del pending[future]
+            finally:
+                # 未开始的副本直接取消，运行中的副本看到取消标志后返回，等它们退出再关闭 Manager
+                stop.set()
+                executor.shutdown(wait=True, cancel_futures=True)
+                manager.shutdown()
+            if any(result is None for result in best):
+                raise failure
+
+        self.truncated = any(result.truncated for result in best)
+        schedule = Schedule()
+        errors: List[str] = []
+        for component, result in zip(components, best):
+            self._rebuild(result, component.classes, component.teachers, schedule)
+            errors.extend(result.errors)
+        logger.info(f"多起点求解: {len(components)} 个分量，完成 {len(self.results)}/{len(tasks)} 个起点，"
+                    f"未排 {sum(r.unscheduled for r in best)} 节，"
+                    f"软约束代价 {sum(r.penalty for r in best)}")
+        return schedule, errors
+
+    def _cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.is_set()
+
+    def _keep_best(self, best: Optional[StartResult], result: StartResult) -> StartResult:
+        self.results.append(result)
+        if best is None or result.quality < best.quality:
+            return result
+        return best
+
+    def _rebuild(self, result: StartResult, grade_classes: List[Class],
+                 teachers: List[Teacher], schedule: Schedule):
+        """用调用方的对象把结果写入课表（子进程返回的只是下标）"""
+        subjects: List[Dict[str, object]] = [{s.name: s for s in c.subjects} for c in grade_classes]
+        slots = self.config.slot_grid.slots
+        for ci, subject_name, ti, slot_id in result.lessons:
+            schedule.add_entry(ScheduleEntry(
+                class_info=grade_classes[ci],
+                subject=subjects[ci][subject_name],
+                teacher=teachers[ti],
+                time_slot=slots[slot_id]
+            ))
@@ -0,0 +1,272 @@
+from typing import List, Dict, Iterable, Optional, Tuple
+from dataclasses import dataclass, field
+import logging
+from models import TimeSlot, Teacher, Class, Schedule, ScheduleEntry
+from local_search import LocalSearchImprover
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RescheduleResult:
+    """增量调整结果：新课表以及相对原课表删除/新增的条目"""
+    schedule: Schedule
+    removed: List[ScheduleEntry] = field(default_factory=list)
+    added: List[ScheduleEntry] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+def _entry_key(entry: ScheduleEntry) -> Tuple[str, str, str, TimeSlot]:
+    return (entry.class_info.id, entry.subject.name, entry.teacher.id, entry.time_slot)
+
+class IncrementalRescheduler(LocalSearchImprover):
+    """
+    小范围变更（教师请假、可用时间调整、教师离职）后的增量排课。
+    只拆除受影响的条目，其余课程保持不动，再按改动从少到多的顺序修复：
+    1. 原时间段换一位同科目教师（代课）；
+    2. 移到本班空闲时间段；
+    3. 挤出本班一节课并把它移到空闲时间段（改动两节）。
+    连堂块作为整体修复：只拆掉一半的连堂块整块拆除，放回时占用相邻两节、同一位教师；
+    连堂科目的课时不会被挤出。
+    """
+    def reschedule(self, schedule: Schedule, grade_classes: List[Class], teachers: List[Teacher],
+                   changed_teachers: Iterable[str] = (),
+                   blocked: Optional[Dict[str, Iterable[TimeSlot]]] = None) -> RescheduleResult:
+        """
+        :param schedule: 原课表，不会被修改
+        :param teachers: 当前教师列表；原课表中不在列表里的教师视为离职
+        :param changed_teachers: available_times 已被修改的教师 id，其可用时间位图会被重新编译
+        :param blocked: 教师 id -> 临时不可上课的时间段（如请假），不修改教师本身的可用时间
+        """
+        grid = self.config.slot_grid
+        changed = set(changed_teachers)
+        for teacher in teachers:
+            if teacher.id in changed:
+                teacher.invalidate_availability()
+        blocked_slots = {tid: {grid.id_of(ts) for ts in slots} for tid, slots in (blocked or {}).items()}
+        current = {t.id: t for t in teachers}
+
+        partners = self._block_partners(schedule)
+        ripped_ids = set()
+        for entry in schedule.entries:
+            teacher = current.get(entry.teacher.id)
+            slot_id = grid.id_of(entry.time_slot)
+            if (teacher is None or
+                    not teacher.availability_mask(grid) >> slot_id & 1 or
+                    slot_id in blocked_slots.get(teacher.id, ())):
+                ripped_ids.add(id(entry))
+                # 连堂块不拆开：另一半一起拆除，作为整块修复
+                if id(entry) in partners:
+                    ripped_ids.add(id(partners[id(entry)]))
+        kept, ripped = Schedule(), []
+        for entry in schedule.entries:
+            if id(entry) in ripped_ids:
+                ripped.append(entry)
+            else:
+                kept.add_entry(entry)
+
+        self._load(kept, grade_classes, teachers)
+        for tid, slot_ids in blocked_slots.items():
+            ti = self._teacher_position(tid)
+            if ti is not None:
+                for slot_id in slot_ids:
+                    self.available[ti][slot_id] = False
+
+        # 被拆除的课时优先尝试原时间段，其余（原本就未排的）课时随后尝试；
+        # 待修复项为 (班级, 科目, 原首节, 节数)，连堂块的节数为 2
+        class_positions = {c.id: i for i, c in enumerate(self.classes)}
+        pending: List[Tuple[int, str, Optional[int], int]] = []
+        for entry in ripped:
+            partner = partners.get(id(entry))
+            if partner is not None and grid.id_of(partner.time_slot) < grid.id_of(entry.time_slot):
+                continue  # 连堂块由首节代表
+            ci = class_positions.get(entry.class_info.id)
+            size = 1 if partner is None else 2
+            if ci is not None and self.unscheduled.count((ci, entry.subject.name)) >= size:
+                for _ in range(size):
+                    self.unscheduled.remove((ci, entry.subject.name))
+                pending.append((ci, entry.subject.name, grid.id_of(entry.time_slot), size))
+        missing: Dict[Tuple[int, str], int] = {}
+        for key in self.unscheduled:
+            missing[key] = missing.get(key, 0) + 1
+        for (ci, subject_name), count in missing.items():
+            if self._is_block_lesson(ci, subject_name):
+                pending.extend([(ci, subject_name, None, 2)] * (count // 2))
+                count %= 2
+            pending.extend([(ci, subject_name, None, 1)] * count)
+        self.unscheduled = []
+        for ci, subject_name, original_slot, size in pending:
+            repaired = (self._repair_block(ci, subject_name, original_slot) if size == 2
+                        else self._repair(ci, subject_name, original_slot))
+            if not repaired:
+                self.unscheduled.extend([(ci, subject_name)] * size)
+
+        result = self._build_schedule(self._snapshot())
+        return self._diff(schedule, result, len(ripped))
+
+    def _block_partners(self, schedule: Schedule) -> Dict[int, ScheduleEntry]:
+        """
+        原课表中连堂块的两半：id(条目) -> 另一半。
+        同一班级、同一科目、同一教师在相邻两节的课时从每天最早的一节起两两配对。
+        """
+        grid = self.config.slot_grid
+        lessons: Dict[Tuple[str, str, str], Dict[int, ScheduleEntry]] = {}
+        for entry in schedule.entries:
+            if entry.subject.requires_consecutive_periods:
+                key = (entry.class_info.id, entry.subject.name, entry.teacher.id)
+                lessons.setdefault(key, {})[grid.id_of(entry.time_slot)] = entry
+        partners: Dict[int, ScheduleEntry] = {}
+        for by_slot in lessons.values():
+            for slot_id in sorted(by_slot):
+                second = grid.pair_next.get(slot_id)
+                first_entry, second_entry = by_slot[slot_id], by_slot.get(second)
+                if (second_entry is not None and id(first_entry) not in partners
+                        and id(second_entry) not in partners):
+                    partners[id(first_entry)] = second_entry
+                    partners[id(second_entry)] = first_entry
+        return partners
+
+    def _teacher_position(self, teacher_id: str) -> Optional[int]:
+        for ti, teacher in enumerate(self.teachers):
+            if teacher.id == teacher_id:
+                return ti
+        return None
+
+    # ========== 修复 ==========
+    def _repair(self, ci: int, subject_name: str, original_slot: Optional[int]) -> bool:
+        row = self.cells[ci]
+        if original_slot is not None and row[original_slot] is None:
+            ti = self._pick_teacher(ci, original_slot, subject_name)
+            if ti is not None:
+                self._place(ci, original_slot, subject_name, ti)
+                return True
+        if self._place_in_free_slot(ci, subject_name) is not None:
+            return True
+        return self._place_with_ejection(ci, subject_name)
+
+    def _repair_block(self, ci: int, subject_name: str, original_first: Optional[int]) -> bool:
+        """连堂块：原来的两节换教师，再找空着的相邻两节，最后挤出占着相邻两节的普通课"""
+        row = self.cells[ci]
+        if original_first is not None:
+            second = self.grid.pair_next[original_first]
+            if (row[original_first] is None and row[second] is None and
+                    self._place_block(ci, original_first, second, subject_name) is not None):
+                return True
+        best = None
+        for first, second in self.grid.consecutive_pairs:
+            if row[first] is not None or row[second] is not None:
+                continue
+            day = first // self.periods
+            before = self._day_penalty(ci, day)
+            ti = self._place_block(ci, first, second, subject_name)
+            if ti is None:
+                continue
+            key = self._day_penalty(ci, day) - before
+            self._unplace(ci, second)
+            self._unplace(ci, first)
+            if best is None or key < best[0]:
+                best = (key, first, second, ti)
+        if best is not None:
+            _, first, second, ti = best
+            self._place(ci, first, subject_name, ti)
+            self._place(ci, second, subject_name, ti)
+            return True
+        return self._place_block_with_ejection(ci, subject_name)
+
+    def _place_block_with_ejection(self, ci: int, subject_name: str) -> bool:
+        """挤出相邻两节中的普通课（连堂科目的课时不挤出）放入连堂块，被挤出的课移到空闲时间段"""
+        row = self.cells[ci]
+        for first, second in self.grid.consecutive_pairs:
+            cells = [row[first], row[second]]
+            if all(cell is None for cell in cells) or any(
+                    cell is not None and self._is_block_lesson(ci, cell[0]) for cell in cells):
+                continue
+            evicted = [(slot_id, self._unplace(ci, slot_id))
+                       for slot_id in (first, second) if row[slot_id] is not None]
+            if self._place_block(ci, first, second, subject_name) is not None:
+                moved = []
+                for _, lesson in evicted:
+                    slot_id = self._place_in_free_slot(ci, lesson[0], preferred_teacher=lesson[1])
+                    if slot_id is None:
+                        break
+                    moved.append(slot_id)
+                else:
+                    return True
+                for slot_id in moved:
+                    self._unplace(ci, slot_id)
+                self._unplace(ci, second)
+                self._unplace(ci, first)
+            for slot_id, lesson in evicted:
+                self._place(ci, slot_id, *lesson)
+        return False
+
+    def _place_in_free_slot(self, ci: int, subject_name: str,
+                            preferred_teacher: Optional[int] = None) -> Optional[int]:
+        """放到本班软约束代价增加最少的空闲时间段并返回该时间段；优先保留原教师"""
+        best = None
+        for slot_id, cell in enumerate(self.cells[ci]):
+            if cell is not None:
+                continue
+            if preferred_teacher is not None and self._can_place(ci, slot_id, subject_name, preferred_teacher):
+                ti = preferred_teacher
+            else:
+                ti = self._pick_teacher(ci, slot_id, subject_name)
+            if ti is None:
+                continue
+            day = slot_id // self.periods
+            before = self._day_penalty(ci, day)
+            self._place(ci, slot_id, subject_name, ti)
+            key = (self._day_penalty(ci, day) - before, ti != preferred_teacher)
+            self._unplace(ci, slot_id)
+            if best is None or key < best[0]:
+                best = (key, slot_id, ti)
+        if best is None:
+            return None
+        self._place(ci, best[1], subject_name, best[2])
+        return best[1]
+
+    def _place_with_ejection(self, ci: int, subject_name: str) -> bool:
+        """占用本班某节课的时间段，并把被挤出的课移到空闲时间段（连堂科目的课时不挤出）"""
+        for slot_id, cell in enumerate(self.cells[ci]):
+            if cell is None or cell[0] == subject_name or self._is_block_lesson(ci, cell[0]):
+                continue
+            evicted = self._unplace(ci, slot_id)
+            ti = self._pick_teacher(ci, slot_id, subject_name)
+            if ti is not None:
+                self._place(ci, slot_id, subject_name, ti)
+                if self._place_in_free_slot(ci, evicted[0], preferred_teacher=evicted[1]) is not None:
+                    return True
+                self._unplace(ci, slot_id)
+            self._place(ci, slot_id, *evicted)
+        return False
+
+    # ========== 输出 ==========
+    def _diff(self, original: Schedule, result: Schedule, ripped: int) -> RescheduleResult:
+        """按 (班级, 科目, 教师, 时间段) 比较新旧课表，得到实际改动的条目"""
+        remaining: Dict[Tuple, int] = {}
+        for entry in result.entries:
+            key = _entry_key(entry)
+            remaining[key] = remaining.get(key, 0) + 1
+        removed = []
+        for entry in original.entries:
+            key = _entry_key(entry)
+            if remaining.get(key, 0):
+                remaining[key] -= 1
+            else:
+                removed.append(entry)
+        unchanged: Dict[Tuple, int] = {}
+        for entry in original.entries:
+            key = _entry_key(entry)
+            unchanged[key] = unchanged.get(key, 0) + 1
+        added = []
+        for entry in result.entries:
+            key = _entry_key(entry)
+            if unchanged.get(key, 0):
+                unchanged[key] -= 1
+            else:
+                added.append(entry)
+        logger.info(f"增量排课: 拆除 {ripped} 节，删除 {len(removed)} 条，新增 {len(added)} 条")
+        return RescheduleResult(
+            schedule=result,
+            removed=removed,
+            added=added,
+            errors=self._unscheduled_errors(result)
+        )
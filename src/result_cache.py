@@ -0,0 +1,153 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from datetime import time
+from enum import Enum
+import hashlib
+import json
+import os
+import threading
+import logging
+from models import Teacher, Class, ScheduleConfig
+
+logger = logging.getLogger(__name__)
+
+def _canonical(value: Any) -> Any:
+    """
+    把解析后的模型对象转为只含基本类型的结构：dataclass 取构造参数
+    （跳过下划线开头的缓存字段和时间槽编号），枚举取值，时间取 ISO 格式。
+    列表保持原顺序，因为班级和教师的顺序会影响排课结果。
+    """
+    if is_dataclass(value):
+        return {
+            f.name: _canonical(getattr(value, f.name))
+            for f in fields(value)
+            if f.init and not f.name.startswith('_') and f.name != "slot_id"
+        }
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, time):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+def request_fingerprint(config: ScheduleConfig, grade_classes: List[Class], teachers: List[Teacher],
+                        seed: Optional[int], rules: Dict, response_format: str = "records") -> str:
+    """排课输入的内容哈希：相同的班级、教师、配置、随机种子、规则集和输出格式得到相同的键"""
+    document = {
+        "format": response_format,
+        "config": _canonical(config),
+        "classes": _canonical(grade_classes),
+        "teachers": _canonical(teachers),
+        "seed": seed,
+        "rules": rules
+    }
+    encoded = json.dumps(document, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """
+    按内容哈希缓存排课结果的 LRU 缓存。
+    指定 directory 时每条结果另存为 <键>.json，重启后仍可命中；
+    磁盘上同样最多保留 max_entries 个文件，按修改时间淘汰最久未使用的
+    （命中时更新文件的修改时间）。值需可 JSON 序列化。
+    """
+    def __init__(self, max_entries: int = 128, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, value)
+            return value
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._remember(key, value)
+        self._store(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def clear(self):
+        """清空内存中的缓存和命中计数（不删除磁盘文件）"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def _remember(self, key: str, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key: str) -> Optional[Any]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(self._path(key))
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取缓存文件失败 {key}: {str(e)}")
+            return None
+
+    def _store(self, key: str, value: Any):
+        """先写临时文件再替换，避免并发读到半个文件"""
+        if not self.directory:
+            return
+        temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"写入缓存文件失败 {key}: {str(e)}")
+            return
+        self._evict_files()
+
+    def _evict_files(self):
+        """磁盘上的结果超过 max_entries 个时删除修改时间最早的文件"""
+        try:
+            with os.scandir(self.directory) as it:
+                files = [(e.stat().st_mtime_ns, e.path) for e in it
+                         if e.is_file() and e.name.endswith('.json')]
+        except OSError as e:
+            logger.warning(f"列出缓存目录失败: {str(e)}")
+            return
+        if len(files) <= self.max_entries:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # 其他进程已删除
+            except OSError as e:
+                logger.warning(f"删除缓存文件失败 {path}: {str(e)}")
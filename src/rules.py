@@ -1,8 +1,10 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Set, Optional, Tuple, TypeVar, Generic, Iterable
+from typing import List, Dict, Set, Optional, Tuple, TypeVar, Generic, Iterable, FrozenSet, Any
 from enum import Enum, auto
 from functools import lru_cache
+from collections import OrderedDict
 import itertools
+import weakref
 import logging
 from abc import ABC, abstractmethod
 import json
@@ -87,12 +89,143 @@ class RuleResult:
     passed: bool
     message: str = ""
 
+class RuleIndex(Enum):
+    """规则可以声明依赖的课表索引"""
+    TEACHER_BY_SLOT = auto()       # (教师, 星期, 节次) -> 已排课数
+    CLASS_SUBJECT_BY_DAY = auto()  # (班级, 科目, 星期) -> 已排节次列表
+
+def _teacher_key(teacher: Any) -> str:
+    """
+    教师标识：优先使用工号，没有工号时使用姓名。
+    教师冲突检查和教师索引都按这个键比较（以前只比较姓名）：
+    工号不同的同名教师不再互相冲突，同一工号的教师即使姓名写法不同也视为同一人。
+    本模块的 Teacher 没有工号，仍按姓名比较。
+    """
+    return getattr(teacher, "id", None) or teacher.name
+
+def _class_key(entry: Any) -> str:
+    """班级标识：兼容 models.ScheduleEntry.class_info 与本模块的 student_class"""
+    class_info = getattr(entry, "class_info", None)
+    if class_info is not None:
+        return class_info.id
+    return entry.student_class.name
+
+def _schedule_version(schedule: Any) -> int:
+    """课表版本：models.Schedule 提供全局唯一的版本号，其他课表退化为条目数"""
+    version = getattr(schedule, "version", None)
+    return version if version is not None else len(schedule.entries)
+
+class ScheduleIndex:
+    """
+    规则共享的课表索引，由排课引擎在条目增删时维护（见 RuleManager.notify_entry_added）。
+    只构建已注册规则声明需要的索引；检测到与课表不同步时整体重建。
+    """
+    def __init__(self, kinds: Iterable[RuleIndex] = ()):
+        self.kinds: FrozenSet[RuleIndex] = frozenset(kinds)
+        self.teacher_slots: Dict[Tuple[str, Any, int], int] = {}
+        self.class_subject_days: Dict[Tuple[str, str, Any], List[int]] = {}
+        self._schedule: Optional[Any] = None
+        self._version: Optional[int] = None
+        self._size = 0
+
+    def set_kinds(self, kinds: Iterable[RuleIndex]) -> None:
+        """修改需要维护的索引种类，下次使用时重建"""
+        kinds = frozenset(kinds)
+        if kinds != self.kinds:
+            self.kinds = kinds
+            self._schedule = None
+
+    def ensure(self, schedule: Any) -> 'ScheduleIndex':
+        """确保索引与课表同步"""
+        if self._schedule is not schedule or self._version != _schedule_version(schedule):
+            self.rebuild(schedule)
+        return self
+
+    def rebuild(self, schedule: Any) -> None:
+        self.teacher_slots.clear()
+        self.class_subject_days.clear()
+        for entry in schedule.entries:
+            self._add(entry)
+        self._schedule = schedule
+        self._size = len(schedule.entries)
+        self._version = _schedule_version(schedule)
+
+    def entry_added(self, schedule: Any, entry: Any) -> None:
+        if self._schedule is schedule and self._size + 1 == len(schedule.entries):
+            self._add(entry)
+            self._size += 1
+            self._version = _schedule_version(schedule)
+        else:
+            self.rebuild(schedule)
+
+    def entry_removed(self, schedule: Any, entry: Any) -> None:
+        if self._schedule is schedule and self._size - 1 == len(schedule.entries):
+            self._remove(entry)
+            self._size -= 1
+            self._version = _schedule_version(schedule)
+        else:
+            self.rebuild(schedule)
+
+    def teacher_busy(self, entry: Any) -> bool:
+        """条目的教师在该时间段是否已有课程"""
+        slot = entry.time_slot
+        return self.teacher_slots.get((_teacher_key(entry.teacher), slot.weekday, slot.period), 0) > 0
+
+    def subject_periods(self, entry: Any) -> List[int]:
+        """条目所在班级当天已排该科目的节次"""
+        return self.class_subject_days.get(
+            (_class_key(entry), entry.subject.name, entry.time_slot.weekday), [])
+
+    def _add(self, entry: Any) -> None:
+        slot = entry.time_slot
+        if RuleIndex.TEACHER_BY_SLOT in self.kinds:
+            key = (_teacher_key(entry.teacher), slot.weekday, slot.period)
+            self.teacher_slots[key] = self.teacher_slots.get(key, 0) + 1
+        if RuleIndex.CLASS_SUBJECT_BY_DAY in self.kinds:
+            key = (_class_key(entry), entry.subject.name, slot.weekday)
+            self.class_subject_days.setdefault(key, []).append(slot.period)
+
+    def _remove(self, entry: Any) -> None:
+        slot = entry.time_slot
+        if RuleIndex.TEACHER_BY_SLOT in self.kinds:
+            key = (_teacher_key(entry.teacher), slot.weekday, slot.period)
+            self.teacher_slots[key] -= 1
+        if RuleIndex.CLASS_SUBJECT_BY_DAY in self.kinds:
+            key = (_class_key(entry), entry.subject.name, slot.weekday)
+            self.class_subject_days[key].remove(slot.period)
+
 class Rule(ABC):
+    # 规则依赖的课表索引；声明后 check 会收到 ScheduleIndex，未声明的规则自行扫描课表
+    required_indexes: FrozenSet[RuleIndex] = frozenset()
+
     def __init__(self, name: str, rule_type: RuleType, priority: RulePriority):
         self.name = name
         self.type = rule_type
         self.priority = priority
-        self.enabled = True
+        self._enabled = True
+        # 注册了本规则的 RuleManager；启用状态变化时只通知这些管理器重新编译流水线
+        self._managers: 'weakref.WeakSet[RuleManager]' = weakref.WeakSet()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        if value != self._enabled:
+            self._enabled = value
+            for manager in self._managers:
+                manager.state_version += 1
+
+    def __getstate__(self):
+        # 弱引用集合无法 pickle（多进程求解会复制规则），由 RuleManager 反序列化时重新登记
+        state = self.__dict__.copy()
+        del state['_managers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._managers = weakref.WeakSet()
 
     @abstractmethod
     def check(self, schedule: Schedule, entry: ScheduleEntry) -> RuleResult:
@@ -100,6 +233,8 @@ class Rule(ABC):
 
 class SubjectConsecutiveRule(Rule):
     """科目连堂限制规则"""
+    required_indexes = frozenset({RuleIndex.CLASS_SUBJECT_BY_DAY})
+
     def __init__(self, max_consecutive: int = 2):
         super().__init__(
             "科目连堂限制",
@@ -108,16 +243,22 @@ class SubjectConsecutiveRule(Rule):
         )
         self.max_consecutive = max_consecutive
 
-    def check(self, schedule: Schedule, entry: ScheduleEntry) -> RuleResult:
-        same_subject_entries = [
-            e for e in schedule.entries
-            if e.subject.name == entry.subject.name
-               and e.time_slot.weekday == entry.time_slot.weekday
-        ]
+    def check(self, schedule: Schedule, entry: ScheduleEntry,
+              index: Optional[ScheduleIndex] = None) -> RuleResult:
+        if index is not None:
+            same_subject_periods = index.subject_periods(entry)
+        else:
+            class_key = _class_key(entry)
+            same_subject_periods = [
+                e.time_slot.period for e in schedule.entries
+                if e.subject.name == entry.subject.name
+                   and e.time_slot.weekday == entry.time_slot.weekday
+                   and _class_key(e) == class_key
+            ]
 
         consecutive_count = 1
-        for e in same_subject_entries:
-            if abs(e.time_slot.period - entry.time_slot.period) == 1:
+        for period in same_subject_periods:
+            if abs(period - entry.time_slot.period) == 1:
                 consecutive_count += 1
 
         if consecutive_count > self.max_consecutive:
@@ -129,6 +270,8 @@ class SubjectConsecutiveRule(Rule):
 
 class TeacherAvailabilityRule(Rule):
     """教师时间冲突检查"""
+    required_indexes = frozenset({RuleIndex.TEACHER_BY_SLOT})
+
     def __init__(self):
         super().__init__(
             name="教师可用性检查",
@@ -136,15 +279,20 @@ class TeacherAvailabilityRule(Rule):
             priority=RulePriority.MANDATORY
         )
 
-    def check(self, schedule: Schedule, entry: ScheduleEntry) -> RuleResult:
-        conflicting_entries = [
-            e for e in schedule.entries
-            if e.teacher.name == entry.teacher.name
-               and e.time_slot.weekday == entry.time_slot.weekday
-               and e.time_slot.period == entry.time_slot.period
-        ]
+    def check(self, schedule: Schedule, entry: ScheduleEntry,
+              index: Optional[ScheduleIndex] = None) -> RuleResult:
+        if index is not None:
+            has_conflict = index.teacher_busy(entry)
+        else:
+            teacher_key = _teacher_key(entry.teacher)
+            has_conflict = any(
+                _teacher_key(e.teacher) == teacher_key
+                and e.time_slot.weekday == entry.time_slot.weekday
+                and e.time_slot.period == entry.time_slot.period
+                for e in schedule.entries
+            )
 
-        if conflicting_entries:
+        if has_conflict:
             return RuleResult(
                 False,
                 f"教师 '{entry.teacher.name}' 在该时段已有其他课程"
@@ -397,50 +545,108 @@ class InteractiveScheduler:
             )
         print()
 
+@dataclass
+class RuleCacheInfo:
+    """规则检查缓存统计"""
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
 class RuleManager:
     """规则管理器，用于管理和执行所有规则"""
-    def __init__(self):
+    def __init__(self, cache_size: int = 4096):
+        """
+        :param cache_size: 规则检查结果缓存的最大条数（LRU 淘汰），0 表示不缓存
+        """
         self.rules: Dict[RuleType, List[Rule]] = {
             rule_type: [] for rule_type in RuleType
         }
-        self._rule_cache = {}
+        # 键为 (课表版本, 班级, 科目, 教师, 星期, 节次)，课表修改后版本号变化，旧结果自然失效
+        self._rule_cache: 'OrderedDict[Tuple, Tuple[bool, Tuple[str, ...]]]' = OrderedDict()
+        self.cache_size = cache_size
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_evictions = 0
+        # 编译后的规则流水线：(check, 是否需要索引, 是否强制规则, 错误前缀)，强制规则在前
+        self._pipeline: Tuple[Tuple, ...] = ()
+        self._pipeline_state: Optional[int] = None
+        # 本管理器中任一规则启用状态变化时递增，据此判断是否需要重新编译规则流水线
+        self.state_version = 0
+        # 规则共享的课表索引，只维护已注册规则声明需要的部分
+        self.index = ScheduleIndex()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for rules in self.rules.values():
+            for rule in rules:
+                rule._managers.add(self)
 
     def add_rule(self, rule: Rule) -> None:
         """添加规则"""
         self.rules[rule.type].append(rule)
-        self._clear_cache()
+        rule._managers.add(self)
+        self._update_index_kinds()
+        self._compile_pipeline()
         logger.info(f"添加规则: {rule.name}")
 
     def remove_rule(self, rule: Rule) -> None:
         """移除规则"""
         if rule in self.rules[rule.type]:
             self.rules[rule.type].remove(rule)
-            self._clear_cache()
+            if rule not in self.rules[rule.type]:
+                rule._managers.discard(self)
+            self._update_index_kinds()
+            self._compile_pipeline()
             logger.info(f"移除规则: {rule.name}")
 
+    def notify_entry_added(self, schedule: Schedule, entry: ScheduleEntry) -> None:
+        """排课引擎在条目加入课表后调用，增量更新规则索引"""
+        if self.index.kinds:
+            self.index.entry_added(schedule, entry)
+
+    def notify_entry_removed(self, schedule: Schedule, entry: ScheduleEntry) -> None:
+        """排课引擎在条目移出课表后调用，增量更新规则索引"""
+        if self.index.kinds:
+            self.index.entry_removed(schedule, entry)
+
     def check_all_rules(self, schedule: Schedule, entry: ScheduleEntry) -> Tuple[bool, List[str]]:
         """检查所有规则"""
+        if self._pipeline_state != self.state_version:
+            self._compile_pipeline()
         cache_key = self._get_cache_key(schedule, entry)
-        if cache_key in self._rule_cache:
-            return self._rule_cache[cache_key]
-
+        if cache_key is not None:
+            cached = self._rule_cache.get(cache_key)
+            if cached is not None:
+                self._rule_cache.move_to_end(cache_key)
+                self._cache_hits += 1
+                # 缓存中保存的是元组，每次返回新的列表，调用方修改返回值不会影响缓存
+                return cached[0], list(cached[1])
+            self._cache_misses += 1
+
+        index = self.index.ensure(schedule) if self.index.kinds else None
         errors = []
-        for rule_type in RuleType:
-            for rule in sorted(self.rules[rule_type],
-                               key=lambda r: r.priority.value):
-                if not rule.enabled:
-                    continue
-
-                result = rule.check(schedule, entry)
-                if not result.passed:
-                    errors.append(f"[{rule.name}] {result.message}")
-                    if rule.priority == RulePriority.MANDATORY:
-                        self._rule_cache[cache_key] = (False, errors)
-                        return False, errors
-
-        result = (len(errors) == 0, errors)
-        self._rule_cache[cache_key] = result
-        return result
+        for check, uses_index, mandatory, prefix in self._pipeline:
+            result = check(schedule, entry, index) if uses_index else check(schedule, entry)
+            if not result.passed:
+                errors.append(prefix + result.message)
+                if mandatory:
+                    self._store_result(cache_key, (False, tuple(errors)))
+                    return False, errors
+
+        self._store_result(cache_key, (len(errors) == 0, tuple(errors)))
+        return len(errors) == 0, errors
+
+    def cache_info(self) -> RuleCacheInfo:
+        """获取规则检查缓存的命中/未命中/淘汰统计"""
+        return RuleCacheInfo(
+            hits=self._cache_hits,
+            misses=self._cache_misses,
+            evictions=self._cache_evictions,
+            size=len(self._rule_cache),
+            maxsize=self.cache_size
+        )
 
     def get_active_rules(self, rule_type: Optional[RuleType] = None) -> List[Rule]:
         """获取活动的规则"""
@@ -449,13 +655,52 @@ class RuleManager:
         return [rule for rules in self.rules.values()
                 for rule in rules if rule.enabled]
 
+    def _compile_pipeline(self) -> None:
+        """
+        将启用的规则编译为按优先级排好序的扁平元组（强制规则在前，同优先级保持规则类型顺序）。
+        在增删规则或任意规则启停时重新编译，并清空检查缓存。
+        """
+        rules = [rule for rule_type in RuleType for rule in self.rules[rule_type] if rule.enabled]
+        rules.sort(key=lambda r: r.priority.value)
+        self._pipeline = tuple(
+            (rule.check, bool(rule.required_indexes),
+             rule.priority == RulePriority.MANDATORY, f"[{rule.name}] ")
+            for rule in rules
+        )
+        self._pipeline_state = self.state_version
+        self._clear_cache()
+
+    def _update_index_kinds(self) -> None:
+        """根据已注册规则重新计算需要维护的索引"""
+        self.index.set_kinds(
+            kind for rules in self.rules.values() for rule in rules
+            for kind in rule.required_indexes
+        )
+
     def _clear_cache(self) -> None:
         """清除规则检查缓存"""
         self._rule_cache.clear()
 
-    def _get_cache_key(self, schedule: Schedule, entry: ScheduleEntry) -> str:
-        """生成缓存键"""
-        return f"{id(schedule)}_{id(entry)}"
+    def _get_cache_key(self, schedule: Schedule, entry: ScheduleEntry) -> Optional[Tuple]:
+        """
+        生成缓存键：课表版本号 + 条目取值。
+        没有版本号的课表无法判断是否被修改，返回 None 表示不缓存。
+        """
+        version = getattr(schedule, "version", None)
+        if version is None or self.cache_size <= 0:
+            return None
+        slot = entry.time_slot
+        return (version, _class_key(entry), entry.subject.name,
+                _teacher_key(entry.teacher), slot.weekday, slot.period)
+
+    def _store_result(self, cache_key: Optional[Tuple], result: Tuple[bool, Tuple[str, ...]]) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的结果"""
+        if cache_key is None:
+            return
+        self._rule_cache[cache_key] = result
+        if len(self._rule_cache) > self.cache_size:
+            self._rule_cache.popitem(last=False)
+            self._cache_evictions += 1
 
     def create_default_rules(self) -> None:
         """创建默认规则集"""
@@ -466,13 +711,18 @@ class RuleManager:
         logger.info("已创建默认规则集")
 
     def to_dict(self) -> Dict:
-        """将规则配置转换为字典格式"""
+        """将规则配置转换为字典格式；params 为规则自身的参数（如 max_consecutive）"""
         return {
             rule_type.name: [
                 {
                     "name": rule.name,
+                    "class": type(rule).__name__,
                     "priority": rule.priority.name,
-                    "enabled": rule.enabled
+                    "enabled": rule.enabled,
+                    "params": {
+                        key: value for key, value in sorted(vars(rule).items())
+                        if not key.startswith('_') and key not in ("name", "type", "priority")
+                    }
                 }
                 for rule in rules
             ]
@@ -0,0 +1,317 @@
+"""
+排课接口的请求处理（不依赖 Flask）：请求解析、结果缓存键、排课任务和增量调整任务本身。
+main.py 的路由和后台任务队列的子进程都调用这里的函数，子进程不需要导入 main.py。
+"""
+from typing import Callable, Dict, List, Optional, Tuple, Type
+from dataclasses import fields
+from datetime import time
+from enum import Enum
+import logging
+import math
+import threading
+from models import (
+    TimeSlot, Teacher, Subject, Class, Schedule, ScheduleEntry, ScheduleConfig, TimeTable,
+    SlotGrid, WeekDay, DayPart, Grade, Priority
+)
+from rules import RuleManager
+from scheduler import SchedulerService
+from reschedule import IncrementalRescheduler
+from result_cache import ResultCache, request_fingerprint
+from schedule_format import RESPONSE_FORMATS, format_schedule_entries
+
+logger = logging.getLogger(__name__)
+
+# 单次排课的时间预算上限（秒），请求中的 time_limit 只能更短
+SCHEDULE_TIME_LIMIT = 30.0
+
+def parse_enum(enum_cls: Type[Enum], value):
+    """按值（如 "星期一"）或名称（如 "monday"，不区分大小写）解析枚举；年级另外接受 "1"~"6" """
+    if isinstance(value, enum_cls):
+        return value
+    try:
+        return enum_cls(value)
+    except ValueError:
+        pass
+    name = str(value).strip().upper()
+    if enum_cls is Grade and name.isdigit():
+        name = f"GRADE_{name}"
+    try:
+        return enum_cls[name]
+    except KeyError:
+        raise ValueError(f"无效的{enum_cls.__name__}: {value!r}")
+
+def parse_time(time_str) -> time:
+    if isinstance(time_str, str):
+        time_part = time_str.split('T')[-1].split('+')[0].split('Z')[0]
+        try:
+            return time.fromisoformat(time_part)
+        except ValueError:
+            raise ValueError(f"无法解析的时间格式: '{time_str}' -> '{time_part}'")
+    if isinstance(time_str, time):
+        return time_str
+    raise TypeError(f"预期时间为字符串或 time 对象，收到: {type(time_str)}")
+
+def _require_dict(value, what: str) -> Dict:
+    """请求中应为 JSON 对象的部分；其他类型（列表、字符串等）抛出 ValueError，而不是在 .get 处抛出 AttributeError"""
+    if not isinstance(value, dict):
+        raise ValueError(f"{what}应为对象，收到: {type(value).__name__}")
+    return value
+
+def _init_fields(model_cls, data: Dict) -> Dict:
+    """只保留模型构造函数接受的字段，前端附带的其他字段（如 allow_split_class）忽略"""
+    names = {f.name for f in fields(model_cls) if f.init and not f.name.startswith('_')}
+    return {k: v for k, v in data.items() if k in names}
+
+def parse_schedule_request(data: Dict) -> Tuple[List[Class], List[Teacher], ScheduleConfig]:
+    """
+    把排课请求的 JSON 数据解析为班级、教师和排课配置。
+    枚举字段接受中文值或英文名称（如 "星期一" 或 "monday"）；
+    timetable 可以放在请求顶层或 schedule_config 中；
+    schedule_config 未给出 grade 和 class_ids 时取自班级列表。
+    只读取请求数据，同一份请求可以被再次解析（缓存键计算、后台任务）。
+    """
+    _require_dict(data, "排课请求")
+    config_data = dict(_require_dict(data.get('schedule_config') or {
+        "name": "小学课表",
+        "weekdays": ["monday", "tuesday", "wednesday", "thursday", "friday"],
+        "allow_consecutive_same_subject": True,
+        "max_consecutive_same_subject": 2,
+        "min_subject_interval": 1
+    }, "schedule_config"))
+
+    # 1. 时间表
+    timetable_data = dict(_require_dict(data.get('timetable') or config_data.get('timetable') or {}, "timetable"))
+    try:
+        for key in ('morning_start', 'afternoon_start', 'evening_start'):
+            if timetable_data.get(key) is None:
+                timetable_data.pop(key, None)  # 未给出时使用时间表的默认开始时间
+            else:
+                timetable_data[key] = parse_time(timetable_data[key])
+        timetable = TimeTable(**_init_fields(TimeTable, timetable_data))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"解析时间表配置错误: {e}")
+
+    # 2. 班级和科目；Subject 没有按时段限制的字段，只接受覆盖全部时段的 allowed_day_parts
+    used_parts = {timetable.get_day_part(p) for p in range(1, timetable.get_total_periods() + 1)}
+    default_grade = config_data.get('grade')
+    classes = []
+    for c_data in data.get('classes', []):
+        _require_dict(c_data, "班级数据")
+        try:
+            subjects = []
+            for s_data in c_data.get('subjects', []):
+                s_data = dict(_require_dict(s_data, "科目数据"))
+                if 'allowed_day_parts' in s_data:
+                    allowed = {parse_enum(DayPart, dp) for dp in s_data['allowed_day_parts']}
+                    if not used_parts <= allowed:
+                        raise ValueError(f"科目 '{s_data.get('name')}' 不支持限定上课时段")
+                s_data['priority'] = parse_enum(Priority, s_data.get('priority', 'MEDIUM'))
+                subjects.append(Subject(**_init_fields(Subject, s_data)))
+            c_data = {**c_data, 'subjects': subjects,
+                      'grade': parse_enum(Grade, c_data.get('grade', default_grade))}
+            classes.append(Class(**_init_fields(Class, c_data)))
+        except (KeyError, ValueError, TypeError) as e:
+            raise ValueError(f"解析班级 {c_data.get('name', '未知')} 错误: {e}")
+
+    # 3. 教师（可用时间可按节次或上课时间给出，两者都给出时须一致）
+    teachers = []
+    for t_data in data.get('teachers', []):
+        _require_dict(t_data, "教师数据")
+        available_times = []
+        for ts in t_data.get('available_times', []):
+            try:
+                period = _require_dict(ts, "可用时间").get('period')
+                if ts.get('start_time') is not None:
+                    start_time = parse_time(ts['start_time'])
+                    start_period = timetable.period_at(start_time)
+                    if start_period is None or (period is not None and period != start_period):
+                        raise ValueError(f"{start_time.strftime('%H:%M')} 不是第 {period or '?'} 节的上课时间")
+                    period = start_period
+                    end_time = timetable.get_period_time(period)[1]
+                    if ts.get('end_time') is not None and parse_time(ts['end_time']) != end_time:
+                        raise ValueError(f"第 {period} 节的下课时间应为 {end_time.strftime('%H:%M')}")
+                if period is None:
+                    raise KeyError('period')
+                available_times.append(TimeSlot(
+                    weekday=parse_enum(WeekDay, ts['weekday']),
+                    period=period,
+                    day_part=timetable.get_day_part(period)
+                ))
+            except (KeyError, ValueError, TypeError) as e:
+                raise ValueError(f"解析教师 {t_data.get('name', '未知')} 可用时间错误: {e}")
+        try:
+            teachers.append(Teacher(**_init_fields(Teacher, {**t_data, 'available_times': available_times})))
+        except TypeError as e:
+            raise ValueError(f"解析教师 {t_data.get('name', '未知')} 错误: {e}")
+
+    # 4. 排课配置
+    try:
+        config_data['weekdays'] = [parse_enum(WeekDay, wd) for wd in config_data.get(
+            'weekdays', ["monday", "tuesday", "wednesday", "thursday", "friday"])]
+        if config_data.get('grade') is not None:
+            config_data['grade'] = parse_enum(Grade, config_data['grade'])
+        elif classes:
+            config_data['grade'] = classes[0].grade
+        config_data.setdefault('name', "小学课表")
+        config_data.setdefault('class_ids', [c.id for c in classes])
+        config_data['timetable'] = timetable
+        schedule_config = ScheduleConfig(**_init_fields(ScheduleConfig, config_data))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"解析排课配置错误: {e}")
+
+    return classes, teachers, schedule_config
+
+def create_rule_manager() -> RuleManager:
+    rule_manager = RuleManager()
+    rule_manager.create_default_rules()
+    return rule_manager
+
+def schedule_cache_key(data: Dict) -> Optional[str]:
+    """排课请求的结果缓存键；请求无法解析时返回 None，由排课流程报告错误"""
+    try:
+        classes, teachers, schedule_config = parse_schedule_request(data)
+    except Exception:
+        return None
+    return request_fingerprint(schedule_config, classes, teachers,
+                               data.get('seed'), create_rule_manager().to_dict(),
+                               response_format=data.get('format', 'records'))
+
+def store_schedule_result(cache: ResultCache, key: Optional[str], payload: Dict, status: int) -> bool:
+    """
+    完整求解的结果写入缓存并返回 True。
+    无法解析的请求（没有键）、出错的请求和时间预算用尽或被取消的部分课表
+    （与机器负载有关）不缓存。
+    """
+    if not key or status != 200 or payload.get("truncated", True):
+        return False
+    cache.put(key, payload)
+    return True
+
+def run_schedule_job(data: Dict, progress: Optional[Callable[[str, Dict], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> Tuple[Dict, int]:
+    """
+    解析请求并排课，返回 (响应数据, HTTP 状态码)。
+    为模块级函数，同步接口直接调用，排课任务队列在子进程中调用。
+    progress 与 cancel 传给排课器（见 scheduler.SmartScheduler），供流式接口使用；
+    class_done 事件中的课表条目在这里转为与 /create_schedule 相同的逐条格式。
+    """
+    if not isinstance(data, dict):
+        return {"success": False, "schedule": [], "errors": ["排课请求应为 JSON 对象"]}, 400
+    response_format = data.get('format', 'records')
+    if response_format not in RESPONSE_FORMATS:
+        return {
+            "success": False,
+            "schedule": [],
+            "errors": [f"未知的输出格式: {response_format}，可选 {', '.join(RESPONSE_FORMATS)}"]
+        }, 400
+    try:
+        classes, teachers, schedule_config = parse_schedule_request(data)
+        # 请求可以缩短时间预算，但不能超过服务端上限；NaN 与任何数比较都为假，会绕过 min，须单独拒绝
+        time_limit = float(data.get('time_limit', SCHEDULE_TIME_LIMIT))
+        if not math.isfinite(time_limit) or time_limit <= 0:
+            raise ValueError(f"time_limit 应为正数: {data['time_limit']!r}")
+        time_limit = min(time_limit, SCHEDULE_TIME_LIMIT)
+    except (ValueError, TypeError, AttributeError) as e:
+        return {"success": False, "schedule": [], "errors": [str(e)]}, 400
+
+    engine_options = {}
+    if progress is not None:
+        def report(event: str, payload: Dict):
+            if event == "class_done":
+                payload = {"class_id": payload["class_id"], "class_name": payload["class_name"],
+                           "schedule": format_schedule_entries(payload["entries"], schedule_config.slot_grid)}
+            progress(event, payload)
+        engine_options["progress"] = report
+    if cancel is not None:
+        engine_options["cancel"] = cancel
+
+    service = SchedulerService(schedule_config, create_rule_manager(),
+                               seed=data.get('seed'), time_limit=time_limit, **engine_options)
+    result = service.create_schedule(classes, teachers, response_format)
+    if "infeasible" in result:
+        # 求解前的容量检查：必然无解的输入直接返回原因
+        return result, 422
+    if "truncated" not in result:
+        # 服务层捕获了排课过程中的异常
+        return result, 500
+    return {
+        "success": result["success"],
+        "format": response_format,
+        "schedule": result["schedule"],
+        "errors": result["errors"] or None,
+        "truncated": result["truncated"]
+    }, 200
+
+def parse_grid_slot(grid: SlotGrid, ts_data: Dict, where: str) -> TimeSlot:
+    """把 {"weekday", "period"} 解析为网格中的时间槽；星期或节次无效时抛出 ValueError"""
+    try:
+        weekday = parse_enum(WeekDay, ts_data['weekday'])
+        period = ts_data['period']
+        if not isinstance(period, int) or isinstance(period, bool):
+            raise ValueError(f"节次应为整数: {period!r}")
+        return grid.get(weekday, period)
+    except (KeyError, ValueError, TypeError) as e:
+        # grid.get 对网格外的时间段抛出 KeyError，其消息本身已说明原因
+        reason = e.args[0] if isinstance(e, KeyError) and e.args and isinstance(e.args[0], str) else e
+        raise ValueError(f"{where}的时间段无效: {reason}")
+
+def parse_current_schedule(entries_data: List[Dict], classes: List[Class], teachers: List[Teacher],
+                           grid: SlotGrid) -> Tuple[Schedule, List[str]]:
+    """
+    还原增量调整请求中的现有课表，返回 (课表, 说明)。
+    班级或科目不在请求中的条目无法还原，不放入课表并在说明中列出；
+    已不在教师列表中的教师视为离职，其课程由增量调整重排。
+    """
+    classes_by_id = {c.id: c for c in classes}
+    teachers_by_id = {t.id: t for t in teachers}
+    schedule, skipped = Schedule(), []
+    for e_data in entries_data:
+        if not isinstance(e_data, dict):
+            raise ValueError(f"课表条目应为对象: {e_data!r}")
+        try:
+            class_id, subject_name, teacher_id = e_data['class_id'], e_data['subject'], e_data['teacher_id']
+        except KeyError as e:
+            raise ValueError(f"课表条目缺少字段: {e}")
+        time_slot = parse_grid_slot(grid, e_data, f"课表条目（{class_id} {subject_name}）")
+        class_ = classes_by_id.get(class_id)
+        subject = next((s for s in class_.subjects if s.name == subject_name), None) if class_ else None
+        if subject is None:
+            reason = "班级不存在" if class_ is None else "该班级没有这个科目"
+            skipped.append(f"课表条目 {class_id} {subject_name}（{time_slot.weekday.value} 第{time_slot.period}节）"
+                           f"无法还原：{reason}")
+            continue
+        teacher = teachers_by_id.get(teacher_id) or Teacher(
+            id=teacher_id, name=e_data.get('teacher_name', ''), subjects=[subject.name])
+        schedule.add_entry(ScheduleEntry(class_info=class_, subject=subject, teacher=teacher, time_slot=time_slot))
+    return schedule, skipped
+
+def run_reschedule_job(data: Dict) -> Tuple[Dict, int]:
+    """
+    增量调整已有课表，返回 (响应数据, HTTP 状态码)。请求格式见 main.py 的 /reschedule。
+    修复时的候选位置需通过与 /create_schedule 相同的默认规则。
+    """
+    try:
+        classes, teachers, schedule_config = parse_schedule_request(data)
+        grid = schedule_config.slot_grid
+        current, skipped = parse_current_schedule(data.get('schedule') or [], classes, teachers, grid)
+        changes = data.get('changes') or {}
+        if not isinstance(changes, dict) or not isinstance(changes.get('blocked') or {}, dict):
+            raise ValueError("changes 与 changes.blocked 应为对象")
+        blocked = {
+            tid: [parse_grid_slot(grid, ts, f"教师 {tid} 的请假") for ts in slots]
+            for tid, slots in (changes.get('blocked') or {}).items()
+        }
+        changed_teachers = list(changes.get('changed_teachers') or [])
+    except (ValueError, TypeError, AttributeError) as e:
+        return {"success": False, "schedule": [], "errors": [str(e)]}, 400
+
+    result = IncrementalRescheduler(schedule_config, create_rule_manager(), seed=data.get('seed')).reschedule(
+        current, classes, teachers, changed_teachers=changed_teachers, blocked=blocked)
+    errors = skipped + result.errors
+    return {
+        "success": len(errors) == 0,
+        "schedule": format_schedule_entries(result.schedule.entries, grid),
+        "removed": format_schedule_entries(result.removed, grid),
+        "added": format_schedule_entries(result.added, grid),
+        "errors": errors or None
+    }, 200
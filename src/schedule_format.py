@@ -0,0 +1,88 @@
+from typing import Dict, List, Tuple, Union
+import json
+from models import ScheduleEntry, SlotGrid, WeekDay
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，没有时使用标准库 json
+    orjson = None
+
+RESPONSE_FORMATS = ("records", "columnar")
+
+# 星期按一周中的顺序排序，而不是按中文名称的字符串顺序
+WEEKDAY_ORDER: Dict[WeekDay, int] = {wd: i for i, wd in enumerate(WeekDay)}
+
+def entry_sort_key(entry: ScheduleEntry) -> Tuple[str, int, int]:
+    """按班级、星期、节次排序"""
+    return (entry.class_info.id, WEEKDAY_ORDER[entry.time_slot.weekday], entry.time_slot.period)
+
+def format_schedule_entries(entries: List[ScheduleEntry], grid: SlotGrid) -> List[Dict]:
+    """课表条目转为接口输出格式（每节课一个对象），按班级和时间排序"""
+    period_times = grid.period_times
+    return [
+        {
+            "class_id": entry.class_info.id,
+            "class_name": entry.class_info.name,
+            "subject": entry.subject.name,
+            "teacher_id": entry.teacher.id,
+            "teacher_name": entry.teacher.name,
+            "weekday": entry.time_slot.weekday.value,
+            "period": entry.time_slot.period,
+            "time": period_times[entry.time_slot.period - 1],
+            "day_part": entry.time_slot.day_part.value
+        }
+        for entry in sorted(entries, key=entry_sort_key)
+    ]
+
+def format_schedule_columnar(entries: List[ScheduleEntry], grid: SlotGrid) -> Dict:
+    """
+    紧凑的列式输出：班级、教师、科目各自只出现一次（查找表按 id/名称排序），
+    条目为四个等长的整数数组，分别是查找表下标和时间段编号
+    slot = 星期下标 * periods_per_day + 节次 - 1（星期下标对应 weekdays）。
+    条目按 (班级下标, 时间段编号) 排序。
+    """
+    classes = {e.class_info.id: e.class_info for e in entries}
+    teachers = {e.teacher.id: e.teacher for e in entries}
+    class_ids = sorted(classes)
+    teacher_ids = sorted(teachers)
+    subject_names = sorted({e.subject.name for e in entries})
+    class_index = {cid: i for i, cid in enumerate(class_ids)}
+    teacher_index = {tid: i for i, tid in enumerate(teacher_ids)}
+    subject_index = {name: i for i, name in enumerate(subject_names)}
+
+    rows = sorted(
+        (class_index[e.class_info.id], grid.id_of(e.time_slot),
+         subject_index[e.subject.name], teacher_index[e.teacher.id])
+        for e in entries
+    )
+    periods = grid.periods_per_day
+    return {
+        "classes": [{"id": cid, "name": classes[cid].name} for cid in class_ids],
+        "teachers": [{"id": tid, "name": teachers[tid].name} for tid in teacher_ids],
+        "subjects": subject_names,
+        "weekdays": [wd.value for wd in grid.weekdays],
+        "periods_per_day": periods,
+        "day_parts": [grid.slots[period].day_part.value for period in range(periods)],
+        "period_times": list(grid.period_times),
+        "entries": {
+            "class": [row[0] for row in rows],
+            "slot": [row[1] for row in rows],
+            "subject": [row[2] for row in rows],
+            "teacher": [row[3] for row in rows]
+        }
+    }
+
+def format_schedule(entries: List[ScheduleEntry], grid: SlotGrid,
+                    response_format: str = "records") -> Union[List[Dict], Dict]:
+    """按请求的格式输出课表："records"（默认）或 "columnar" """
+    if response_format == "columnar":
+        return format_schedule_columnar(entries, grid)
+    if response_format != "records":
+        raise ValueError(f"未知的输出格式: {response_format}")
+    return format_schedule_entries(entries, grid)
+
+def dumps(payload) -> bytes:
+    """序列化为 UTF-8 JSON；安装了 orjson 时使用它"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
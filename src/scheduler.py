@@ -1,73 +1,176 @@
-from typing import List, Dict, Set, Optional, Tuple
+from typing import List, Dict, Set, Optional, Tuple, Callable
 from dataclasses import dataclass
+from functools import partial
+import heapq
 import random
+import threading
+import time
 import logging
 from models import (
-    TimeSlot, Subject, Teacher, Class, Schedule,
-    ScheduleEntry, ScheduleConfig, WeekDay, DayPart, TimeTable, Priority
+    TimeSlot, Subject, Teacher, Class, Schedule, DenseSchedule,
+    ScheduleEntry, ScheduleConfig, WeekDay, DayPart, TimeTable, Priority, np
 )
 from rules import RuleManager
+from csp_scheduler import CSPScheduler
+from local_search import LocalSearchImprover, merge_errors
+from multistart import MultiStartScheduler
+from matching import hopcroft_karp, UNMATCHED
+from feasibility import check_feasibility
+from day_planner import plan_day_quotas, DayQuotas
+from schedule_format import format_schedule
 
 logger = logging.getLogger(__name__)
 
 class SmartScheduler:
-    def __init__(self, config: ScheduleConfig, rule_manager: RuleManager):
+    PROGRESS_INTERVAL = 0.2  # 两次 progress 事件之间的最短间隔（秒）
+
+    def __init__(self, config: ScheduleConfig, rule_manager: RuleManager,
+                 backend: str = "list", seed: Optional[int] = None,
+                 day_quotas: bool = True, time_limit: Optional[float] = None,
+                 progress: Optional[Callable[[str, Dict], None]] = None,
+                 cancel: Optional[threading.Event] = None):
+        """
+        :param backend: 课表存储后端，"list" 为默认的索引列表，
+                        "dense" 使用 NumPy 稠密数组并对候选科目/教师做向量化筛选
+        :param seed: 随机种子；为 None 时使用全局 random 模块
+        :param day_quotas: 先把各科目周课时分配到各天，逐节排课时只在当天配额内选科目
+        :param time_limit: 时间预算（秒），用尽时停止并返回已排好的部分课表，None 表示不限
+        :param progress: 进度回调 progress(事件名, 数据)：
+                         "progress" 含已排/待排课时数、当前时间段和耗时（最多每 PROGRESS_INTERVAL 秒一次，结束时再给一次），
+                         "class_done" 含班级 id、名称和该班课表条目，在班级课时全部排完时给出，
+                         未排满的班级在结束时给出
+        :param cancel: 被 set 后在下一个时间段前停止，返回已排好的部分课表（truncated 为 True）
+        """
+        if backend not in ("list", "dense"):
+            raise ValueError(f"未知的课表后端: {backend}")
+        if backend == "dense" and np is None:
+            raise ImportError("dense 后端需要安装 numpy")
         self.config = config
         self.rule_manager = rule_manager
+        self.backend = backend
+        self.use_day_quotas = day_quotas
+        self.day_quotas: Optional[DayQuotas] = None
+        self.time_limit = time_limit
+        self.truncated = False  # 最近一次排课是否因时间预算用尽或被取消而提前结束
+        self.progress = progress
+        self.cancel = cancel
+        self.random = random.Random(seed) if seed is not None else random
         self.schedule = Schedule()
         # 添加科目课时追踪器
         self.subject_hours_tracker: Dict[Tuple[str, str], int] = {}  # (class_id, subject_name) -> scheduled_hours
+        # 每个班级每天各科目已排课时数，随排课增量维护
+        self.day_subject_counts: Dict[Tuple[str, WeekDay], Dict[str, int]] = {}  # (class_id, weekday) -> {subject_name: count}
+        # 已占用的 (班级, 时间段) 集合
+        self.class_slot_occupied: Set[Tuple[str, int]] = set()  # (class_id, slot_id)
+        # 每个 (时间段, 科目) 当前可用且空闲的教师，保持教师原始顺序
+        self.free_teacher_pools: Dict[Tuple[int, str], Dict[str, Teacher]] = {}  # (slot_id, subject_name) -> {teacher_id: Teacher}
         # 添加教师分组字典
         self.teachers_by_subject: Dict[str, List[Teacher]] = {}  # subject_name -> List[Teacher]
+        # 教师当天/本周已排课时，以及按科目的负载小顶堆（惰性删除过期项）
+        self.teacher_week_load: Dict[str, int] = {}  # teacher_id -> hours
+        self.teacher_day_load: Dict[str, int] = {}  # teacher_id -> 当前堆所在那一天的课时
+        self.teacher_heaps: Dict[str, List[Tuple[int, int, int, str]]] = {}  # subject_name -> [(day_load, week_load, 顺序, teacher_id)]
+        self._heap_weekday: Optional[WeekDay] = None
+        self._teachers_by_id: Dict[str, Teacher] = {}
+        # 进度统计：每个班级还差几节课
+        self._class_lessons_left: Dict[str, int] = {}
 
     def generate_schedule(self, grade_classes: List[Class], 
                          teachers: List[Teacher]) -> Tuple[Schedule, List[str]]:
         """使用贪心算法生成课表，优先填满每个时间段"""
         errors = []
+        self.truncated = False
+        deadline = time.monotonic() + self.time_limit if self.time_limit is not None else None
         
-        # 初始化科目课时追踪器
+        # 初始化课表和科目课时追踪器
+        if self.backend == "dense":
+            self._init_dense_backend(grade_classes, teachers)
+        else:
+            self.schedule = Schedule()
         self._init_subject_hours_tracker(grade_classes)
+        self._init_occupancy_trackers()
+        # 第一阶段：各科目每天的课时配额
+        if self.use_day_quotas:
+            self.day_quotas, plan_errors = plan_day_quotas(self.config, grade_classes, deadline)
+            errors.extend(plan_errors)
         
-        # 1. 生成并排序时间段（上午优先）
+        # 1. 获取时间段（网格已按星期、节次排好序，上午在前）
         all_time_slots = self._generate_available_time_slots()
-        all_time_slots.sort(key=lambda x: (
-            x.weekday.value,  # 按星期排序
-            x.day_part != DayPart.MORNING,  # 上午优先
-            x.period  # 早的课节优先
-        ))
         
         # 2. 获取所有可用教师和他们可教授的科目
         self.teachers_by_subject = self._group_teachers_by_subject(teachers)
+        self._init_free_teacher_pools(teachers)
+        self._init_teacher_loads(teachers)
+        
+        self._init_progress(grade_classes)
         
         # 3. 对每个时间段进行遍历
         for time_slot in all_time_slots:
+            if deadline is not None and time.monotonic() >= deadline:
+                self.truncated = True
+                errors.append(f"排课达到时间预算 {self.time_limit} 秒，"
+                              f"在 {time_slot.weekday.value} 第{time_slot.period}节 处停止，返回部分课表")
+                break
+            if self.cancel is not None and self.cancel.is_set():
+                self.truncated = True
+                errors.append(f"排课已被取消，在 {time_slot.weekday.value} 第{time_slot.period}节 处停止，返回部分课表")
+                break
+            if time_slot.weekday != self._heap_weekday:
+                self._start_day(time_slot.weekday)
             # 随机打乱班级顺序，以保证公平性
             shuffled_classes = list(grade_classes)
-            random.shuffle(shuffled_classes)
+            self.random.shuffle(shuffled_classes)
             
-            # 对每个班级安排这个时间段的课程
-            for class_ in shuffled_classes:
-                if self._has_class_at_time(class_, time_slot):
-                    continue
-                
-                # 获取并排序可用科目
-                available_subjects = self._get_available_subjects(class_, time_slot)
-                if not available_subjects:
-                    continue
-                
-                # 尝试为该班级安排课程
-                scheduled = self._try_schedule_class(
-                    class_=class_,
-                    time_slot=time_slot,
-                    available_subjects=available_subjects,
-                    teachers_by_subject=self.teachers_by_subject
-                )
-                
-                if not scheduled:
-                    errors.append(f"无法为 {class_.name} 在 {time_slot.weekday.value} 第{time_slot.period}节 安排课程")
+            # 该时间段的 班级-教师 分配作为二分图最大匹配求解，尽可能填满所有班级
+            for class_ in self._schedule_time_slot(time_slot, shuffled_classes):
+                errors.append(f"无法为 {class_.name} 在 {time_slot.weekday.value} 第{time_slot.period}节 安排课程")
+            if self.progress is not None and time.monotonic() - self._last_progress >= self.PROGRESS_INTERVAL:
+                self._report_progress(time_slot)
 
+        if self.progress is not None:
+            self._finish_progress(grade_classes)
         return self.schedule, errors
 
+    # ========== 进度事件 ==========
+    def _init_progress(self, classes: List[Class]):
+        self._class_lessons_left = {c.id: sum(s.weekly_hours for s in c.subjects) for c in classes}
+        self._classes_done: Set[str] = set()
+        self._lessons_total = sum(self._class_lessons_left.values())
+        self._started = self._last_progress = time.monotonic()
+
+    def _class_progress(self, class_: Class):
+        """班级又排入一节课；课时全部排完时发出 class_done"""
+        self._class_lessons_left[class_.id] -= 1
+        if self.progress is not None and self._class_lessons_left[class_.id] == 0:
+            self._class_done(class_)
+
+    def _class_done(self, class_: Class):
+        self._classes_done.add(class_.id)
+        self.progress("class_done", {
+            "class_id": class_.id,
+            "class_name": class_.name,
+            "entries": self.schedule.get_class_schedule(class_.id)
+        })
+
+    def _report_progress(self, time_slot: Optional[TimeSlot] = None):
+        now = time.monotonic()
+        self._last_progress = now
+        placed = self._lessons_total - sum(self._class_lessons_left.values())
+        self.progress("progress", {
+            "placed": placed,
+            "remaining": self._lessons_total - placed,
+            "weekday": time_slot.weekday.value if time_slot else None,
+            "period": time_slot.period if time_slot else None,
+            "elapsed": round(now - self._started, 3)
+        })
+
+    def _finish_progress(self, classes: List[Class]):
+        """结束时给出最终进度，以及未排满（或因停止而未排完）的班级课表"""
+        self._report_progress()
+        for class_ in classes:
+            if class_.id not in self._classes_done:
+                self._class_done(class_)
+
     def _init_subject_hours_tracker(self, classes: List[Class]):
         """初始化科目课时追踪器"""
         self.subject_hours_tracker.clear()
@@ -75,9 +178,189 @@ class SmartScheduler:
             for subject in class_.subjects:
                 self.subject_hours_tracker[(class_.id, subject.name)] = 0
 
+    def _init_occupancy_trackers(self):
+        """初始化按天科目计数和班级时间段占用"""
+        self.day_subject_counts.clear()
+        self.class_slot_occupied.clear()
+
+    def _init_free_teacher_pools(self, teachers: List[Teacher]):
+        """按时间段和科目预先建立空闲教师池（已考虑教师可用时间）"""
+        self.free_teacher_pools.clear()
+        grid = self.config.slot_grid
+        for teacher in teachers:
+            free_mask = teacher.free_slots_mask(grid, self.schedule.teacher_busy_mask(teacher.id))
+            for time_slot in grid:
+                if free_mask >> time_slot.slot_id & 1:
+                    for subject_name in teacher.subjects:
+                        pool = self.free_teacher_pools.setdefault((time_slot.slot_id, subject_name), {})
+                        pool[teacher.id] = teacher
+
+    def _record_entry(self, entry: ScheduleEntry):
+        """条目加入课表后同步更新各项计数"""
+        class_id = entry.class_info.id
+        self.subject_hours_tracker[(class_id, entry.subject.name)] += 1
+        day_subjects = self.day_subject_counts.setdefault((class_id, entry.time_slot.weekday), {})
+        day_subjects[entry.subject.name] = day_subjects.get(entry.subject.name, 0) + 1
+        self.class_slot_occupied.add((class_id, entry.time_slot.slot_id))
+        # 教师在该时间段不再空闲，从其所有科目的教师池中移除
+        self._retire_teacher(entry.teacher, [entry.time_slot.slot_id])
+        self._record_teacher_load(entry)
+        self._class_progress(entry.class_info)
+
+    def _retire_teacher(self, teacher: Teacher, slot_ids: List[int]):
+        """教师在这些时间段不再可排（已占用或达到课时上限）"""
+        for slot_id in slot_ids:
+            for subject_name in teacher.subjects:
+                pool = self.free_teacher_pools.get((slot_id, subject_name))
+                if pool:
+                    pool.pop(teacher.id, None)
+        if self.backend == "dense":
+            self._teacher_available[self.schedule.teacher_index[teacher.id], slot_ids] = False
+
+    # ========== 教师负载 ==========
+    def _init_teacher_loads(self, teachers: List[Teacher]):
+        self._teachers_by_id = {t.id: t for t in teachers}
+        self._teacher_order = {t.id: i for i, t in enumerate(teachers)}
+        self.teacher_week_load = {t.id: 0 for t in teachers}
+        self.teacher_day_load = {t.id: 0 for t in teachers}
+        self._heap_weekday = None
+
+    def _start_day(self, weekday: WeekDay):
+        """进入新的一天：当天课时清零，按周课时重建各科目的负载堆（O(k)）"""
+        self._heap_weekday = weekday
+        for tid in self.teacher_day_load:
+            self.teacher_day_load[tid] = 0
+        self.teacher_heaps = {}
+        for subject_name, teachers in self.teachers_by_subject.items():
+            heap = [(0, self.teacher_week_load[t.id], self._teacher_order[t.id], t.id) for t in teachers]
+            heapq.heapify(heap)
+            self.teacher_heaps[subject_name] = heap
+
+    def _record_teacher_load(self, entry: ScheduleEntry):
+        """更新教师负载并压入新的堆项（旧项在弹出时按负载不一致丢弃），达到上限时退出后续时间段"""
+        teacher = entry.teacher
+        tid = teacher.id
+        self.teacher_week_load[tid] += 1
+        self.teacher_day_load[tid] += 1
+        grid = self.config.slot_grid
+        if self.teacher_week_load[tid] >= teacher.max_hours_per_week:
+            self._retire_teacher(teacher, range(entry.time_slot.slot_id + 1, len(grid)))
+        elif self.teacher_day_load[tid] >= teacher.max_hours_per_day:
+            day_end = (grid.day_index[entry.time_slot.weekday] + 1) * grid.periods_per_day
+            self._retire_teacher(teacher, range(entry.time_slot.slot_id + 1, day_end))
+        item = (self.teacher_day_load[tid], self.teacher_week_load[tid], self._teacher_order[tid], tid)
+        for subject_name in teacher.subjects:
+            heapq.heappush(self.teacher_heaps[subject_name], item)
+
+    def _least_loaded_teacher(self, subject_name: str, time_slot: TimeSlot, block: bool,
+                              preferred: Set[str]) -> Optional[Teacher]:
+        """
+        选择当天、其次本周课时最少的候选教师：该时间段空闲（连堂块还需下一节空闲且留有两节余量），
+        且未被本时段其他班级首选。
+        堆顶的过期项（负载已变化）直接弹出丢弃；其余不合格的教师不出堆，
+        按堆序遍历（辅助小顶堆保存待访问的下标），只访问负载比结果低的项，
+        不修改科目负载堆，也不需要先建立候选集合。
+        """
+        heap = self.teacher_heaps.get(subject_name)
+        if not heap:
+            return None
+        while heap and self._stale(heap[0]):
+            heapq.heappop(heap)
+        pool = self.free_teacher_pools.get((time_slot.slot_id, subject_name), {})
+        next_pool = None
+        if block:
+            next_slot_id = self.config.slot_grid.pair_next[time_slot.slot_id]
+            next_pool = self.free_teacher_pools.get((next_slot_id, subject_name), {})
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            item, i = heapq.heappop(frontier)
+            tid = item[3]
+            if (tid in pool and tid not in preferred and not self._stale(item) and
+                    (next_pool is None or (tid in next_pool and self._has_block_capacity(pool[tid])))):
+                return pool[tid]
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return None
+
+    def _stale(self, item: Tuple[int, int, int, str]) -> bool:
+        """堆项记录的负载与教师当前负载不一致（之后又排了课）"""
+        day_load, week_load, _, tid = item
+        return day_load != self.teacher_day_load[tid] or week_load != self.teacher_week_load[tid]
+
+    def _has_block_capacity(self, teacher: Teacher) -> bool:
+        """连堂块两节一起排入，教师当天和本周都需留有两节余量"""
+        return (self.teacher_day_load[teacher.id] + 2 <= teacher.max_hours_per_day and
+                self.teacher_week_load[teacher.id] + 2 <= teacher.max_hours_per_week)
+
+    def _init_dense_backend(self, classes: List[Class], teachers: List[Teacher]):
+        """创建稠密数组课表，并预先计算 科目×教师、教师×时间段、班级×科目 矩阵"""
+        grid = self.config.slot_grid
+        subject_names = list(dict.fromkeys(
+            [s.name for c in classes for s in c.subjects] +
+            [name for t in teachers for name in t.subjects]
+        ))
+        self.schedule = DenseSchedule(
+            grid=grid,
+            class_ids=[c.id for c in classes],
+            teacher_ids=[t.id for t in teachers],
+            subject_names=subject_names
+        )
+        subject_index = self.schedule.subject_index
+        self._dense_teachers = list(teachers)
+        self._can_teach = np.zeros((len(subject_names), len(teachers)), dtype=bool)
+        self._teacher_available = np.zeros((len(teachers), len(grid)), dtype=bool)
+        for ti, teacher in enumerate(teachers):
+            mask = teacher.availability_mask(grid)
+            self._teacher_available[ti] = [mask >> i & 1 for i in range(len(grid))]
+            for name in teacher.subjects:
+                self._can_teach[subject_index[name], ti] = True
+        shape = (len(classes), len(subject_names))
+        self._weekly_hours = np.zeros(shape, dtype=np.int16)
+        self._max_per_day = np.zeros(shape, dtype=np.int16)
+        self._priority = np.zeros(shape, dtype=np.int8)
+        self._class_subjects: List[Dict[int, Subject]] = []
+        for ci, class_ in enumerate(classes):
+            by_index = {}
+            for subject in class_.subjects:
+                si = subject_index[subject.name]
+                by_index[si] = subject
+                self._weekly_hours[ci, si] = subject.weekly_hours
+                self._max_per_day[ci, si] = subject.max_periods_per_day
+                self._priority[ci, si] = subject.priority.value
+            self._class_subjects.append(by_index)
+
+    def _dense_free_teachers(self, time_slot: TimeSlot):
+        """某时间段所有教师是否空闲的布尔向量"""
+        slot_id = time_slot.slot_id
+        return self._teacher_available[:, slot_id] & ~self.schedule.teacher_busy_at(slot_id)
+
+    def _get_available_subjects_dense(self, class_: Class, time_slot: TimeSlot) -> List[Subject]:
+        """向量化版本：一次性计算该时间段所有科目的候选掩码和排序键"""
+        ci = self.schedule.class_index[class_.id]
+        day = self.config.slot_grid.day_index[time_slot.weekday]
+        teacher_counts = self._can_teach.astype(np.int16) @ self._dense_free_teachers(time_slot)
+        day_counts = self.schedule.subject_day_counts[ci, :, day]
+        remaining = self._weekly_hours[ci] - self.schedule.subject_day_counts[ci].sum(axis=1)
+        candidates = np.flatnonzero(
+            (remaining > 0) & (day_counts < self._max_per_day[ci]) & (teacher_counts > 0))
+        # 与列表版本的排序键一致（np.lexsort 以最后一个键为主键）
+        order = np.lexsort((
+            -teacher_counts[candidates],
+            day_counts[candidates],
+            -remaining[candidates],
+            self._priority[ci, candidates],
+        ))
+        subjects = self._class_subjects[ci]
+        return [subjects[si] for si in candidates[order]
+                if self._subject_allowed(class_, subjects[si], time_slot, int(day_counts[si]))]
+
     def _get_available_subjects(self, class_: Class, time_slot: TimeSlot) -> List[Subject]:
         """获取可用科目列表，并按优先级排序"""
+        if self.backend == "dense":
+            return self._get_available_subjects_dense(class_, time_slot)
         available_subjects = []
+        teacher_counts: Dict[str, int] = {}  # 每个科目的可用教师数，只计算一次
         
         # 获取当天该班级已安排的科目
         day_subjects = self._get_day_subjects(class_, time_slot.weekday)
@@ -90,8 +373,10 @@ class SmartScheduler:
             if (scheduled_hours < subject.weekly_hours and  # 还有剩余课时
                 day_count < subject.max_periods_per_day):   # 未超出每日限制
                 # 检查是否有可用教师
-                available_teachers = self._get_available_teachers_for_subject(subject.name, time_slot)
-                if available_teachers:  # 只有有可用教师时才添加科目
+                count = len(self.free_teacher_pools.get((time_slot.slot_id, subject.name), ()))
+                # 只有有可用教师时才添加科目；连堂科目还需能从本节开始排一个连堂块
+                if count and self._subject_allowed(class_, subject, time_slot, day_count):
+                    teacher_counts[subject.name] = count
                     available_subjects.append(subject)
         
         # 优化排序策略
@@ -100,87 +385,176 @@ class SmartScheduler:
                          s.priority.value,  # 优先级高的优先
                          -(s.weekly_hours - self.subject_hours_tracker.get((class_.id, s.name), 0)),  # 剩余课时多的优先
                          day_subjects.get(s.name, 0),  # 当天安排少的优先
-                         -len(self._get_available_teachers_for_subject(s.name, time_slot))  # 可用教师少的优先
+                         -teacher_counts[s.name]  # 可用教师少的优先
                      ))
 
+    def _day_quota_left(self, class_: Class, subject: Subject, time_slot: TimeSlot) -> Optional[int]:
+        """当天配额还剩几节；未做配额规划时返回 None"""
+        if self.day_quotas is None:
+            return None
+        day = self.config.slot_grid.day_index[time_slot.weekday]
+        quota = self.day_quotas[(class_.id, subject.name)][day]
+        return quota - self._get_day_subjects(class_, time_slot.weekday).get(subject.name, 0)
+
+    def _is_block(self, class_: Class, subject: Subject, time_slot: TimeSlot) -> bool:
+        """
+        该科目在这一天是否应作为连堂块（两节）排入。
+        剩余奇数课时的最后一节、或当天配额只剩一节时按单节排。
+        """
+        if not subject.requires_consecutive_periods:
+            return False
+        if subject.weekly_hours - self.subject_hours_tracker.get((class_.id, subject.name), 0) < 2:
+            return False
+        left = self._day_quota_left(class_, subject, time_slot)
+        return left is None or left >= 2
+
+    def _subject_allowed(self, class_: Class, subject: Subject, time_slot: TimeSlot, day_count: int) -> bool:
+        """
+        基本条件之外的检查：当天配额未用完；
+        连堂块需要当天未超上限，且有教师在两节都空闲。
+        """
+        left = self._day_quota_left(class_, subject, time_slot)
+        if left is not None and left <= 0:
+            return False
+        if not self._is_block(class_, subject, time_slot):
+            return True
+        return (day_count + 2 <= subject.block_day_limit() and
+                bool(self._get_block_teachers(class_, subject.name, time_slot)))
+
+    def _get_block_teachers(self, class_: Class, subject_name: str, time_slot: TimeSlot) -> List[Teacher]:
+        """能上从该时间段开始的连堂块的教师；该时间段不是连堂首节或班级下一节已有课时为空"""
+        next_slot_id = self.config.slot_grid.pair_next.get(time_slot.slot_id)
+        if next_slot_id is None or (class_.id, next_slot_id) in self.class_slot_occupied:
+            return []
+        next_slot = self.config.slot_grid.slots[next_slot_id]
+        free_next = {t.id for t in self._get_available_teachers_for_subject(subject_name, next_slot)}
+        return [t for t in self._get_available_teachers_for_subject(subject_name, time_slot)
+                if t.id in free_next and self._has_block_capacity(t)]
+
     def _get_available_teachers_for_subject(self, subject_name: str, time_slot: TimeSlot) -> List[Teacher]:
         """获取某个科目在指定时间段的可用教师"""
-        available_teachers = []
-        for teacher in self.teachers_by_subject.get(subject_name, []):
-            if not any(
-                e.time_slot.weekday == time_slot.weekday and
-                e.time_slot.period == time_slot.period and
-                e.teacher.id == teacher.id
-                for e in self.schedule.entries
-            ):
-                available_teachers.append(teacher)
-        return available_teachers
-
-    def _try_schedule_class(self, class_: Class, time_slot: TimeSlot,
-                          available_subjects: List[Subject],
-                          teachers_by_subject: Dict[str, List[Teacher]]) -> bool:
-        """尝试为班级安排课程"""
-        for subject in available_subjects:
-            # 获取可用教师
-            available_teachers = teachers_by_subject.get(subject.name, [])
-            if not available_teachers:
+        if self.backend == "dense":
+            si = self.schedule.subject_index.get(subject_name)
+            if si is None:
+                return []
+            free = self._can_teach[si] & self._dense_free_teachers(time_slot)
+            return [self._dense_teachers[ti] for ti in np.flatnonzero(free)]
+        return list(self.free_teacher_pools.get((time_slot.slot_id, subject_name), {}).values())
+
+    def _schedule_time_slot(self, time_slot: TimeSlot, classes: List[Class]) -> List[Class]:
+        """
+        用二分图最大匹配为一个时间段安排课程。
+        左侧为该时段空闲且有可排科目的班级，右侧为空闲教师；
+        班级与教师之间的边取该教师能教的、班级排序最靠前的科目，
+        且该节课（连堂块为两节）需通过 rule_manager 的全部规则。
+        返回有候选科目却未能安排的班级。
+        """
+        candidates: List[Tuple[Class, Dict[int, Subject]]] = []
+        adjacency: List[List[int]] = []
+        teachers: List[Teacher] = []
+        teacher_positions: Dict[str, int] = {}
+        preferred: Dict[str, Set[str]] = {}  # 科目 -> 本时段已被其他班级首选的教师
+        for class_ in classes:
+            if self._has_class_at_time(class_, time_slot):
                 continue
-            
-            # 选择一个可用的教师
-            teacher = self._find_available_teacher(available_teachers, time_slot)
-            if teacher:
-                # 创建课程条目
-                entry = ScheduleEntry(
-                    class_info=class_,
-                    subject=subject,
-                    teacher=teacher,
-                    time_slot=time_slot
-                )
-                
-                # 添加到课表
-                if self.schedule.add_entry(entry):
-                    # 更新科目课时计数
-                    self.subject_hours_tracker[(class_.id, subject.name)] += 1
-                    return True
-        
-        return False
+            available_subjects = self._get_available_subjects(class_, time_slot)
+            if not available_subjects:
+                continue
+            edges: Dict[int, Subject] = {}  # 教师下标 -> 科目，保持偏好顺序
+            for subject in available_subjects:
+                block = self._is_block(class_, subject, time_slot)
+                if block:
+                    available_teachers = self._get_block_teachers(class_, subject.name, time_slot)
+                else:
+                    available_teachers = self._get_available_teachers_for_subject(subject.name, time_slot)
+                ranked = self._rank_teachers(subject.name, available_teachers, time_slot, block,
+                                             preferred.setdefault(subject.name, set()))
+                slots = self._lesson_slots(time_slot, block)
+                for teacher in ranked:
+                    if not self._passes_rules(class_, subject, teacher, slots):
+                        continue
+                    ti = teacher_positions.get(teacher.id)
+                    if ti is None:
+                        ti = teacher_positions[teacher.id] = len(teachers)
+                        teachers.append(teacher)
+                    edges.setdefault(ti, subject)
+            candidates.append((class_, edges))
+            adjacency.append(list(edges))
+
+        unfilled = []
+        for (class_, edges), ti in zip(candidates, hopcroft_karp(adjacency, len(teachers))):
+            if ti == UNMATCHED:
+                unfilled.append(class_)
+                continue
+            subject = edges[ti]
+            # 连堂块的两节作为一个整体排入（匹配时已确认教师两节都空闲）
+            slots = self._lesson_slots(time_slot, self._is_block(class_, subject, time_slot))
+            entries = [
+                ScheduleEntry(class_info=class_, subject=subject, teacher=teachers[ti], time_slot=slot)
+                for slot in slots
+            ]
+            if not self._add_entries(entries):
+                unfilled.append(class_)
+                continue
+            for entry in entries:
+                # 更新科目课时、当天科目和时间段占用计数
+                self._record_entry(entry)
+        return unfilled
+
+    def _lesson_slots(self, time_slot: TimeSlot, block: bool) -> List[TimeSlot]:
+        """一次排入的时间段：单节为该时间段，连堂块另加下一节"""
+        if not block:
+            return [time_slot]
+        grid = self.config.slot_grid
+        return [time_slot, grid.slots[grid.pair_next[time_slot.slot_id]]]
+
+    def _passes_rules(self, class_: Class, subject: Subject, teacher: Teacher, slots: List[TimeSlot]) -> bool:
+        """建边时的规则检查：各节分别对当前课表检查（连堂块两节之间的关系在排入时再检查）"""
+        return all(
+            self.rule_manager.check_all_rules(self.schedule, ScheduleEntry(
+                class_info=class_, subject=subject, teacher=teacher, time_slot=slot))[0]
+            for slot in slots
+        )
+
+    def _add_entries(self, entries: List[ScheduleEntry]) -> bool:
+        """
+        逐条检查冲突和规则后加入课表并通知 rule_manager；
+        同一时段先排入的其他班级、连堂块的前一节都已在课表中参与检查。
+        任一条不通过时撤销本次已加入的条目并返回 False。
+        """
+        added = []
+        for entry in entries:
+            if (self.schedule.has_conflicts(entry) or
+                    not self.rule_manager.check_all_rules(self.schedule, entry)[0] or
+                    not self.schedule.add_entry(entry)):
+                for done in reversed(added):
+                    self.schedule.remove_entry(done)
+                    self.rule_manager.notify_entry_removed(self.schedule, done)
+                return False
+            self.rule_manager.notify_entry_added(self.schedule, entry)
+            added.append(entry)
+        return True
 
     def _has_class_at_time(self, class_: Class, time_slot: TimeSlot) -> bool:
         """检查班级在指定时间段是否已有课程"""
-        return any(
-            e.class_info.id == class_.id and
-            e.time_slot.weekday == time_slot.weekday and
-            e.time_slot.period == time_slot.period
-            for e in self.schedule.entries
-        )
+        return (class_.id, time_slot.slot_id) in self.class_slot_occupied
 
     def _get_day_subjects(self, class_: Class, weekday: WeekDay) -> Dict[str, int]:
-        """获取班级某一天已安排的科目及其课时数"""
-        day_subjects = {}
-        for entry in self.schedule.entries:
-            if (entry.class_info.id == class_.id and
-                entry.time_slot.weekday == weekday):
-                if entry.subject.name not in day_subjects:
-                    day_subjects[entry.subject.name] = 0
-                day_subjects[entry.subject.name] += 1
-        return day_subjects
-
-    def _find_available_teacher(self, teachers: List[Teacher], time_slot: TimeSlot) -> Optional[Teacher]:
-        """找到当前时间段可用的教师"""
-        # 随机打乱教师列表以实现负载均衡
-        shuffled_teachers = list(teachers)
-        random.shuffle(shuffled_teachers)
-        
-        for teacher in shuffled_teachers:
-            # 检查教师在该时间段是否已经被安排
-            if not any(
-                e.time_slot.weekday == time_slot.weekday and
-                e.time_slot.period == time_slot.period and
-                e.teacher.id == teacher.id
-                for e in self.schedule.entries
-            ):
-                return teacher
-        return None
+        """获取班级某一天已安排的科目及其课时数（返回内部计数字典，调用方不应修改）"""
+        return self.day_subject_counts.get((class_.id, weekday), {})
+
+    def _rank_teachers(self, subject_name: str, teachers: List[Teacher], time_slot: TimeSlot,
+                       block: bool, preferred: Set[str]) -> List[Teacher]:
+        """
+        候选教师的偏好顺序：尚未被本时段其他班级首选的教师中负载最低的排在最前
+        （匹配的贪心初始解选它），同一时段需要同一科目的多个班级因此依次分到
+        负载第 1、2、… 低的教师；其余保持原顺序，仅在增广时使用。
+        """
+        best = self._least_loaded_teacher(subject_name, time_slot, block, preferred)
+        if best is None:
+            return teachers
+        preferred.add(best.id)
+        return [best] + [t for t in teachers if t is not best]
 
     def _group_teachers_by_subject(self, teachers: List[Teacher]) -> Dict[str, List[Teacher]]:
         """将教师按科目分组"""
@@ -193,59 +567,86 @@ class SmartScheduler:
         return result
 
     def _generate_available_time_slots(self) -> List[TimeSlot]:
-        """生成所有可用的时间段"""
-        time_slots = []
-        for weekday in self.config.weekdays:
-            # 上午课程
-            for period in range(1, self.config.timetable.periods_per_morning + 1):
-                time_slots.append(TimeSlot(
-                    weekday=weekday,
-                    period=period,
-                    day_part=DayPart.MORNING
-                ))
-            
-            # 下午课程
-            for period in range(1, self.config.timetable.periods_per_afternoon + 1):
-                # 注意：这里修改了下午课程的period计算方式
-                actual_period = self.config.timetable.periods_per_morning + period
-                time_slots.append(TimeSlot(
-                    weekday=weekday,
-                    period=actual_period,
-                    day_part=DayPart.AFTERNOON
-                ))
-            
-            # 晚上课程
-            if self.config.timetable.periods_per_evening > 0:
-                start_period = (self.config.timetable.periods_per_morning + 
-                              self.config.timetable.periods_per_afternoon + 1)
-                for period in range(1, self.config.timetable.periods_per_evening + 1):
-                    actual_period = start_period + period - 1
-                    time_slots.append(TimeSlot(
-                        weekday=weekday,
-                        period=actual_period,
-                        day_part=DayPart.EVENING
-                    ))
-        
-        return time_slots
+        """获取所有可用的时间段（复用配置中的时间槽网格，不再重复创建对象）"""
+        return list(self.config.slot_grid.slots)
 
 class SchedulerService:
     """排课服务类"""
-    def __init__(self, config: ScheduleConfig, rule_manager: RuleManager):
-        self.scheduler = SmartScheduler(config, rule_manager)
+    ENGINES = ("greedy", "csp")
 
-    def create_schedule(self, grade_classes: List[Class],
-                       teachers: List[Teacher]) -> Dict:
-        """创建课表的服务方法"""
+    def __init__(self, config: ScheduleConfig, rule_manager: RuleManager,
+                 backend: str = "list", engine: str = "greedy",
+                 improve_time: float = 0.0, starts: int = 1,
+                 max_workers: Optional[int] = None, decompose: bool = False,
+                 precheck: bool = True, **engine_options):
+        """
+        :param engine: 排课引擎，"greedy" 为逐时间段贪心填充，
+                       "csp" 为带 MRV 和前向检查的回溯搜索（engine_options 可传 node_limit、time_limit、seed），
+                       engine_options 其余参数原样传给引擎（如贪心引擎的 day_quotas、progress、cancel）；
+                       两种引擎都接受 time_limit，用尽时返回部分课表并标记 truncated
+        :param improve_time: 引擎结束后局部搜索修复阶段的时间预算（秒），0 表示不修复
+        :param starts: 多起点求解的起点个数，大于 1 时在进程池中并行运行不同种子的引擎副本
+        :param max_workers: 多起点求解的进程数，默认等于 CPU 核数
+        :param decompose: 按共享教师拆分为独立的连通分量并行求解后合并
+        :param precheck: 求解前先做容量与计数检查，必然无解时直接返回原因
+        """
+        seed = engine_options.pop("seed", None)
+        multistart = starts > 1 or decompose
+        # 多起点求解时取消标志由 MultiStartScheduler 转给各子进程中的副本
+        cancel = engine_options.pop("cancel", None) if multistart else None
+        if engine == "greedy":
+            engine_factory = partial(SmartScheduler, config, rule_manager, backend=backend, **engine_options)
+        elif engine == "csp":
+            engine_factory = partial(CSPScheduler, config, rule_manager, **engine_options)
+        else:
+            raise ValueError(f"未知的排课引擎: {engine}")
+
+        self.config = config
+        self.precheck = precheck
+        self.improver = None
+        self.improve_time = improve_time
+        if multistart:
+            # 每个起点各自做局部搜索，服务层不再重复修复
+            self.scheduler = MultiStartScheduler(
+                engine_factory, config, starts=starts, max_workers=max_workers,
+                seed=seed, improve_time=improve_time, decompose=decompose, cancel=cancel)
+        else:
+            self.scheduler = engine_factory(seed=seed)
+            if improve_time > 0:
+                self.improver = LocalSearchImprover(config, rule_manager, seed=seed)
+
+    def create_schedule(self, grade_classes: List[Class], teachers: List[Teacher],
+                        response_format: str = "records") -> Dict:
+        """
+        创建课表的服务方法
+        :param response_format: "records" 每节课一个对象；"columnar" 为查找表加整数数组的紧凑格式
+        """
         try:
+            if self.precheck:
+                report = check_feasibility(self.config, grade_classes, teachers)
+                if not report.feasible:
+                    return {
+                        "success": False,
+                        "schedule": [],
+                        "errors": report.messages(),
+                        "infeasible": report.to_dict()
+                    }
+
             schedule, errors = self.scheduler.generate_schedule(
                 grade_classes=grade_classes,
                 teachers=teachers
             )
+            if self.improver is not None:
+                schedule, improve_errors = self.improver.improve(
+                    schedule, grade_classes, teachers, self.improve_time,
+                    day_quotas=getattr(self.scheduler, "day_quotas", None))
+                errors = merge_errors(errors, improve_errors)
 
             return {
                 "success": len(errors) == 0,
-                "schedule": self._format_schedule(schedule),
-                "errors": errors
+                "schedule": self._format_schedule(schedule, response_format),
+                "errors": errors,
+                "truncated": getattr(self.scheduler, "truncated", False)
             }
 
         except Exception as e:
@@ -256,21 +657,6 @@ class SchedulerService:
                 "errors": [f"系统错误: {str(e)}"]
             }
 
-    def _format_schedule(self, schedule: Schedule) -> List[Dict]:
-        """格式化课表输出"""
-        formatted = []
-        for entry in schedule.entries:
-            formatted.append({
-                "class_id": entry.class_info.id,
-                "class_name": entry.class_info.name,
-                "subject": entry.subject.name,
-                "teacher_id": entry.teacher.id,
-                "teacher_name": entry.teacher.name,
-                "weekday": entry.time_slot.weekday.value,
-                "period": entry.time_slot.period,
-                "day_part": entry.time_slot.day_part.value
-            })
-        
-        # 按班级和时间排序
-        formatted.sort(key=lambda x: (x["class_id"], x["weekday"], x["period"]))
-        return formatted
\ No newline at end of file
+    def _format_schedule(self, schedule: Schedule, response_format: str = "records"):
+        """格式化课表输出（按班级、星期、节次排序）"""
+        return format_schedule(schedule.entries, self.config.slot_grid, response_format)
@@ -1,294 +1,29 @@
 from models import (
     TimeSlot, Teacher, Subject, Class, Schedule,
     ScheduleEntry, ScheduleConfig, WeekDay, DayPart, TimeTable, 
-    Priority, Grade
+    Priority, Grade, CompactEntryStore
 )
-from rules import RuleManager
+from rules import RuleManager, RuleType, Rule, RulePriority, RuleResult
 from scheduler import SmartScheduler, SchedulerService
+from matching import hopcroft_karp, UNMATCHED
+from decomposition import split_components
+from reschedule import IncrementalRescheduler
+from feasibility import check_feasibility
+from day_planner import plan_day_quotas
+from jobs import JobQueue, JobStatus
+from result_cache import ResultCache, request_fingerprint
+from schedule_format import format_schedule, dumps
+from csp_scheduler import CSPScheduler
+from local_search import LocalSearchImprover, merge_errors
+from schedule_api import (
+    parse_schedule_request, run_schedule_job, run_reschedule_job, schedule_cache_key, store_schedule_result
+)
+from sample_data import create_test_data
 from datetime import time
 from typing import List, Dict
+import random
 
-def create_test_data(grade: str = "小学三年级", 
-                    end_day: str = "星期五",
-                    morning_periods: int = 4,
-                    afternoon_periods: int = 4,
-                    evening_periods: int = 0,
-                    selected_classes: List[int] = [1, 2, 3, 4, 5, 6, 7, 8]):
-    """
-    创建测试数据
-    :param grade: 年级名称
-    :param end_day: 结束日期
-    :param morning_periods: 上午课节数
-    :param afternoon_periods: 下午课节数
-    :param evening_periods: 晚上课节数
-    :param selected_classes: 选中的班级序号列表
-    """
-    def validate_total_hours(subjects_dict: Dict[str, Subject]) -> bool:
-        """验证所有科目的总课时是否等于40"""
-        total_hours = sum(subject.weekly_hours for subject in subjects_dict.values())
-        if total_hours != 40:
-            raise ValueError(f"所有科目的周课时之和必须等于40，当前为{total_hours}")
-        return True
-
-    # 1. 创建科目
-    subjects = {
-        # 主要科目
-        "语文": Subject(
-            name="语文",
-            weekly_hours=8,
-            priority=Priority.HIGH,
-            requires_consecutive_periods=False,
-            max_periods_per_day=2
-        ),
-        "数学": Subject(
-            name="数学",
-            weekly_hours=8,
-            priority=Priority.HIGH,
-            requires_consecutive_periods=False,
-            max_periods_per_day=2
-        ),
-        "英语": Subject(
-            name="英语",
-            weekly_hours=6,
-            priority=Priority.HIGH,
-            requires_consecutive_periods=False,
-            max_periods_per_day=2
-        ),
-        
-        # 次要科目
-        "体育": Subject(
-            name="体育",
-            weekly_hours=4,
-            priority=Priority.MEDIUM,
-            requires_consecutive_periods=True,
-            max_periods_per_day=1
-        ),
-        "音乐": Subject(
-            name="音乐",
-            weekly_hours=2,
-            priority=Priority.MEDIUM,
-            requires_consecutive_periods=False,
-            max_periods_per_day=1
-        ),
-        "美术": Subject(
-            name="美术",
-            weekly_hours=2,
-            priority=Priority.MEDIUM,
-            requires_consecutive_periods=True,
-            max_periods_per_day=2
-        ),
-        
-        # 其他科目
-        "信息": Subject(
-            name="信息",
-            weekly_hours=2,
-            priority=Priority.LOW,
-            requires_consecutive_periods=False,
-            max_periods_per_day=1
-        ),
-        "地理": Subject(
-            name="地理",
-            weekly_hours=2,
-            priority=Priority.LOW,
-            requires_consecutive_periods=False,
-            max_periods_per_day=1
-        ),
-        "历史": Subject(
-            name="历史",
-            weekly_hours=2,
-            priority=Priority.LOW,
-            requires_consecutive_periods=False,
-            max_periods_per_day=1
-        ),
-        "生物": Subject(
-            name="生物",
-            weekly_hours=2,
-            priority=Priority.LOW,
-            requires_consecutive_periods=False,
-            max_periods_per_day=1
-        ),
-        "政治": Subject(
-            name="政治",
-            weekly_hours=1,
-            priority=Priority.LOW,
-            requires_consecutive_periods=False,
-            max_periods_per_day=1
-        ),
-        "班会": Subject(
-            name="班会",
-            weekly_hours=1,
-            priority=Priority.LOW,
-            requires_consecutive_periods=False,
-            max_periods_per_day=1
-        ),
-    }
-
-    # 验证总课时
-    validate_total_hours(subjects)
-
-    # 根据课时数自动设置优先级
-    sorted_subjects = sorted(subjects.values(), key=lambda x: x.weekly_hours, reverse=True)
-    for i, subject in enumerate(sorted_subjects):
-        if i < 3:  # 课时最多的3门课
-            subject.priority = Priority.HIGH
-        elif i < 6:  # 接下来的3门课
-            subject.priority = Priority.MEDIUM
-        else:  # 其余课程
-            subject.priority = Priority.LOW
-
-    # 2. 创建教师
-    teachers = [
-        # 语文教师（10人）
-        Teacher(id="T001", name="陈语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T002", name="李语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T003", name="王语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T004", name="张语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T005", name="刘语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        # 新增语文教师
-        Teacher(id="T101", name="赵语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T102", name="钱语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T103", name="孙语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T104", name="周语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T105", name="吴语文", subjects=["语文"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 数学教师（10人）
-        Teacher(id="T006", name="陈数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T007", name="李数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T008", name="王数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T009", name="张数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T010", name="刘数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        # 新增数学教师
-        Teacher(id="T106", name="赵数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T107", name="钱数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T108", name="孙数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T109", name="周数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T110", name="吴数学", subjects=["数学"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 英语教师（10人）
-        Teacher(id="T011", name="陈英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T012", name="李英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T013", name="王英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T014", name="张英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T015", name="刘英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        # 新增英语教师
-        Teacher(id="T111", name="赵英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T112", name="钱英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T113", name="孙英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T114", name="周英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T115", name="吴英语", subjects=["英语"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 体育教师
-        Teacher(id="T016", name="陈体育", subjects=["体育"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T017", name="李体育", subjects=["体育"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T018", name="王体育", subjects=["体育"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T019", name="张体育", subjects=["体育"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T020", name="刘体育", subjects=["体育"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 音乐教师
-        Teacher(id="T021", name="陈音乐", subjects=["音乐"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T022", name="李音乐", subjects=["音乐"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T023", name="王音乐", subjects=["音乐"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T024", name="张音乐", subjects=["音乐"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T025", name="刘音乐", subjects=["音乐"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 美术教师
-        Teacher(id="T026", name="陈美术", subjects=["美术"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T027", name="李美术", subjects=["美术"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T028", name="王美术", subjects=["美术"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T029", name="张美术", subjects=["美术"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T030", name="刘美术", subjects=["美术"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 信息教师
-        Teacher(id="T031", name="陈信息", subjects=["信息"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T032", name="李信息", subjects=["信息"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T033", name="王信息", subjects=["信息"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T034", name="张信息", subjects=["信息"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T035", name="刘信息", subjects=["信息"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 地理教师
-        Teacher(id="T036", name="陈地理", subjects=["地理"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T037", name="李地理", subjects=["地理"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T038", name="王地理", subjects=["地理"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T039", name="张地理", subjects=["地理"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T040", name="刘地理", subjects=["地理"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 历史教师
-        Teacher(id="T041", name="陈历史", subjects=["历史"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T042", name="李历史", subjects=["历史"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T043", name="王历史", subjects=["历史"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T044", name="张历史", subjects=["历史"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T045", name="刘历史", subjects=["历史"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 生物教师
-        Teacher(id="T046", name="陈生物", subjects=["生物"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T047", name="李生物", subjects=["生物"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T048", name="王生物", subjects=["生物"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T049", name="张生物", subjects=["生物"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T050", name="刘生物", subjects=["生物"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 政治教师
-        Teacher(id="T051", name="陈政治", subjects=["政治"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T052", name="李政治", subjects=["政治"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T053", name="王政治", subjects=["政治"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T054", name="张政治", subjects=["政治"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T055", name="刘政治", subjects=["政治"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 地方教师
-        Teacher(id="T056", name="陈地方", subjects=["地方"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T057", name="李地方", subjects=["地方"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T058", name="王地方", subjects=["地方"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T059", name="张地方", subjects=["地方"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T060", name="刘地方", subjects=["地方"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 健康教师
-        Teacher(id="T061", name="陈健康", subjects=["健康"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T062", name="李健康", subjects=["健康"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T063", name="王健康", subjects=["健康"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T064", name="张健康", subjects=["健康"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T065", name="刘健康", subjects=["健康"], max_hours_per_day=6, max_hours_per_week=25),
-        
-        # 班会教师（班主任）
-        Teacher(id="T066", name="陈班会", subjects=["班会"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T067", name="李班会", subjects=["班会"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T068", name="王班会", subjects=["班会"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T069", name="张班会", subjects=["班会"], max_hours_per_day=6, max_hours_per_week=25),
-        Teacher(id="T070", name="刘班会", subjects=["班会"], max_hours_per_day=6, max_hours_per_week=25),
-    ]
-
-    # 3. 创建班级
-    grade_enum = Grade(grade)
-    classes = []
-    for class_num in selected_classes:
-        class_id = f"{grade_enum.name[2]}{class_num}"  # 如 "3A" 表示三年级一班
-        class_name = f"{grade_enum.value}{class_num}班"
-        classes.append(
-            Class(
-                id=class_id,
-                name=class_name,
-                grade=grade_enum,
-                subjects=list(subjects.values())
-            )
-        )
-
-    # 4. 创建时间表配置（只保留课节数量的配置）
-    timetable = TimeTable(
-        periods_per_morning=morning_periods,
-        periods_per_afternoon=afternoon_periods,
-        periods_per_evening=evening_periods
-    )
-
-    # 5. 创建排课配置
-    schedule_config = ScheduleConfig.create_config(
-        name=f"{grade_enum.value}课表",
-        grade=grade,
-        end_day=end_day,
-        morning_periods=morning_periods,
-        afternoon_periods=afternoon_periods,
-        evening_periods=evening_periods,
-        class_count=len(selected_classes)
-    )
-
-    return classes, teachers, schedule_config
+import pytest
 
 def test_schedule_generation(
     grade: str = "小学三年级",
@@ -492,6 +227,1030 @@ def check_teacher_workload(schedule, teachers):
     
     return errors
 
+def test_schedule_index_conflicts():
+    """课表索引应随条目增删同步更新"""
+    classes, teachers, _ = create_test_data(selected_classes=[1, 2])
+    class_a, class_b = classes
+    chinese = class_a.subjects[0]
+    teacher = teachers[0]
+    slot = TimeSlot(weekday=WeekDay.MONDAY, period=1, day_part=DayPart.MORNING)
+
+    schedule = Schedule()
+    first = ScheduleEntry(class_info=class_a, subject=chinese, teacher=teacher, time_slot=slot)
+    assert schedule.add_entry(first)
+    # 同一教师同一时间段不能给另一个班上课
+    assert not schedule.add_entry(
+        ScheduleEntry(class_info=class_b, subject=chinese, teacher=teacher, time_slot=slot))
+    assert schedule.is_teacher_busy(teacher.id, slot)
+    assert schedule.get_class_schedule(class_a.id) == [first]
+    assert schedule.get_teacher_schedule(teacher.id) == [first]
+
+    assert schedule.remove_entry(first)
+    assert not schedule.is_class_busy(class_a.id, slot)
+    assert schedule.get_class_schedule(class_a.id) == []
+    assert schedule.add_entry(
+        ScheduleEntry(class_info=class_b, subject=chinese, teacher=teacher, time_slot=slot))
+
+def test_slot_grid_interning():
+    """时间槽网格中每个 (星期, 节次) 只有一个实例和一个稠密编号"""
+    _, _, config = create_test_data(selected_classes=[1])
+    grid = config.slot_grid
+    assert grid is config.slot_grid
+    assert len(grid) == len(config.weekdays) * config.timetable.get_total_periods()
+    assert [slot.slot_id for slot in grid] == list(range(len(grid)))
+
+    outside = TimeSlot(weekday=WeekDay.TUESDAY, period=3, day_part=DayPart.MORNING)
+    interned = grid.intern(outside)
+    assert interned == outside and hash(interned) == hash(outside)
+    assert interned is grid.get(WeekDay.TUESDAY, 3)
+    assert grid.id_of(outside) == interned.slot_id == 8 + 2
+
+def test_teacher_availability_mask():
+    """教师可用时间编译为位图后，判断结果应与逐个比较一致"""
+    _, _, config = create_test_data(selected_classes=[1])
+    grid = config.slot_grid
+    teacher = Teacher(id="P001", name="兼职教师", subjects=["音乐"], available_times=[
+        TimeSlot(weekday=WeekDay.MONDAY, period=1, day_part=DayPart.MORNING),
+        TimeSlot(weekday=WeekDay.FRIDAY, period=8, day_part=DayPart.AFTERNOON),
+    ])
+    mask = teacher.availability_mask(grid)
+    assert mask == 1 << 0 | 1 << grid.slot_id(WeekDay.FRIDAY, 8)
+    assert [slot for slot in grid if teacher.is_available_at(slot)] == [
+        grid.get(WeekDay.MONDAY, 1), grid.get(WeekDay.FRIDAY, 8)]
+    assert teacher.free_slots_mask(grid, busy_mask=1) == 1 << grid.slot_id(WeekDay.FRIDAY, 8)
+
+def test_dense_backend_matches_list_backend():
+    """相同随机种子下，稠密数组后端与列表后端应生成完全相同的课表"""
+    pytest.importorskip("numpy")
+    results = []
+    for backend in ("list", "dense"):
+        classes, teachers, config = create_test_data(selected_classes=[1, 2, 3, 4])
+        random.seed(2024)
+        scheduler = SmartScheduler(config, RuleManager(), backend=backend)
+        schedule, _ = scheduler.generate_schedule(classes, teachers)
+        results.append(sorted(
+            (e.class_info.id, e.time_slot.slot_id, e.subject.name, e.teacher.id)
+            for e in schedule.entries
+        ))
+    assert results[0] == results[1]
+
+    # 未预先登记的班级、教师、科目逐个扩容（容量翻倍），数组内容与条目一致
+    from models import DenseSchedule
+    grid = config.slot_grid
+    dense = DenseSchedule(grid=grid)
+    for entry in schedule.entries:
+        assert dense.add_entry(entry)
+    assert dense._class_rows.shape[0] < 2 * len(dense.class_ids)
+    assert dense._teacher_rows.shape[0] < 2 * len(dense.teacher_ids)
+    for class_id, ci in dense.class_index.items():
+        busy = [ts.slot_id for ts in grid if dense.is_class_busy(class_id, ts)]
+        assert all(dense.class_busy_at(slot_id)[ci] for slot_id in busy)
+        assert sorted(dense.class_busy[ci].reshape(-1).nonzero()[0].tolist()) == busy
+        for name, si in dense.subject_index.items():
+            assert dense.subject_day_counts[ci, si].sum() == sum(
+                1 for e in schedule.entries if e.class_info.id == class_id and e.subject.name == name)
+    for teacher_id, ti in dense.teacher_index.items():
+        assert sorted(dense.teacher_busy[ti].reshape(-1).nonzero()[0].tolist()) == sorted(
+            e.time_slot.slot_id for e in schedule.entries if e.teacher.id == teacher_id)
+
+def test_compact_entry_store_roundtrip():
+    """紧凑存储应能无损还原课表条目"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    schedule, _ = SmartScheduler(config, RuleManager()).generate_schedule(classes, teachers)
+    store = CompactEntryStore.from_schedule(schedule, config.slot_grid)
+    other = CompactEntryStore.from_schedule(schedule, config.slot_grid, shared_with=store)
+    assert len(other) == len(schedule.entries)
+    assert other.teachers is store.teachers
+    assert other.to_schedule().entries == schedule.entries
+    assert other[-1].time_slot is schedule.entries[-1].time_slot
+
+def test_rule_index_matches_scan():
+    """规则通过共享索引得到的结果应与扫描课表一致"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    schedule, _ = SmartScheduler(config, RuleManager()).generate_schedule(classes, teachers)
+    rule_manager = RuleManager()
+    rule_manager.create_default_rules()
+    index = rule_manager.index.ensure(schedule)
+    rules = rule_manager.get_active_rules()
+    for class_ in classes:
+        for subject in class_.subjects[:4]:
+            candidates = [t for t in teachers if subject.name in t.subjects][:2]
+            for teacher in candidates:
+                for time_slot in config.slot_grid:
+                    entry = ScheduleEntry(class_info=class_, subject=subject,
+                                          teacher=teacher, time_slot=time_slot)
+                    for rule in rules:
+                        assert rule.check(schedule, entry, index) == rule.check(schedule, entry)
+
+def test_rule_cache_invalidated_by_schedule_version():
+    """规则缓存按条目取值命中，课表修改后不会返回过期结果"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    rule_manager = RuleManager(cache_size=2)
+    rule_manager.create_default_rules()
+    schedule = Schedule()
+    slot = config.slot_grid.slots[0]
+    subject = classes[0].subjects[0]
+
+    def candidate(class_):
+        return ScheduleEntry(class_info=class_, subject=subject, teacher=teachers[0], time_slot=slot)
+
+    assert rule_manager.check_all_rules(schedule, candidate(classes[1]))[0]
+    assert rule_manager.check_all_rules(schedule, candidate(classes[1]))[0]
+    assert rule_manager.cache_info().hits == 1
+
+    placed = candidate(classes[0])
+    schedule.add_entry(placed)
+    rule_manager.notify_entry_added(schedule, placed)
+    passed, errors = rule_manager.check_all_rules(schedule, candidate(classes[1]))
+    assert not passed and errors
+    # 修改返回的错误列表不影响缓存中的结果
+    expected = list(errors)
+    errors.append("调用方追加的说明")
+    assert rule_manager.check_all_rules(schedule, candidate(classes[1])) == (False, expected)
+
+    for other_slot in config.slot_grid.slots[1:3]:
+        rule_manager.check_all_rules(schedule, ScheduleEntry(
+            class_info=classes[1], subject=subject, teacher=teachers[0], time_slot=other_slot))
+    info = rule_manager.cache_info()
+    assert (info.size, info.evictions) == (2, 2)
+
+def test_rule_pipeline_follows_rule_toggles():
+    """启停规则后，规则流水线应重新编译且不返回缓存中的旧结果"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    rule_manager = RuleManager()
+    rule_manager.create_default_rules()
+    slot = config.slot_grid.slots[0]
+    subject = classes[0].subjects[0]
+    schedule = Schedule()
+    schedule.add_entry(ScheduleEntry(class_info=classes[0], subject=subject,
+                                     teacher=teachers[0], time_slot=slot))
+    clash = ScheduleEntry(class_info=classes[1], subject=subject, teacher=teachers[0], time_slot=slot)
+
+    assert not rule_manager.check_all_rules(schedule, clash)[0]
+    teacher_rule = rule_manager.get_active_rules(RuleType.TEACHER)[0]
+    teacher_rule.enabled = False
+    assert rule_manager.check_all_rules(schedule, clash) == (True, [])
+    teacher_rule.enabled = True
+    assert not rule_manager.check_all_rules(schedule, clash)[0]
+
+    # 版本号属于各自的管理器：其他管理器的规则启停不会让本管理器重新编译
+    other = RuleManager()
+    other.create_default_rules()
+    version = rule_manager.state_version
+    other.get_active_rules(RuleType.TEACHER)[0].enabled = False
+    assert rule_manager.state_version == version and other.state_version == 1
+    # 复制到子进程的管理器仍能跟踪自己规则的启停
+    import pickle
+    copied = pickle.loads(pickle.dumps(rule_manager))
+    copied.get_active_rules(RuleType.TEACHER)[0].enabled = False
+    assert copied.check_all_rules(schedule, clash) == (True, [])
+    assert rule_manager.state_version == version
+
+def test_teacher_rules_compare_id_before_name():
+    """教师冲突按工号比较：同名不同工号的教师不冲突，同一工号即使姓名不同也冲突"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    rule_manager = RuleManager()
+    rule_manager.create_default_rules()
+    slot = config.slot_grid.slots[0]
+    subject = classes[0].subjects[0]
+    schedule = Schedule()
+    placed = ScheduleEntry(class_info=classes[0], subject=subject, teacher=teachers[0], time_slot=slot)
+    schedule.add_entry(placed)
+    rule_manager.notify_entry_added(schedule, placed)
+
+    namesake = Teacher(id="T999", name=teachers[0].name, subjects=teachers[0].subjects)
+    renamed = Teacher(id=teachers[0].id, name="改名后", subjects=teachers[0].subjects)
+    for teacher, passed in ((namesake, True), (renamed, False)):
+        entry = ScheduleEntry(class_info=classes[1], subject=subject, teacher=teacher, time_slot=slot)
+        assert rule_manager.check_all_rules(schedule, entry)[0] == passed
+        rule = rule_manager.get_active_rules(RuleType.TEACHER)[0]
+        assert rule.check(schedule, entry, rule_manager.index.ensure(schedule)).passed == passed
+        assert rule.check(schedule, entry).passed == passed
+
+def test_csp_engine_complete_and_bounded():
+    """回溯引擎应排满所有课时；预算不足时返回部分课表并说明原因"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    rule_manager = RuleManager()
+    rule_manager.create_default_rules()
+    service = SchedulerService(config, rule_manager, engine="csp", seed=1)
+    result = service.create_schedule(grade_classes=classes, teachers=teachers)
+    assert result["success"], result["errors"]
+    assert len(result["schedule"]) == sum(s.weekly_hours for c in classes for s in c.subjects)
+    assert not check_teacher_conflicts(result["schedule"])
+    assert not check_class_subject_count(result["schedule"], classes)
+
+    bounded = SchedulerService(config, rule_manager, engine="csp", node_limit=50, seed=1)
+    result = bounded.create_schedule(grade_classes=classes, teachers=teachers)
+    assert not result["success"]
+    assert 0 < len(result["schedule"]) <= 50
+    assert "预算上限" in result["errors"][0]
+
+def test_csp_engine_places_consecutive_blocks():
+    """回溯引擎把连堂科目作为连堂块赋值：相邻两节、同一教师，奇数课时多出的一节单独排"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    grid = config.slot_grid
+    subjects = {s.name: s for s in classes[0].subjects}
+    subjects["美术"].weekly_hours += 1  # 课表已排满，从语文挪一节
+    subjects["语文"].weekly_hours -= 1
+    schedule, errors = CSPScheduler(config, RuleManager(), seed=2).generate_schedule(classes, teachers)
+    assert not errors
+    assert len(schedule.entries) == sum(s.weekly_hours for c in classes for s in c.subjects)
+    for class_ in classes:
+        for subject in class_.subjects:
+            if not subject.requires_consecutive_periods:
+                continue
+            lessons = [e for e in schedule.entries
+                       if e.class_info is class_ and e.subject.name == subject.name]
+            slot_ids = {grid.id_of(e.time_slot): e.teacher.id for e in lessons}
+            pairs = [(a, b) for a, b in grid.consecutive_pairs
+                     if a in slot_ids and b in slot_ids and slot_ids[a] == slot_ids[b]]
+            # 每个连堂块占用的两节互不重叠
+            blocks, used = 0, set()
+            for a, b in pairs:
+                if a not in used and b not in used:
+                    used.update((a, b))
+                    blocks += 1
+            assert blocks == subject.weekly_hours // 2
+
+    # 预算用尽时返回的部分课表就是搜索到的最深状态
+    engine = CSPScheduler(config, RuleManager(), node_limit=40, seed=2)
+    partial_schedule, _ = engine.generate_schedule(classes, teachers)
+    assert engine.truncated
+    assert len(partial_schedule.entries) == engine.best_size == len(engine.best_entries)
+
+def test_local_search_repairs_greedy_schedule():
+    """局部搜索应补齐贪心留下的未排课时，且不引入冲突"""
+    classes, teachers, config = create_test_data(selected_classes=list(range(1, 9)))
+    greedy = SchedulerService(config, RuleManager(), day_quotas=False, seed=1)
+    result = greedy.create_schedule(grade_classes=classes, teachers=teachers)
+    total = sum(s.weekly_hours for c in classes for s in c.subjects)
+    assert len(result["schedule"]) < total
+
+    service = SchedulerService(config, RuleManager(), day_quotas=False, improve_time=5.0, seed=1)
+    result = service.create_schedule(grade_classes=classes, teachers=teachers)
+    assert result["success"], result["errors"]
+    assert len(result["schedule"]) == total
+    assert not check_teacher_conflicts(result["schedule"])
+    assert not check_class_subject_count(result["schedule"], classes)
+
+def test_greedy_engine_checks_rules():
+    """贪心引擎建边和排入时都检查规则管理器；连堂块两节要一起通过，默认规则的连堂上限也生效"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    block_subject = next(s.name for c in classes for s in c.subjects if s.requires_consecutive_periods)
+
+    class NoLessonAt(Rule):
+        def __init__(self, subject_name, period):
+            super().__init__(f"{subject_name}不排第{period}节", RuleType.SUBJECT, RulePriority.HIGH)
+            self.subject_name, self.period = subject_name, period
+
+        def check(self, schedule, entry):
+            return RuleResult(not (entry.subject.name == self.subject_name and entry.time_slot.period == self.period),
+                              f"第{self.period}节不排{self.subject_name}")
+
+    for backend in ("list", "dense"):
+        rule_manager = RuleManager()
+        rule_manager.create_default_rules()
+        rule_manager.add_rule(NoLessonAt("语文", 1))
+        rule_manager.add_rule(NoLessonAt(block_subject, 2))  # 从第 1 节开始的连堂块第二节不能通过
+        schedule, _ = SmartScheduler(config, rule_manager, backend=backend, seed=1).generate_schedule(classes, teachers)
+        assert schedule.entries
+        periods = {}
+        for entry in schedule.entries:
+            assert (entry.subject.name, entry.time_slot.period) not in (("语文", 1), (block_subject, 2))
+            periods.setdefault((entry.class_info.id, entry.subject.name, entry.time_slot.weekday), set()).add(
+                entry.time_slot.period)
+        # 默认规则：同一科目最多连续两节
+        for day_periods in periods.values():
+            assert not any({p, p + 1, p + 2} <= day_periods for p in day_periods)
+        # 引擎排入条目时通知了规则管理器，索引与课表同步
+        assert rule_manager.index._schedule is schedule and rule_manager.index._size == len(schedule.entries)
+
+def test_local_search_respects_rules_blocks_and_quotas():
+    """修复阶段的移动要通过规则管理器、保持连堂块、不超过每日配额，且没有进展时提前结束"""
+    import time as clock
+
+    class NoChineseFirstPeriod(Rule):
+        def __init__(self):
+            super().__init__("语文不排第一节", RuleType.SUBJECT, RulePriority.HIGH)
+
+        def check(self, schedule, entry):
+            return RuleResult(not (entry.subject.name == "语文" and entry.time_slot.period == 1), "第一节不排语文")
+
+    classes, teachers, config = create_test_data(selected_classes=list(range(1, 9)))
+    original, _ = SmartScheduler(config, RuleManager(), day_quotas=False, seed=1).generate_schedule(classes, teachers)
+    rule_manager = RuleManager()
+    rule_manager.add_rule(NoChineseFirstPeriod())
+    improved, errors = LocalSearchImprover(config, rule_manager, seed=1).improve(
+        original, classes, teachers, 3.0)
+    before = {(e.class_info.id, e.subject.name, e.time_slot) for e in original.entries}
+    added = [e for e in improved.entries if (e.class_info.id, e.subject.name, e.time_slot) not in before]
+    assert added and len(improved.entries) > len(original.entries)
+    assert all(e.subject.name != "语文" or e.time_slot.period != 1 for e in added)
+    # 已排的连堂课时不动，新插入的连堂课时成对出现在相邻时间段、同一位教师
+    block_subjects = {s.name for c in classes for s in c.subjects if s.requires_consecutive_periods}
+    after = {(e.class_info.id, e.subject.name, e.time_slot) for e in improved.entries}
+    assert {key for key in before if key[1] in block_subjects} <= after
+    grid = config.slot_grid
+    added_blocks = sorted((e.class_info.id, e.subject.name, grid.id_of(e.time_slot), e.teacher.id)
+                          for e in added if e.subject.requires_consecutive_periods)
+    for first, second in zip(added_blocks[::2], added_blocks[1::2]):
+        assert first[:2] == second[:2] and first[3] == second[3]
+        assert (first[2], second[2]) in grid.consecutive_pairs
+
+    # 服务层：修复结果遵守引擎的每日配额
+    service = SchedulerService(config, RuleManager(), improve_time=1.0, seed=1)
+    result = service.create_schedule(classes, teachers)
+    quotas = service.scheduler.day_quotas
+    counts: Dict[tuple, int] = {}
+    for r in result["schedule"]:
+        key = (r["class_id"], r["subject"], grid.day_index[WeekDay(r["weekday"])])
+        counts[key] = counts.get(key, 0) + 1
+    assert all(count <= quotas[(cid, name)][day] for (cid, name, day), count in counts.items())
+
+    # 没有教师的科目永远排不进去：连续 patience 步没有改进后结束，不会用满时间预算
+    classes[0].subjects.append(Subject(name="书法", weekly_hours=1))
+    started = clock.monotonic()
+    _, errors = LocalSearchImprover(config, seed=1, patience=2000).improve(
+        improved, classes, teachers, 30.0)
+    assert clock.monotonic() - started < 10
+    assert any("书法" in e for e in errors)
+
+def test_merge_errors_keeps_engine_warnings():
+    """引擎的未排入说明由修复阶段的结果代替，其他引擎说明保留"""
+    engine = ["排课达到时间预算 1.0 秒，在 星期五 第3节 处停止，返回部分课表",
+              "无法为 三年级1班 在 星期一 第2节 安排课程"]
+    assert merge_errors(engine, []) == engine[:1]
+    assert merge_errors(engine, ["无法为 三年级1班 安排 语文 的 1 节课"]) == [
+        engine[0], "无法为 三年级1班 安排 语文 的 1 节课"]
+
+def test_multistart_keeps_best_start():
+    """多起点求解应返回各起点中未排课时最少的结果"""
+    classes, teachers, config = create_test_data(selected_classes=list(range(1, 9)))
+    service = SchedulerService(config, RuleManager(), starts=4, max_workers=2, seed=7)
+    result = service.create_schedule(grade_classes=classes, teachers=teachers)
+    results = service.scheduler.results
+    assert results
+    best = min(r.quality for r in results)
+    total = sum(s.weekly_hours for c in classes for s in c.subjects)
+    assert len(result["schedule"]) == total - best[0]
+    assert not check_teacher_conflicts(result["schedule"])
+
+class SlowStartEngine:
+    """多起点测试用引擎：偶数种子正常排课，奇数种子一直运行到被取消，并在 marker_dir 中留下记录"""
+    def __init__(self, config, marker_dir, seed=None, cancel=None):
+        self.engine = CSPScheduler(config, RuleManager(), seed=seed, cancel=cancel)
+        self.rule_manager = self.engine.rule_manager
+        self.marker_dir = marker_dir
+        self.seed = seed
+        self.cancel = cancel
+        self.truncated = False
+
+    def generate_schedule(self, grade_classes, teachers):
+        import time as clock
+        if self.seed % 2 == 0:
+            return self.engine.generate_schedule(grade_classes, teachers)
+        deadline = clock.monotonic() + 60
+        while not self.cancel.is_set() and clock.monotonic() < deadline:
+            clock.sleep(0.01)
+        if self.cancel.is_set():
+            (self.marker_dir / str(self.seed)).write_text("cancelled")
+        self.truncated = True
+        return Schedule(), ["排课已被取消"]
+
+def test_multistart_stops_running_starts(tmp_path):
+    """提前返回或被取消时，运行中的副本应收到取消标志并在返回前退出"""
+    import threading
+    import time as clock
+    from functools import partial
+    from multistart import MultiStartScheduler
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    scheduler = MultiStartScheduler(partial(SlowStartEngine, config, tmp_path), config,
+                                    starts=2, max_workers=2, seed=0)
+    started = clock.monotonic()
+    schedule, errors = scheduler.generate_schedule(classes, teachers)
+    assert clock.monotonic() - started < 30
+    assert not errors and not scheduler.truncated
+    # 种子 1 的副本在 generate_schedule 返回前已看到取消标志
+    assert (tmp_path / "1").read_text() == "cancelled"
+
+    # 调用方的取消标志经服务层传给各子进程中的副本
+    cancel = threading.Event()
+    cancel.set()
+    service = SchedulerService(config, RuleManager(), starts=2, max_workers=2, seed=1,
+                               time_limit=60.0, cancel=cancel)
+    started = clock.monotonic()
+    result = service.create_schedule(classes, teachers)
+    assert clock.monotonic() - started < 30
+    assert result["truncated"] and not result["success"]
+
+def test_hopcroft_karp_maximum_matching():
+    """贪心先占用的教师应被增广路让出，使所有班级都能匹配"""
+    # 班级0 偏好教师0；班级1 只能由教师0 授课
+    assert hopcroft_karp([[0, 1], [0]], 2) == [1, 0]
+    assert hopcroft_karp([[0], [0], [1]], 2).count(UNMATCHED) == 1
+    assert hopcroft_karp([], 3) == []
+
+    def augmenting_maximum(adjacency, n_right):
+        """逐个顶点找增广路的简单算法，作为最大匹配大小的参照"""
+        match_right = [UNMATCHED] * n_right
+
+        def augment(u, seen):
+            for v in adjacency[u]:
+                if v not in seen:
+                    seen.add(v)
+                    if match_right[v] == UNMATCHED or augment(match_right[v], seen):
+                        match_right[v] = u
+                        return True
+            return False
+        return sum(augment(u, set()) for u in range(len(adjacency)))
+
+    rng = random.Random(14)
+    for _ in range(300):
+        n_left, n_right = rng.randint(1, 12), rng.randint(1, 12)
+        adjacency = [rng.sample(range(n_right), rng.randint(0, n_right)) for _ in range(n_left)]
+        match = hopcroft_karp(adjacency, n_right)
+        matched = [v for v in match if v != UNMATCHED]
+        assert len(matched) == len(set(matched))
+        assert all(v in adjacency[u] for u, v in enumerate(match) if v != UNMATCHED)
+        assert len(matched) == augmenting_maximum(adjacency, n_right)
+
+def test_split_components_and_merge():
+    """不共享教师的班级应拆成独立分量，分别求解后合并无冲突"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    literature = {"语文", "英语", "音乐"}
+    classes[0].subjects = [s for s in classes[0].subjects if s.name in literature]
+    classes[1].subjects = [s for s in classes[1].subjects if s.name not in literature]
+    classes[2].subjects = [s for s in classes[2].subjects if s.name in literature]
+    components = split_components(classes, teachers)
+    assert [[c.id for c in comp.classes] for comp in components] == [
+        [classes[0].id, classes[2].id], [classes[1].id]]
+    assert all(literature.issuperset(t.subjects) for t in components[0].teachers)
+
+    service = SchedulerService(config, RuleManager(), decompose=True, max_workers=2, seed=3)
+    result = service.create_schedule(grade_classes=classes, teachers=teachers)
+    assert {e["class_id"] for e in result["schedule"]} == {c.id for c in classes}
+    assert not check_teacher_conflicts(result["schedule"])
+
+def test_incremental_reschedule_keeps_unaffected_lessons():
+    """教师请假一天后只重排其课程，其余课程不变"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    rule_manager = RuleManager()
+    schedule, _ = CSPScheduler(config, rule_manager, seed=1).generate_schedule(classes, teachers)
+    absent = schedule.entries[0].teacher
+    monday = [ts for ts in config.slot_grid if ts.weekday == schedule.entries[0].time_slot.weekday]
+    affected = [e for e in schedule.entries if e.teacher is absent and e.time_slot in monday]
+
+    result = IncrementalRescheduler(config, seed=1).reschedule(
+        schedule, classes, teachers, blocked={absent.id: monday})
+    assert not result.errors
+    assert len(result.schedule.entries) == len(schedule.entries)
+    assert len(result.removed) == len(result.added) <= 2 * len(affected)
+    assert not any(e.teacher.id == absent.id and e.time_slot in monday for e in result.schedule.entries)
+    assert not check_teacher_conflicts(SchedulerService(config, rule_manager)._format_schedule(result.schedule))
+
+def test_incremental_reschedule_keeps_blocks_together():
+    """只影响连堂块一半的请假会整块重排：修复后仍是相邻两节、同一位教师"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    grid = config.slot_grid
+    schedule, _ = CSPScheduler(config, RuleManager(), seed=1).generate_schedule(classes, teachers)
+
+    def blocks_intact(result):
+        lessons: Dict[tuple, Dict[int, str]] = {}
+        for e in result.entries:
+            if e.subject.requires_consecutive_periods:
+                lessons.setdefault((e.class_info.id, e.subject.name), {})[grid.id_of(e.time_slot)] = e.teacher.id
+        for by_slot in lessons.values():
+            slot_ids = sorted(by_slot)
+            while slot_ids:
+                first = slot_ids.pop(0)
+                second = grid.pair_next.get(first)
+                if second not in slot_ids or by_slot[second] != by_slot[first]:
+                    return False
+                slot_ids.remove(second)
+        return True
+
+    assert blocks_intact(schedule)
+    block = next(e for e in schedule.entries if e.subject.requires_consecutive_periods)
+    second_slot = grid.slots[grid.pair_next[grid.id_of(block.time_slot)]]
+    # 该科目所有教师都在第二节请假：原来的两节不能再用，班级课表已排满，只能挤出普通课
+    blocked = {t.id: [second_slot] for t in teachers if block.subject.name in t.subjects}
+    result = IncrementalRescheduler(config, RuleManager(), seed=1).reschedule(
+        schedule, classes, teachers, blocked=blocked)
+    assert not result.errors
+    assert len(result.schedule.entries) == len(schedule.entries)
+    assert blocks_intact(result.schedule)
+    assert not any(e.teacher.id in blocked and e.time_slot == second_slot for e in result.schedule.entries)
+    assert not check_teacher_conflicts(SchedulerService(config, RuleManager())._format_schedule(result.schedule))
+
+def test_feasibility_precheck_rejects_impossible_input():
+    """必然无解的输入应在求解前被拒绝，并给出结构化原因"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    assert check_feasibility(config, classes, teachers).feasible
+
+    music_teachers = [t for t in teachers if "音乐" in t.subjects]
+    for teacher in music_teachers[1:]:
+        teacher.subjects = []
+    music_teachers[0].max_hours_per_week = 3
+    result = SchedulerService(config, RuleManager()).create_schedule(classes, teachers)
+    assert not result["success"] and not result["schedule"]
+    assert [issue["code"] for issue in result["infeasible"]] == ["teacher_capacity"]
+    assert result["infeasible"][0]["details"] == {"subject": "音乐", "required": 4, "available": 3}
+
+def test_consecutive_subjects_placed_as_blocks():
+    """连堂科目应成对排在同一时段的相邻两节，不跨越午休"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3, 4])
+    grid = config.slot_grid
+    assert (3, 4) not in grid.consecutive_pairs  # 上午第4节与下午第1节
+    assert len(grid.consecutive_pairs) == len(grid.weekdays) * 6
+
+    schedule, _ = SmartScheduler(config, RuleManager(), seed=5).generate_schedule(classes, teachers)
+    slots: Dict[tuple, List[int]] = {}
+    for entry in schedule.entries:
+        if entry.subject.requires_consecutive_periods:
+            key = (entry.class_info.id, entry.subject.name, entry.teacher.id)
+            slots.setdefault(key, []).append(grid.id_of(entry.time_slot))
+    assert slots
+    for slot_ids in slots.values():
+        slot_ids.sort()
+        assert all((a, b) in grid.consecutive_pairs for a, b in zip(slot_ids[::2], slot_ids[1::2]))
+
+def test_day_quotas_spread_weekly_hours():
+    """配额应在每日上限内分配全部周课时，排课结果遵守配额"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3, 4])
+    quotas, errors = plan_day_quotas(config, classes)
+    assert not errors
+    periods = config.slot_grid.periods_per_day
+    for class_ in classes:
+        for subject in class_.subjects:
+            days = quotas[(class_.id, subject.name)]
+            assert sum(days) == subject.weekly_hours
+            assert max(days) <= max(subject.max_periods_per_day,
+                                    2 if subject.requires_consecutive_periods else 0)
+        assert all(sum(quotas[(class_.id, s.name)][d] for s in class_.subjects) <= periods
+                   for d in range(len(config.slot_grid.weekdays)))
+
+    schedule, _ = SmartScheduler(config, RuleManager(), seed=1).generate_schedule(classes, teachers)
+    assert len(schedule.entries) == sum(s.weekly_hours for c in classes for s in c.subjects)
+
+def test_teacher_selection_balances_load_within_caps():
+    """同科目教师按负载轮流授课，且不超过每日、每周课时上限"""
+    classes, teachers, config = create_test_data()
+    for teacher in teachers:
+        teacher.max_hours_per_day = 3
+    schedule, _ = SmartScheduler(config, RuleManager(), seed=3).generate_schedule(classes, teachers)
+    week_load = {t.id: 0 for t in teachers}
+    day_load = {}
+    for e in schedule.entries:
+        week_load[e.teacher.id] += 1
+        key = (e.teacher.id, e.time_slot.weekday)
+        day_load[key] = day_load.get(key, 0) + 1
+    assert max(day_load.values()) <= 3
+    assert all(week_load[t.id] <= t.max_hours_per_week for t in teachers)
+    for subject_name in {name for t in teachers for name in t.subjects}:
+        loads = [week_load[t.id] for t in teachers if subject_name in t.subjects]
+        assert max(loads) - min(loads) <= 2
+
+def test_least_loaded_teacher_matches_scan():
+    """负载堆的选择结果与逐个扫描候选教师取最小负载一致（包括连堂块和已被首选的教师）"""
+    class CheckedScheduler(SmartScheduler):
+        calls = 0
+
+        def _least_loaded_teacher(self, subject_name, time_slot, block, preferred):
+            chosen = super()._least_loaded_teacher(subject_name, time_slot, block, preferred)
+            pool = self.free_teacher_pools.get((time_slot.slot_id, subject_name), {})
+            candidates = [t for t in pool.values() if t.id not in preferred]
+            if block:
+                next_pool = self.free_teacher_pools.get(
+                    (self.config.slot_grid.pair_next[time_slot.slot_id], subject_name), {})
+                candidates = [t for t in candidates if t.id in next_pool and
+                              self.teacher_day_load[t.id] + 2 <= t.max_hours_per_day and
+                              self.teacher_week_load[t.id] + 2 <= t.max_hours_per_week]
+            expected = min(candidates, default=None, key=lambda t: (
+                self.teacher_day_load[t.id], self.teacher_week_load[t.id], self._teacher_order[t.id]))
+            assert chosen is expected
+            CheckedScheduler.calls += 1
+            return chosen
+
+    classes, teachers, config = create_test_data()
+    for teacher in teachers:
+        teacher.max_hours_per_day = 3
+    CheckedScheduler(config, RuleManager(), seed=3).generate_schedule(classes, teachers)
+    assert CheckedScheduler.calls > len(config.slot_grid) * len(classes)
+
+def test_occupancy_counters_match_scan():
+    """增量维护的课时、当天科目和时间段占用计数，每个时间段后都与扫描课表的结果一致；课表索引在随机增删后同样一致"""
+    class CheckedScheduler(SmartScheduler):
+        checks = 0
+
+        def _schedule_time_slot(self, time_slot, classes):
+            result = super()._schedule_time_slot(time_slot, classes)
+            entries = self.schedule.entries
+            hours = {key: 0 for key in self.subject_hours_tracker}
+            day_counts: Dict[tuple, Dict[str, int]] = {}
+            for e in entries:
+                hours[(e.class_info.id, e.subject.name)] += 1
+                day = day_counts.setdefault((e.class_info.id, e.time_slot.weekday), {})
+                day[e.subject.name] = day.get(e.subject.name, 0) + 1
+            assert self.subject_hours_tracker == hours
+            assert {k: v for k, v in self.day_subject_counts.items() if v} == day_counts
+            assert self.class_slot_occupied == {(e.class_info.id, e.time_slot.slot_id) for e in entries}
+            CheckedScheduler.checks += 1
+            return result
+
+    classes, teachers, config = create_test_data(selected_classes=list(range(1, 9)))
+    CheckedScheduler(config, RuleManager(), seed=5).generate_schedule(classes, teachers)
+    assert CheckedScheduler.checks == len(config.slot_grid)
+
+    # 随机增删条目后，课表的占用索引与逐条扫描一致
+    rng = random.Random(5)
+    grid = config.slot_grid
+    schedule = Schedule()
+    for _ in range(2000):
+        if schedule.entries and rng.random() < 0.4:
+            assert schedule.remove_entry(rng.choice(schedule.entries))
+        else:
+            class_ = rng.choice(classes)
+            schedule.add_entry(ScheduleEntry(class_info=class_, subject=rng.choice(class_.subjects),
+                                             teacher=rng.choice(teachers), time_slot=rng.choice(grid.slots)))
+    for teacher in teachers:
+        own = [e for e in schedule.entries if e.teacher.id == teacher.id]
+        assert schedule.teacher_busy_mask(teacher.id) == sum(1 << e.time_slot.slot_id for e in own)
+        assert schedule.get_teacher_schedule(teacher.id) == own
+    for class_ in classes:
+        own = [e for e in schedule.entries if e.class_info.id == class_.id]
+        assert schedule.get_class_schedule(class_.id) == own
+        assert [ts for ts in grid if schedule.is_class_busy(class_.id, ts)] == sorted(
+            (e.time_slot for e in own), key=lambda ts: ts.slot_id)
+
+def test_free_teacher_pools_match_scan():
+    """每个时间段后，后续时间段的空闲教师池与按可用时间、占用和课时上限扫描得到的集合一致"""
+    class CheckedScheduler(SmartScheduler):
+        checks = 0
+
+        def _schedule_time_slot(self, time_slot, classes):
+            result = super()._schedule_time_slot(time_slot, classes)
+            grid = self.config.slot_grid
+            today = grid.day_index[time_slot.weekday]
+            for slot in grid.slots[time_slot.slot_id + 1:]:
+                for subject_name, subject_teachers in self.teachers_by_subject.items():
+                    expected = {
+                        t.id for t in subject_teachers
+                        if t.is_available_at(slot) and not self.schedule.is_teacher_busy(t.id, slot)
+                        and self.teacher_week_load[t.id] < t.max_hours_per_week
+                        and (grid.day_index[slot.weekday] != today
+                             or self.teacher_day_load[t.id] < t.max_hours_per_day)
+                    }
+                    assert set(self.free_teacher_pools.get((slot.slot_id, subject_name), {})) == expected
+            CheckedScheduler.checks += 1
+            return result
+
+    classes, teachers, config = create_test_data(selected_classes=list(range(1, 7)))
+    grid = config.slot_grid
+    # 限定部分教师的可用时间和课时上限，使可用时间、当天上限和每周上限都参与筛选
+    teachers[0].available_times = [ts for ts in grid if ts.period != 1]
+    for teacher in teachers[1::2]:
+        teacher.max_hours_per_day = 3
+    teachers[2].max_hours_per_week = 4
+    CheckedScheduler(config, RuleManager(), seed=2).generate_schedule(classes, teachers)
+    assert CheckedScheduler.checks == len(grid)
+
+def test_job_queue_runs_and_cancels_jobs():
+    """任务在进程池中执行；超出并发数的任务排队，排队中的任务可取消"""
+    import time as clock
+    queue = JobQueue(max_workers=1)
+    try:
+        blocker = queue.submit(clock.sleep, 0.5)
+        waiting = queue.submit(pow, 2, 10)
+        last = queue.submit(pow, 3, 4)
+        assert blocker.status == JobStatus.RUNNING and waiting.status == JobStatus.PENDING
+        assert queue.cancel(waiting.id)
+        assert not queue.cancel(waiting.id)
+        deadline = clock.time() + 30
+        while last.status != JobStatus.DONE and clock.time() < deadline:
+            clock.sleep(0.05)
+        assert last.result == 81
+        assert waiting.status == JobStatus.CANCELLED and waiting.result is None
+    finally:
+        queue.shutdown()
+
+def _wait_for_cancel(timeout: float, cancel=None) -> bool:
+    """在子进程中等待取消事件（供任务队列测试使用）"""
+    return cancel.wait(timeout)
+
+def _wait_for_status(job, statuses, timeout: float = 30):
+    import time as clock
+    deadline = clock.time() + timeout
+    while job.status not in statuses and clock.time() < deadline:
+        clock.sleep(0.05)
+
+def test_job_queue_signals_running_jobs_and_recovers_broken_pool():
+    """取消运行中的 cancellable 任务时子进程收到取消事件；子进程异常退出后任务记为失败，之后的任务使用新进程池"""
+    import os
+    import time as clock
+    queue = JobQueue(max_workers=1)
+    try:
+        running = queue.submit(_wait_for_cancel, 60, cancellable=True)
+        waiting = queue.submit(pow, 2, 10)
+        assert running.status == JobStatus.RUNNING and running.cancel_event is not None
+        started = clock.time()
+        assert queue.cancel(running.id)
+        _wait_for_status(waiting, (JobStatus.DONE,))
+        # 子进程收到事件后立即返回，排队的任务不必等满 60 秒
+        assert waiting.result == 1024 and clock.time() - started < 30
+        assert running.status == JobStatus.CANCELLED and running.result is None
+
+        crashed = queue.submit(os._exit, 1)
+        _wait_for_status(crashed, (JobStatus.FAILED,))
+        assert crashed.status == JobStatus.FAILED and crashed.error
+        after = queue.submit(pow, 3, 4)
+        _wait_for_status(after, (JobStatus.DONE, JobStatus.FAILED))
+        assert after.status == JobStatus.DONE and after.result == 81
+    finally:
+        queue.shutdown()
+
+def test_result_cache_fingerprint_and_persistence(tmp_path):
+    """相同输入得到相同的键；结果写入磁盘后新的缓存实例仍可命中"""
+    rules = RuleManager().to_dict()
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    key = request_fingerprint(config, classes, teachers, 7, rules)
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    assert request_fingerprint(config, classes, teachers, 7, rules) == key
+    assert request_fingerprint(config, classes, teachers, 8, rules) != key
+    teachers[0].max_hours_per_day -= 1
+    assert request_fingerprint(config, classes, teachers, 7, rules) != key
+
+    import os
+    cache = ResultCache(max_entries=2, directory=str(tmp_path))
+    assert cache.get(key) is None
+    cache.put(key, {"schedule": [1, 2]})
+    cache.put("other", {"schedule": []})
+    # 固定修改时间，避免同一时钟刻度内写入的文件顺序不确定
+    os.utime(tmp_path / f"{key}.json", (1, 1))
+    os.utime(tmp_path / "other.json", (2, 2))
+    cache.clear()
+    assert cache.get(key) == {"schedule": [1, 2]}  # 内存中没有，从磁盘读回并更新修改时间
+    assert cache.stats() == {"hits": 1, "misses": 0, "size": 1}
+    cache.put("third", {"schedule": [3]})
+    # 磁盘同样最多保留 max_entries 个结果，淘汰最久未使用的 "other"
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([f"{key}.json", "third.json"])
+    restarted = ResultCache(directory=str(tmp_path))
+    assert restarted.get(key) == {"schedule": [1, 2]}
+    assert restarted.get("other") is None
+
+    # 规则参数不同的规则集得到不同的键
+    manager = RuleManager()
+    manager.create_default_rules()
+    default_key = request_fingerprint(config, classes, teachers, 7, manager.to_dict())
+    manager.rules[RuleType.SUBJECT][0].max_consecutive = 3
+    assert manager.to_dict()["SUBJECT"][0]["params"] == {"max_consecutive": 3}
+    assert request_fingerprint(config, classes, teachers, 7, manager.to_dict()) != default_key
+
+def test_time_limit_returns_truncated_partial_schedule():
+    """时间预算用尽时引擎返回部分课表并标记 truncated"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    scheduler = SmartScheduler(config, RuleManager(), seed=1, time_limit=0.0)
+    schedule, errors = scheduler.generate_schedule(classes, teachers)
+    assert scheduler.truncated and not schedule.entries and errors
+
+    scheduler = SmartScheduler(config, RuleManager(), seed=1, time_limit=60.0)
+    schedule, _ = scheduler.generate_schedule(classes, teachers)
+    assert not scheduler.truncated and schedule.entries
+
+    service = SchedulerService(config, RuleManager(), engine="csp", time_limit=0.0, seed=1)
+    result = service.create_schedule(classes, teachers)
+    assert result["truncated"] and not result["success"]
+
+def test_columnar_format_roundtrips_records():
+    """列式输出可还原为逐条输出；两种格式都按星期顺序而非名称排序"""
+    classes, teachers, config = create_test_data(selected_classes=[1, 2])
+    schedule, _ = SmartScheduler(config, RuleManager(), seed=1).generate_schedule(classes, teachers)
+    records = format_schedule(schedule.entries, config.slot_grid)
+    columnar = format_schedule(schedule.entries, config.slot_grid, "columnar")
+    cols = columnar["entries"]
+    periods = columnar["periods_per_day"]
+    decoded = [
+        (columnar["classes"][c]["id"], columnar["subjects"][s], columnar["teachers"][t]["id"],
+         columnar["weekdays"][slot // periods], slot % periods + 1)
+        for c, slot, s, t in zip(cols["class"], cols["slot"], cols["subject"], cols["teacher"])
+    ]
+    assert decoded == [(r["class_id"], r["subject"], r["teacher_id"], r["weekday"], r["period"])
+                       for r in records]
+    days = [WeekDay(r["weekday"]) for r in records if r["class_id"] == records[0]["class_id"]]
+    assert days == sorted(days, key=list(WeekDay).index)
+    assert len(dumps({"schedule": columnar})) * 3 < len(dumps({"schedule": records}))
+
+def test_day_planner_terminates_when_blocks_need_room():
+    """连堂块需要两节而当天只剩一节空位时，腾挪必须在做不到时结束（曾经死循环）"""
+    classes, teachers, config = create_test_data(selected_classes=[1])
+    spec = [(7, 3), (4, 3), (6, 2), (5, 1), (1, 1), (3, 1), (1, 1), (6, 3), (7, 2)]
+    classes[0].subjects = [
+        Subject(name=f"科目{i}", weekly_hours=hours, requires_consecutive_periods=True,
+                max_periods_per_day=per_day)
+        for i, (hours, per_day) in enumerate(spec)
+    ]
+    quotas, errors = plan_day_quotas(config, classes)
+    periods = config.slot_grid.periods_per_day
+    for day in range(len(config.slot_grid.weekdays)):
+        assert sum(quotas[(classes[0].id, s.name)][day] for s in classes[0].subjects) <= periods
+    assert sum(sum(days) for days in quotas.values()) == 40 or errors
+
+    import time as clock
+    quotas, errors = plan_day_quotas(config, classes, deadline=clock.monotonic())
+    assert not quotas and errors
+
+    service = SchedulerService(config, RuleManager(), time_limit=1.0, seed=1)
+    result = service.create_schedule(classes, teachers)
+    assert "schedule" in result
+
+def test_period_times_in_output():
+    """输出同时保留 "time"（上下课时间）和 "day_part"；上课时间可反查节次"""
+    classes, teachers, config = create_test_data(selected_classes=[1])
+    timetable = config.timetable
+    assert config.slot_grid.period_times[0] == "08:00-08:40"
+    assert config.slot_grid.period_times[1] == "08:50-09:30"
+    first_afternoon = timetable.periods_per_morning + 1
+    start, end = timetable.get_period_time(first_afternoon)
+    assert (start, end) == (timetable.afternoon_start, time(14, 10))
+    assert timetable.period_at(start) == first_afternoon
+    assert timetable.period_at(time(8, 5)) is None
+
+    schedule, _ = SmartScheduler(config, RuleManager(), seed=1).generate_schedule(classes, teachers)
+    record = format_schedule(schedule.entries, config.slot_grid)[0]
+    assert record["time"] == config.slot_grid.period_times[record["period"] - 1]
+    assert record["day_part"] == timetable.get_day_part(record["period"]).value
+
+def schedule_request(seed: int = 1) -> Dict:
+    """与前端格式相同的排课请求：英文枚举名、字符串时间、附带排课器不用的字段"""
+    subjects = [
+        {"name": "语文", "weekly_hours": 8, "priority": "high", "max_periods_per_day": 2},
+        {"name": "数学", "weekly_hours": 8, "priority": "HIGH", "requires_consecutive_periods": True},
+        {"name": "英语", "weekly_hours": 6, "allowed_day_parts": ["morning", "afternoon"]},
+        {"name": "体育", "weekly_hours": 4, "priority": "low", "max_periods_per_day": 1},
+    ]
+    return {
+        "seed": seed,
+        "schedule_config": {
+            "name": "三年级课表",
+            "weekdays": ["monday", "tuesday", "wednesday", "thursday", "friday"],
+            "allow_split_class": False,
+            "timetable": {"class_duration": 45, "break_duration": 10, "morning_start": "08:00:00",
+                          "afternoon_start": "14:00:00", "evening_start": None,
+                          "periods_per_morning": 4, "periods_per_afternoon": 4}
+        },
+        "classes": [{"id": f"3{i}", "name": f"三年级{i}班", "grade": "3", "subjects": subjects}
+                    for i in (1, 2)],
+        "teachers": [
+            {"id": "T1", "name": "王老师", "subjects": ["语文"]},
+            {"id": "T2", "name": "李老师", "subjects": ["语文", "英语"]},
+            {"id": "T3", "name": "张老师", "subjects": ["数学"]},
+            {"id": "T4", "name": "赵老师", "subjects": ["数学", "体育"]},
+            {"id": "T5", "name": "刘老师", "subjects": ["英语", "体育"],
+             "available_times": [{"weekday": "monday", "start_time": "08:00:00", "end_time": "08:45:00"},
+                                 {"weekday": "星期二", "period": 5}] +
+                                [{"weekday": day, "period": p} for day in ("wednesday", "thursday", "friday")
+                                 for p in range(1, 9)]},
+        ],
+        "classrooms": [{"id": "Room001", "name": "Room 101"}]
+    }
+
+def test_run_schedule_job_parses_and_schedules_json_request():
+    """接口的排课任务：解析 JSON 请求（枚举名、嵌套时间表、多余字段）并通过 SchedulerService 排课"""
+    classes, teachers, config = parse_schedule_request(schedule_request())
+    assert config.grade == Grade.GRADE_3 and config.class_ids == ["31", "32"]
+    assert config.timetable.class_duration == 45
+    assert teachers[4].available_times[0] == config.slot_grid.get(WeekDay.MONDAY, 1)
+    assert teachers[4].available_times[1] == config.slot_grid.get(WeekDay.TUESDAY, 5)
+
+    payload, status = run_schedule_job(schedule_request())
+    assert status == 200, payload
+    assert payload["success"], payload["errors"]
+    assert len(payload["schedule"]) == 2 * 26 and not payload["truncated"]
+    assert payload["schedule"][0]["time"] == "08:00-08:45"
+    for entry in payload["schedule"]:
+        if entry["teacher_id"] == "T5":
+            assert entry["weekday"] not in ("星期一", "星期二") or (entry["weekday"], entry["period"]) in (
+                ("星期一", 1), ("星期二", 5))
+    assert run_schedule_job(schedule_request()) == (payload, 200)
+
+    bad = schedule_request()
+    bad["classes"][0]["subjects"][2]["allowed_day_parts"] = ["morning"]
+    payload, status = run_schedule_job(bad)
+    assert status == 400 and "限定上课时段" in payload["errors"][0]
+    bad = schedule_request()
+    bad["teachers"][4]["available_times"][0]["start_time"] = "08:10"
+    assert run_schedule_job(bad)[1] == 400
+    assert run_schedule_job({**schedule_request(), "format": "xml"})[1] == 400
+    impossible = schedule_request()
+    impossible["teachers"] = [t for t in impossible["teachers"] if t["id"] not in ("T3", "T4")]
+    assert run_schedule_job(impossible)[1] == 422
+
+def test_run_schedule_job_rejects_malformed_request():
+    """请求中类型不对的部分（应为对象处给出列表等）和无效的 time_limit 返回 400，而不是抛出异常"""
+    malformed = [["classes"], {**schedule_request(), "classes": ["31"]},
+                 {**schedule_request(), "teachers": [["T1"]]}, {**schedule_request(), "schedule_config": ["x"]}]
+    bad = schedule_request()
+    bad["classes"][0]["subjects"][0] = "语文"
+    malformed.append(bad)
+    bad = schedule_request()
+    bad["teachers"][4]["available_times"][0] = "monday"
+    malformed.append(bad)
+    for time_limit in (float("nan"), float("inf"), 0, -1, "soon"):
+        malformed.append({**schedule_request(), "time_limit": time_limit})
+    for data in malformed:
+        payload, status = run_schedule_job(data)
+        assert status == 400 and not payload["success"] and payload["errors"], data
+        assert schedule_cache_key(data) is None or "time_limit" in data
+    payload, status = run_schedule_job({**schedule_request(), "time_limit": 5})
+    assert status == 200 and payload["success"]
+
+def test_run_reschedule_job_validates_request():
+    """增量调整接口：无法还原的条目在 errors 中列出，无效的星期/节次返回 400"""
+    schedule = run_schedule_job(schedule_request())[0]["schedule"]
+    leave = next(e for e in schedule if e["teacher_id"] == "T1")
+    request = {**schedule_request(), "schedule": schedule + [{**leave, "class_id": "99"}],
+               "changes": {"blocked": {"T1": [{"weekday": leave["weekday"], "period": leave["period"]}]}}}
+    payload, status = run_reschedule_job(request)
+    assert status == 200
+    assert len(payload["schedule"]) == len(schedule)
+    assert not any(e["teacher_id"] == "T1" and (e["weekday"], e["period"]) == (leave["weekday"], leave["period"])
+                   for e in payload["schedule"])
+    assert any("99" in error and "班级不存在" in error for error in payload["errors"])
+
+    for bad_slot in ({"weekday": "someday", "period": 1}, {"weekday": "monday", "period": 9},
+                     {"weekday": "monday", "period": "1"}, {"period": 1}):
+        entry = {k: v for k, v in leave.items() if k not in ("weekday", "period")}
+        bad = {**schedule_request(), "schedule": schedule[:1] + [{**entry, **bad_slot}]}
+        payload, status = run_reschedule_job(bad)
+        assert status == 400 and "时间段无效" in payload["errors"][0], payload
+        bad = {**schedule_request(), "schedule": schedule, "changes": {"blocked": {"T1": [bad_slot]}}}
+        assert run_reschedule_job(bad)[1] == 400
+
+def test_schedule_job_runs_in_worker_process(tmp_path):
+    """排课任务在子进程中执行 schedule_api.run_schedule_job（子进程不导入 Flask），完成后写入结果缓存"""
+    import time as clock
+    request = schedule_request()
+    key = schedule_cache_key(request)
+    cache = ResultCache(directory=str(tmp_path))
+    queue = JobQueue(max_workers=1)
+    try:
+        job = queue.submit(run_schedule_job, request,
+                           on_done=lambda result: store_schedule_result(cache, key, *result))
+        deadline = clock.time() + 60
+        while job.status not in (JobStatus.DONE, JobStatus.FAILED) and clock.time() < deadline:
+            clock.sleep(0.05)
+        assert job.status == JobStatus.DONE, job.error
+        payload, status = job.result
+        assert status == 200 and payload["success"] and len(payload["schedule"]) == 2 * 26
+        assert cache.get(key) == payload
+    finally:
+        queue.shutdown()
+
+def test_progress_events_and_cancellation():
+    """排课器的进度事件：placed 递增、每个班级一次 class_done；cancel 被 set 后停止并返回部分课表"""
+    import threading
+    classes, teachers, config = create_test_data(selected_classes=[1, 2, 3])
+    events = []
+    scheduler = SmartScheduler(config, RuleManager(), seed=1, progress=lambda e, d: events.append((e, d)))
+    scheduler.PROGRESS_INTERVAL = 0
+    schedule, _ = scheduler.generate_schedule(classes, teachers)
+    progress = [d for e, d in events if e == "progress"]
+    assert len(progress) == len(config.slot_grid) + 1
+    assert [d["placed"] for d in progress] == sorted(d["placed"] for d in progress)
+    assert progress[-1]["placed"] == len(schedule.entries)
+    assert progress[-1]["placed"] + progress[-1]["remaining"] == 40 * len(classes)
+    done = [d for e, d in events if e == "class_done"]
+    assert sorted(d["class_id"] for d in done) == sorted(c.id for c in classes)
+    for d in done:
+        assert d["entries"] == schedule.get_class_schedule(d["class_id"])
+
+    cancel = threading.Event()
+    events = []
+    def stop_after_first_day(event, data):
+        events.append((event, data))
+        if event == "progress" and data["period"] == config.slot_grid.periods_per_day:
+            cancel.set()
+    scheduler = SmartScheduler(config, RuleManager(), seed=1, progress=stop_after_first_day, cancel=cancel)
+    scheduler.PROGRESS_INTERVAL = 0
+    schedule, errors = scheduler.generate_schedule(classes, teachers)
+    assert scheduler.truncated and any("取消" in e for e in errors)
+    assert 0 < len(schedule.entries) <= len(classes) * config.slot_grid.periods_per_day
+    assert [e for e, _ in events][-len(classes):] == ["class_done"] * len(classes)
+
+    # 接口任务：class_done 中的课表已转为逐条输出格式，取消后的结果标记为 truncated
+    events = []
+    cancel = threading.Event()
+    cancel.set()
+    payload, status = run_schedule_job(schedule_request(), progress=lambda e, d: events.append((e, d)),
+                                       cancel=cancel)
+    assert status == 200 and payload["truncated"] and payload["schedule"] == []
+    assert not store_schedule_result(ResultCache(), schedule_cache_key(schedule_request()), payload, status)
+    assert events[0][0] == "progress" and events[0][1]["placed"] == 0
+    assert {d["class_id"] for e, d in events if e == "class_done"} == {"31", "32"}
+    events = []
+    payload, _ = run_schedule_job(schedule_request(), progress=lambda e, d: events.append((e, d)))
+    done = {d["class_id"]: d["schedule"] for e, d in events if e == "class_done"}
+    assert [r for class_id in sorted(done) for r in done[class_id]] == payload["schedule"]
+
 if __name__ == "__main__":
     test_schedule_generation(
         grade="小学三年级",
@@ -125,8 +125,71 @@ document.addEventListener('DOMContentLoaded', function () {
 
     // 创建课表功能
     if (createTimetableForm) {
+        let activeSolve = null;  // 正在进行的排课请求，再次提交表单时中止它
+
+        // 读取 /create_schedule/stream 的 Server-Sent Events，返回最终的 result 事件数据
+        async function streamSchedule(requestData, signal, onEvent) {
+            const response = await fetch(`${apiClient.defaults.baseURL}/create_schedule/stream`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: JSON.stringify(requestData),
+                signal: signal
+            });
+            if (!response.ok || !response.body) {
+                const data = await response.json().catch(() => ({}));
+                return { success: false, errors: data.errors || [`HTTP ${response.status}`] };
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) return null;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    const message = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message';
+                    let data = '';
+                    for (const line of message.split('\n')) {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    }
+                    const payload = data ? JSON.parse(data) : {};
+                    if (event === 'result') return payload;
+                    onEvent(event, payload);
+                }
+            }
+        }
+
+        // 不支持流式读取响应的浏览器改用排课任务接口：提交任务后每秒轮询，停止时取消任务
+        async function pollSchedule(requestData, signal, onEvent) {
+            const submitted = await apiClient.post('/schedule_jobs', requestData);
+            const jobId = submitted.data.job_id;
+            let job = submitted.data;
+            const started = Date.now();
+            while (job.status === 'pending' || job.status === 'running') {
+                if (signal.aborted) {
+                    await apiClient.delete(`/schedule_jobs/${jobId}`).catch(() => null);
+                    throw new DOMException('排课已停止', 'AbortError');
+                }
+                onEvent('waiting', { status: job.status, elapsed: ((Date.now() - started) / 1000).toFixed(1) });
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = (await apiClient.get(`/schedule_jobs/${jobId}`)).data;
+            }
+            if (job.status === 'done') return job.result;
+            return { success: false, errors: [job.error || '任务已取消'] };
+        }
+
+        const supportsStreaming = typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
+
         createTimetableForm.addEventListener('submit', async function (e) {
             e.preventDefault();
+            if (activeSolve) {
+                activeSolve.abort();
+                return;
+            }
 
             const timetableName = document.getElementById('timetable-name').value || "未命名课表";
             const classDaysInput = document.getElementById('上课周期').value;
@@ -169,26 +232,40 @@ document.addEventListener('DOMContentLoaded', function () {
             };
 
             const submitButton = createTimetableForm.querySelector('button[type="submit"]');
-            if (submitButton) {
-                submitButton.disabled = true;
-                submitButton.textContent = '正在生成课表...';
-            }
+            if (submitButton) submitButton.textContent = '停止排课';
+            activeSolve = new AbortController();
 
             try {
-                const response = await apiClient.post('/create_schedule', requestData);
-                if (response.data.success) {
+                // 流式排课：边求解边接收进度和已完成班级的课表，中途可再次点击按钮停止
+                const partialTimetables = {};
+                const solve = supportsStreaming ? streamSchedule : pollSchedule;
+                const result = await solve(requestData, activeSolve.signal, function (event, data) {
+                    if (event === 'waiting' && submitButton) {
+                        submitButton.textContent = `停止排课（${data.status === 'pending' ? '排队中' : '排课中'}，${data.elapsed} 秒）`;
+                    } else if (event === 'progress' && submitButton) {
+                        submitButton.textContent = `停止排课（已排 ${data.placed} 节，剩余 ${data.remaining} 节，${data.elapsed} 秒）`;
+                    } else if (event === 'class_done') {
+                        partialTimetables[data.class_id] = data.schedule;
+                        console.log(`${data.class_name} 课表已完成:`, data.schedule);
+                    }
+                });
+                if (!result) {
+                    alert('课表生成失败：连接意外结束');
+                } else if (result.success) {
                     alert('课表生成成功！');
                 } else {
-                    alert('课表生成失败：' + response.data.errors.join("\n"));
+                    alert('课表生成失败：' + (result.errors || []).join("\n"));
                 }
             } catch (error) {
-                console.error('课表生成请求错误:', error);
-                alert('课表生成失败，请稍后重试。');
-            } finally {
-                if (submitButton) {
-                    submitButton.disabled = false;
-                    submitButton.textContent = '生成课表';
+                if (error.name === 'AbortError') {
+                    console.log('排课已停止');
+                } else {
+                    console.error('课表生成请求错误:', error);
+                    alert('课表生成失败，请稍后重试。');
                 }
+            } finally {
+                activeSolve = null;
+                if (submitButton) submitButton.textContent = '生成课表';
             }
         });
     } else {